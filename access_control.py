@@ -4,11 +4,10 @@
 from functools import wraps
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from database import Database
+from callback_codec import encode
+from services import db
 import config
 
-db = Database()
-
 # Состояния для ConversationHandler
 REQUEST_DEPARTMENT = 1
 
@@ -27,7 +26,7 @@ def require_access(func):
             return await func(update, context, *args, **kwargs)
         
         # Проверяем статус доступа
-        status = db.get_user_access_status(user.id)
+        status = await db.get_user_access_status(user.id)
         
         if status == 'approved':
             # Доступ разрешен
@@ -109,7 +108,7 @@ async def request_access_callback(update: Update, context: ContextTypes.DEFAULT_
     user = update.effective_user
     
     # Добавляем пользователя в БД если его нет
-    db.add_user(
+    await db.add_user(
         user_id=user.id,
         username=user.username or "",
         first_name=user.first_name or "",
@@ -135,7 +134,7 @@ async def receive_department(update: Update, context: ContextTypes.DEFAULT_TYPE)
         department = None
     
     # Отправляем запрос
-    db.request_access(user.id, department)
+    await db.request_access(user.id, department)
     
     # Отправляем уведомление админу
     await notify_admin_about_request(context, user, department)
@@ -172,10 +171,10 @@ ID: <code>{user.id}</code>
     
     keyboard = [
         [
-            InlineKeyboardButton("✅ Одобрить", callback_data=f"approve_user_{user.id}"),
-            InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_user_{user.id}")
+            InlineKeyboardButton("✅ Одобрить", callback_data=encode('approve_user', user.id)),
+            InlineKeyboardButton("❌ Отклонить", callback_data=encode('reject_user', user.id))
         ],
-        [InlineKeyboardButton("👥 Все запросы", callback_data="pending_users")]
+        [InlineKeyboardButton("👥 Все запросы", callback_data=encode('pending_users'))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
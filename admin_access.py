@@ -3,12 +3,11 @@
 """
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import Database
+from callback_codec import encode
+from services import db
 from admin_handlers import admin_only
 import config
 
-db = Database()
-
 
 @admin_only
 async def add_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -34,7 +33,7 @@ async def add_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Если это ID
     if identifier.isdigit():
         user_id = int(identifier)
-        db.approve_user(user_id)
+        await db.approve_user(user_id)
         
         text = f"""
 ✅ <b>Пользователь одобрен!</b>
@@ -95,7 +94,7 @@ async def remove_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     if identifier.isdigit():
         user_id = int(identifier)
-        db.reject_user(user_id)
+        await db.reject_user(user_id)
         
         text = f"""
 ✅ <b>Доступ отозван!</b>
@@ -114,8 +113,8 @@ ID: <code>{user_id}</code>
 async def list_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /list_users - список всех пользователей"""
     
-    users = db.get_all_users_list()
-    pending = db.get_pending_users()
+    users = await db.get_all_users_list()
+    pending = await db.get_pending_users()
     
     text = "👥 <b>ПОЛЬЗОВАТЕЛИ БОТА</b>\n\n"
     
@@ -156,7 +155,7 @@ async def list_users_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
             text += f"... и ещё {len(approved_users) - 10}\n"
     
     keyboard = [
-        [InlineKeyboardButton("⏳ Запросы на одобрение", callback_data="pending_users")]
+        [InlineKeyboardButton("⏳ Запросы на одобрение", callback_data=encode('pending_users'))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -168,7 +167,7 @@ async def pending_users_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    pending = db.get_pending_users()
+    pending = await db.get_pending_users()
     
     if not pending:
         text = "✅ <b>Нет запросов на одобрение</b>\n\nВсе запросы обработаны!"
@@ -193,7 +192,7 @@ async def pending_users_callback(update: Update, context: ContextTypes.DEFAULT_T
     text += "• /remove_user ID - отклонить"
     
     keyboard = [
-        [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]
+        [InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -204,11 +203,11 @@ async def approve_user_callback(update: Update, context: ContextTypes.DEFAULT_TY
     """Одобрить пользователя через кнопку"""
     query = update.callback_query
     
-    # Извлекаем user_id из callback_data: approve_user_123456
-    user_id = int(query.data.split('_')[2])
+    # user_id - поле кнопки (см. callback_codec.ACTIONS)
+    user_id, = context.args
     
     # Одобряем
-    db.approve_user(user_id)
+    await db.approve_user(user_id)
     
     await query.answer("✅ Пользователь одобрен!")
     
@@ -239,11 +238,11 @@ async def reject_user_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     """Отклонить пользователя через кнопку"""
     query = update.callback_query
     
-    # Извлекаем user_id
-    user_id = int(query.data.split('_')[2])
+    # user_id - поле кнопки
+    user_id, = context.args
     
     # Отклоняем
-    db.reject_user(user_id)
+    await db.reject_user(user_id)
     
     await query.answer("❌ Пользователь отклонён")
     
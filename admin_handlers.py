@@ -1,12 +1,18 @@
 """
 Обработчики команд для администратора
 """
+import html
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
-from database import Database
+from broadcast import Broadcaster
+from callback_codec import encode
+from cart import carts
+from order_document import send_order
+from services import db
 import config
+import logging
 
-db = Database()
+logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
 (RESTAURANT_NAME, RESTAURANT_DESC, RESTAURANT_ADDRESS, RESTAURANT_PHONE, RESTAURANT_EMOJI,
@@ -19,7 +25,7 @@ def admin_only(func):
     """Декоратор для проверки прав администратора"""
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
-        if not db.is_admin(user_id):
+        if not await db.is_admin(user_id):
             await update.message.reply_text("❌ Эта команда доступна только администраторам.")
             return ConversationHandler.END
         return await func(update, context)
@@ -32,10 +38,10 @@ def admin_only(func):
 async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /admin - панель администратора"""
     keyboard = [
-        [InlineKeyboardButton("🏪 Рестораны", callback_data="admin_restaurants")],
-        [InlineKeyboardButton("📋 Меню", callback_data="admin_menus")],
-        [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
-        [InlineKeyboardButton("👥 Пользователи", callback_data="admin_users")]
+        [InlineKeyboardButton("🏪 Рестораны", callback_data=encode('admin_restaurants'))],
+        [InlineKeyboardButton("📋 Меню", callback_data=encode('admin_menus'))],
+        [InlineKeyboardButton("📊 Статистика", callback_data=encode('admin_stats'))],
+        [InlineKeyboardButton("👥 Пользователи", callback_data=encode('admin_users'))]
     ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -187,7 +193,7 @@ async def restaurant_manager_phone(update: Update, context: ContextTypes.DEFAULT
         context.user_data['manager_phone'] = None
     
     # Сохраняем ресторан со всеми данными включая менеджера
-    restaurant_id = db.add_restaurant(
+    restaurant_id = await db.add_restaurant(
         name=context.user_data['restaurant_name'],
         description=context.user_data.get('restaurant_desc'),
         address=context.user_data.get('restaurant_address'),
@@ -217,12 +223,17 @@ async def restaurant_manager_phone(update: Update, context: ContextTypes.DEFAULT
 @admin_only
 async def list_restaurants_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /list_restaurants - список всех ресторанов"""
-    restaurants = db.get_all_restaurants(active_only=False)
+    restaurants = await db.get_all_restaurants(active_only=False)
     
     if not restaurants:
         await update.message.reply_text("❌ Рестораны не найдены.")
         return
     
+    await update.message.reply_text(format_restaurants(restaurants), parse_mode='HTML')
+
+
+def format_restaurants(restaurants: list) -> str:
+    """Текст списка ресторанов для /list_restaurants и кнопки панели"""
     text = "🏪 <b>Список ресторанов:</b>\n\n"
     
     for restaurant in restaurants:
@@ -236,7 +247,28 @@ async def list_restaurants_command(update: Update, context: ContextTypes.DEFAULT
             text += f"   📞 {restaurant['phone']}\n"
         text += "\n"
     
-    await update.message.reply_text(text, parse_mode='HTML')
+    return text
+
+
+async def admin_restaurants_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка "Рестораны" панели администратора"""
+    query = update.callback_query
+    
+    if not await db.is_admin(update.effective_user.id):
+        await query.answer("❌ Доступно только администраторам.", show_alert=True)
+        return
+    await query.answer()
+    
+    restaurants = await db.get_all_restaurants(active_only=False)
+    
+    if not restaurants:
+        await query.edit_message_text("❌ Рестораны не найдены.\n\n/add_restaurant - Добавить ресторан")
+        return
+    
+    text = format_restaurants(restaurants)
+    text += "/add_restaurant - Добавить ресторан"
+    
+    await query.edit_message_text(text, parse_mode='HTML')
 
 
 # ========== Управление меню ==========
@@ -244,7 +276,7 @@ async def list_restaurants_command(update: Update, context: ContextTypes.DEFAULT
 @admin_only
 async def add_menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /add_menu - начать добавление блюда в меню"""
-    restaurants = db.get_all_restaurants()
+    restaurants = await db.get_all_restaurants()
     
     if not restaurants:
         await update.message.reply_text(
@@ -273,6 +305,36 @@ async def add_menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return MENU_RESTAURANT
 
 
+async def admin_menus_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка "Меню" панели администратора: блюда ресторанов по категориям"""
+    query = update.callback_query
+    
+    if not await db.is_admin(update.effective_user.id):
+        await query.answer("❌ Доступно только администраторам.", show_alert=True)
+        return
+    await query.answer()
+    
+    restaurants = await db.get_all_restaurants()
+    
+    if not restaurants:
+        await query.edit_message_text("❌ Сначала добавьте хотя бы один ресторан: /add_restaurant")
+        return
+    
+    text = "📋 <b>Меню ресторанов</b>\n\n"
+    
+    for restaurant in restaurants:
+        menu = await db.get_menu_by_category(restaurant['id'])
+        total = sum(len(items) for items in menu.values())
+        text += f"<b>{html.escape(restaurant['name'])}</b> - блюд: {total}\n"
+        for category, items in menu.items():
+            text += f"   • {html.escape(category)}: {len(items)}\n"
+        text += "\n"
+    
+    text += "/add_menu - Добавить блюдо в меню"
+    
+    await query.edit_message_text(text, parse_mode='HTML')
+
+
 async def menu_restaurant_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Ресторан выбран"""
     query = update.callback_query
@@ -281,7 +343,7 @@ async def menu_restaurant_selected(update: Update, context: ContextTypes.DEFAULT
     restaurant_id = int(query.data.split('_')[1])
     context.user_data['menu_restaurant_id'] = restaurant_id
     
-    restaurant = db.get_restaurant(restaurant_id)
+    restaurant = await db.get_restaurant(restaurant_id)
     
     await query.edit_message_text(
         f"✅ Выбран ресторан: <b>{restaurant['name']}</b>\n\n"
@@ -344,7 +406,7 @@ async def menu_item_category(update: Update, context: ContextTypes.DEFAULT_TYPE)
         context.user_data['menu_item_category'] = None
     
     # Сохраняем блюдо
-    item_id = db.add_menu_item(
+    item_id = await db.add_menu_item(
         restaurant_id=context.user_data['menu_restaurant_id'],
         name=context.user_data['menu_item_name'],
         price=context.user_data['menu_item_price'],
@@ -382,8 +444,8 @@ async def admin_stats_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.answer()
     
     # Получаем статистику
-    restaurants = db.get_all_restaurants()
-    users = db.get_all_users()
+    restaurants = await db.get_all_restaurants()
+    users = await db.get_all_users()
     
     stats_text = "📊 <b>Статистика</b>\n\n"
     stats_text += f"🏪 Всего ресторанов: {len(restaurants)}\n"
@@ -399,7 +461,7 @@ async def admin_users_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    users = db.get_all_users()
+    users = await db.get_all_users()
     
     if not users:
         await query.edit_message_text("❌ Пользователи не найдены.")
@@ -423,6 +485,82 @@ async def admin_users_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     await query.edit_message_text(users_text, parse_mode='HTML')
 
 
+DB_STATS_ORDER = ('total', 'count', 'avg', 'max')
+
+
+@admin_only
+async def db_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Команда /db_stats [N] [total|count|avg|max] - самые дорогие SQL-запросы
+    
+    /db_stats reset - обнулить статистику
+    /db_stats explain N [total|count|avg|max] - план N-го запроса из списка
+    """
+    args = context.args or []
+    if args and args[0] == 'reset':
+        await db.reset_query_stats()
+        await update.message.reply_text("🗄 Статистика SQL-запросов обнулена.")
+        return
+    
+    limit = next((int(arg) for arg in args if arg.isdigit()), 10)
+    order_by = next((arg for arg in args if arg in DB_STATS_ORDER), 'total')
+    if args and args[0] == 'explain':
+        await explain_query_stats(update, limit, order_by)
+        return
+    queries = await db.get_query_stats(min(limit, 30), order_by)
+    pool = await db.get_pool_stats()
+    caches = await db.get_cache_stats()
+    cart_stats = carts.get_stats()
+    
+    footer = (
+        f"\n<b>Пул соединений:</b> выдано {pool['checkouts']}, "
+        f"ожиданий {pool['waits']}, макс. ожидание {pool['max_wait_time'] * 1000:.1f} мс\n"
+        f"<b>Кэши (попадания):</b> "
+        + ", ".join(f"{name} {stats['hit_rate']:.0%}" for name, stats in caches.items())
+        + f"\n<b>Корзины:</b> изменений {cart_stats['changes']}, записей в БД {cart_stats['flushes']}, "
+        f"не сохранено {cart_stats['pending']}"
+    )
+    
+    text = f"🗄 <b>Статистика БД</b> (сортировка: {order_by})\n\n"
+    if not queries:
+        text += "Запросов пока не было (или QUERY_PROFILER выключен).\n"
+    for number, query in enumerate(queries, 1):
+        slow = f", медленных {query['slow']}" if query['slow'] else ""
+        entry = (
+            f"{number}. <code>{html.escape(query['sql'][:200])}</code>\n"
+            f"   {query['count']} раз, всего {query['total'] * 1000:.0f} мс, "
+            f"в среднем {query['avg'] * 1000:.2f} мс, макс {query['max'] * 1000:.1f} мс{slow}\n"
+        )
+        # Сообщение Telegram - не больше 4096 символов, теги не разрываем
+        if len(text) + len(entry) + len(footer) > 4096:
+            break
+        text += entry
+    
+    await update.message.reply_text(text + footer, parse_mode='HTML')
+
+
+async def explain_query_stats(update: Update, number: int, order_by: str):
+    """План N-го запроса из /db_stats (по самому долгому выполнению)"""
+    queries = await db.get_query_stats(number, order_by)
+    if number < 1 or len(queries) < number:
+        await update.message.reply_text(f"❌ Запроса №{number} нет в статистике (сортировка: {order_by}).")
+        return
+    query = queries[number - 1]
+    sql, params = query['example']
+    plan = await db.explain_query(sql, params)
+    if not plan:
+        text = "План недоступен: EXPLAIN строится для SELECT, UPDATE и DELETE."
+    else:
+        # Обрезаем до экранирования, чтобы не разорвать &amp; и т.п.
+        plan_text = '\n'.join(plan)[:3000]
+        text = f"<pre>{html.escape(plan_text)}</pre>"
+    await update.message.reply_text(
+        f"🗄 <b>План запроса №{number}</b> (сортировка: {order_by})\n\n"
+        f"<code>{html.escape(query['sql'][:500])}</code>\n\n{text}",
+        parse_mode='HTML'
+    )
+
+
 # ========== Отмена ==========
 
 async def cancel_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -437,7 +575,7 @@ async def cancel_admin(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @admin_only
 async def set_manager_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /set_manager - установить менеджера для ресторана"""
-    restaurants = db.get_all_restaurants()
+    restaurants = await db.get_all_restaurants()
     
     if not restaurants:
         await update.message.reply_text("❌ Нет доступных ресторанов. Сначала добавьте ресторан командой /add_restaurant")
@@ -477,7 +615,7 @@ async def set_manager_restaurant_callback(update: Update, context: ContextTypes.
     restaurant_id = int(query.data.split('_')[1])
     context.user_data['set_manager_restaurant_id'] = restaurant_id
     
-    restaurant = db.get_restaurant(restaurant_id)
+    restaurant = await db.get_restaurant(restaurant_id)
     emoji = restaurant.get('emoji', '🍽️')
     
     # Показываем текущего менеджера если есть
@@ -530,9 +668,9 @@ async def set_manager_phone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     manager_id = context.user_data['set_manager_id']
     
     # Обновляем менеджера ресторана
-    db.set_restaurant_manager(restaurant_id, manager_id, manager_phone)
+    await db.set_restaurant_manager(restaurant_id, manager_id, manager_phone)
     
-    restaurant = db.get_restaurant(restaurant_id)
+    restaurant = await db.get_restaurant(restaurant_id)
     emoji = restaurant.get('emoji', '🍽️')
     
     success_text = f"✅ Менеджер для {emoji} <b>{restaurant['name']}</b> установлен!\n\n"
@@ -560,7 +698,7 @@ async def cancel_set_manager(update: Update, context: ContextTypes.DEFAULT_TYPE)
 @admin_only
 async def send_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /send_order - отправить заказ менеджеру ресторана"""
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         await update.message.reply_text("❌ Активного голосования нет.")
@@ -569,69 +707,29 @@ async def send_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     poll_id = poll['id']
     
     # Получаем победителя голосования
-    votes = db.get_poll_votes(poll_id)
+    votes = await db.get_poll_votes(poll_id)
     if not votes or all(v[2] == 0 for v in votes):
         await update.message.reply_text("❌ Голосование еще не проведено.")
         return
     
     winner_id = votes[0][0]
-    restaurant = db.get_restaurant(winner_id)
+    restaurant = await db.get_restaurant(winner_id)
     
     if not restaurant:
         await update.message.reply_text("❌ Ресторан-победитель не найден.")
         return
     
-    # Получаем все заказы
-    all_orders = db.get_all_orders(poll_id)
-    
-    if not all_orders:
-        await update.message.reply_text("❌ Никто еще не сделал заказ.")
-        return
-    
-    # Фильтруем только заказы из ресторана-победителя
-    restaurant_orders = [o for o in all_orders if o['restaurant_name'] == restaurant['name']]
+    # Заказы в ресторан-победитель: по блюдам, по участникам и итог
+    # (с изменениями корзин, ещё не записанными в БД)
+    await carts.flush(poll_id)
+    aggregate = await db.get_order_aggregate(poll_id, winner_id)
     
-    if not restaurant_orders:
+    if not aggregate['users']:
         await update.message.reply_text(f"❌ Нет заказов для ресторана {restaurant['name']}.")
         return
     
-    # Формируем сводку заказов
-    order_summary = db.get_order_summary(poll_id)
-    
-    rest_emoji = restaurant.get('emoji', '🍽️')
-    order_text = f"📦 <b>ЗАКАЗ для {rest_emoji} {restaurant['name']}</b>\n\n"
-    order_text += f"📅 Дата: {poll['date']}\n"
-    order_text += f"👥 Участников: {len(set([o['user_id'] for o in restaurant_orders]))}\n\n"
-    
-    order_text += "<b>━━━ СВОДКА ЗАКАЗА ━━━</b>\n\n"
-    
-    total_sum = 0
-    for item in order_summary:
-        if any(o['menu_item_id'] == item['menu_item_id'] for o in restaurant_orders):
-            total = item['price'] * item['total_quantity']
-            total_sum += total
-            order_text += f"<b>{item['name']}</b> x{item['total_quantity']} = {int(total)}֏\n"
-    
-    order_text += f"\n💰 <b>ИТОГО: {int(total_sum)}֏</b>\n\n"
-    
-    order_text += "<b>━━━ ПО УЧАСТНИКАМ ━━━</b>\n\n"
-    
-    # Группируем по пользователям
-    users_orders = {}
-    for order in restaurant_orders:
-        user_name = order['first_name']
-        if user_name not in users_orders:
-            users_orders[user_name] = []
-        users_orders[user_name].append(order)
-    
-    for user_name, orders in users_orders.items():
-        order_text += f"👤 <b>{user_name}:</b>\n"
-        user_total = 0
-        for order in orders:
-            price = order['price'] * order['quantity']
-            user_total += price
-            order_text += f"  • {order['dish_name']} x{order['quantity']} — {int(price)}֏\n"
-        order_text += f"  💵 Сумма: {int(user_total)}֏\n\n"
+    # Заказ уходит потоком сообщений не длиннее лимита Telegram (order_document.py)
+    chat_id = update.effective_chat.id
     
     # Отправка менеджеру через Telegram (если есть manager_telegram_id)
     manager_id = restaurant.get('manager_telegram_id')
@@ -640,17 +738,12 @@ async def send_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if manager_id:
         try:
             keyboard = [[
-                InlineKeyboardButton("✅ Подтвердить заказ", callback_data=f"confirm_order_{poll_id}"),
-                InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_order_{poll_id}")
+                InlineKeyboardButton("✅ Подтвердить заказ", callback_data=encode('confirm_order', poll_id)),
+                InlineKeyboardButton("❌ Отклонить", callback_data=encode('reject_order', poll_id))
             ]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await context.bot.send_message(
-                chat_id=manager_id,
-                text=order_text,
-                parse_mode='HTML',
-                reply_markup=reply_markup
-            )
+            await send_order(context.bot, manager_id, restaurant, poll, aggregate, reply_markup=reply_markup)
             
             await update.message.reply_text(
                 f"✅ Заказ отправлен менеджеру {restaurant['name']} в Telegram!\n\n"
@@ -663,11 +756,13 @@ async def send_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 f"📱 Свяжитесь с менеджером по телефону: {manager_phone or 'не указан'}"
             )
     elif manager_phone:
-        await update.message.reply_text(
-            f"📱 Менеджер не добавлен в бота.\n\n"
-            f"Позвоните по телефону: <b>{manager_phone}</b>\n\n"
-            f"Отправьте ему следующий заказ:\n\n{order_text}",
-            parse_mode='HTML'
+        await send_order(
+            context.bot, chat_id, restaurant, poll, aggregate,
+            intro=(
+                f"📱 Менеджер не добавлен в бота.\n\n"
+                f"Позвоните по телефону: <b>{manager_phone}</b>\n\n"
+                f"Отправьте ему следующий заказ:\n\n"
+            )
         )
     else:
         await update.message.reply_text(
@@ -676,7 +771,7 @@ async def send_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
     
     # Отправляем админу копию заказа
-    await update.message.reply_text(f"📋 Копия заказа:\n\n{order_text}", parse_mode='HTML')
+    await send_order(context.bot, chat_id, restaurant, poll, aggregate, intro="📋 Копия заказа:\n\n")
 
 
 # ========== Подтверждение заказа менеджером ==========
@@ -686,17 +781,17 @@ async def confirm_order_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer("✅ Заказ подтверждён!")
     
-    poll_id = int(query.data.split('_')[2])
+    poll_id, = context.args
     
     # Уведомляем участников
-    participants = db.get_participants(poll_id)
-    poll = db.get_poll_by_id(poll_id)
+    participants = await db.get_participants(poll_id)
+    poll = await db.get_poll_by_id(poll_id)
     
     if poll:
-        votes = db.get_poll_votes(poll_id)
+        votes = await db.get_poll_votes(poll_id)
         if votes:
             winner_id = votes[0][0]
-            restaurant = db.get_restaurant(winner_id)
+            restaurant = await db.get_restaurant(winner_id)
             rest_emoji = restaurant.get('emoji', '🍽️')
             
             notification = (
@@ -705,15 +800,11 @@ async def confirm_order_callback(update: Update, context: ContextTypes.DEFAULT_T
                 f"Ожидайте доставку! 🚚"
             )
             
-            for participant in participants:
-                try:
-                    await context.bot.send_message(
-                        chat_id=participant['user_id'],
-                        text=notification,
-                        parse_mode='HTML'
-                    )
-                except Exception:
-                    pass
+            report = await Broadcaster(context.bot).broadcast(
+                (participant['user_id'] for participant in participants), notification,
+                name='order_confirmed', parse_mode='HTML'
+            )
+            logger.info(report.summary())
     
     await query.edit_message_text(
         f"{query.message.text}\n\n✅ <b>ЗАКАЗ ПОДТВЕРЖДЁН</b>",
@@ -726,7 +817,7 @@ async def reject_order_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer("❌ Заказ отклонён")
     
-    poll_id = int(query.data.split('_')[2])
+    poll_id, = context.args
     
     # Уведомляем администратора
     try:
@@ -0,0 +1,73 @@
+"""
+Асинхронный доступ к базе данных
+
+Методы Database синхронные. Чтобы медленный запрос не блокировал event loop
+(и вместе с ним обработку остальных апдейтов), AsyncDatabase выполняет их
+в отдельном пуле потоков. Число одновременно ожидающих вызовов ограничено:
+при переполнении очереди вызывающий ждёт свободного места (backpressure).
+Чтения из Database.cached_reads при попадании в кэш отвечают сразу.
+
+Использование в обработчиках:
+    poll = await db.get_active_poll()
+"""
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+import config
+import metrics
+from caches import MISS
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Асинхронный фасад над Database"""
+
+    def __init__(self, database, max_workers: int = None, max_pending: int = config.DB_EXECUTOR_QUEUE):
+        self.sync = database
+        # Один поток на соединение пула: больше потоков всё равно ждали бы соединение
+        self.max_workers = max_workers or database.pool.size
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='db')
+        self._slots = asyncio.Semaphore(max_pending)
+        self._methods = {}
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнить синхронную функцию в пуле потоков БД"""
+        started = time.perf_counter()
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        finally:
+            # Время с ожиданием места в очереди - столько ждёт обработчик
+            metrics.record_db_call(getattr(func, '__name__', 'call'), time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        method = self._methods.get(name)
+        if method is None:
+            peek = getattr(self.sync, 'cached_reads', {}).get(name)
+            if peek is None:
+                @functools.wraps(attr)
+                async def method(*args, **kwargs):
+                    return await self.run(attr, *args, **kwargs)
+            else:
+                # Ответ из кэша отдаём сразу, не занимая поток и соединение
+                @functools.wraps(attr)
+                async def method(*args, **kwargs):
+                    result = peek(*args, **kwargs)
+                    if result is MISS:
+                        result = await self.run(attr, *args, **kwargs)
+                    return result
+            self._methods[name] = method
+        return method
+
+    def close(self):
+        """Дождаться завершения запросов и закрыть соединения"""
+        self._executor.shutdown(wait=True)
+        self.sync.close()
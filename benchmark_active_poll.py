@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк получения активного голосования
+
+Сравнивает прежний путь (запрос к polls на каждый вызов) с кэшем
+ActivePollRegistry - синхронно и через AsyncDatabase, как в обработчиках.
+База заполняется историей голосований (см. benchmark_indexes.py).
+
+Запуск:
+    python benchmark_active_poll.py [--days 365] [--repeat 20000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from async_db import AsyncDatabase
+from benchmark_indexes import seed
+from caches import local_today
+from database import Database
+
+ACTIVE_POLL_SQL = (
+    "SELECT * FROM polls WHERE date = ? AND status = 'active' ORDER BY created_at DESC LIMIT 1"
+)
+
+
+def query_active_poll(db: Database):
+    """Прежняя реализация get_active_poll: запрос на каждый вызов"""
+    conn = db.get_connection()
+    try:
+        result = conn.execute(ACTIVE_POLL_SQL, (local_today(),)).fetchone()
+        return dict(result) if result else None
+    finally:
+        conn.close()
+
+
+def measure(func, repeat: int) -> float:
+    """Среднее время вызова в микросекундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1_000_000
+
+
+async def measure_async(make_call, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await make_call()
+    return (time.perf_counter() - started) / repeat * 1_000_000
+
+
+async def run_async(adb: AsyncDatabase, repeat: int) -> dict:
+    return {
+        'запрос через пул потоков': await measure_async(lambda: adb.run(query_active_poll, adb.sync), repeat),
+        'кэш через AsyncDatabase': await measure_async(adb.get_active_poll, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--users', type=int, default=60)
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    db = Database(path)
+    seed(db, args.days, args.users, restaurants=8, dishes=40)
+
+    poll = db.get_active_poll()
+    assert poll is not None and poll == query_active_poll(db), "кэш и запрос вернули разные голосования"
+    print(f"Голосований в базе: {args.days + 1}, активное: id={poll['id']} ({poll['date']})")
+    print()
+
+    results = {
+        'запрос (как раньше)': measure(lambda: query_active_poll(db), args.repeat),
+        'кэш, синхронно': measure(db.get_active_poll, args.repeat),
+    }
+    adb = AsyncDatabase(db)
+    results.update(asyncio.run(run_async(adb, args.repeat)))
+
+    baseline = results['запрос (как раньше)']
+    print(f"{'Способ':<28}{'мкс/вызов':>12}{'ускорение':>12}")
+    for name, latency in results.items():
+        print(f"{name:<28}{latency:>12.2f}{baseline / latency:>11.1f}x")
+    print()
+    print(f"Статистика кэша: {db.get_cache_stats()['active_poll']}")
+
+    adb.close()
+
+
+if __name__ == '__main__':
+    main()
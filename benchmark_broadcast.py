@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк рассылки
+
+Сравнивает прежнюю рассылку (send_message по очереди в цикле) с Broadcaster
+на имитации Telegram: FakeBot отвечает с задержкой сети, как Telegram
+отвечает RetryAfter при превышении ~30 сообщений в секунду, иногда
+TimedOut (половина - при подключении, половина - уже после доставки, когда
+не дождались ответа), а часть пользователей заблокировала бота (Forbidden).
+
+Запуск:
+    python benchmark_broadcast.py [--users 150] [--latency 0.1] [--timeouts 0.02]
+"""
+import argparse
+import asyncio
+import collections
+import logging
+import random
+import time
+
+import httpx
+from telegram.error import Forbidden, RetryAfter, TimedOut
+
+from broadcast import Broadcaster, TokenBucket
+import config
+
+
+class FakeBot:
+    """Имитация Bot.send_message с лимитами Telegram"""
+
+    def __init__(self, latency: float, timeout_rate: float, blocked: set, limit: int = 30):
+        self.latency = latency
+        self.timeout_rate = timeout_rate
+        self.blocked = blocked
+        self.limit = limit
+        self.window = collections.deque()
+        self.delivered = collections.Counter()
+        self.rate_limited = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+        now = time.monotonic()
+        while self.window and now - self.window[0] > 1.0:
+            self.window.popleft()
+        if len(self.window) >= self.limit:
+            self.rate_limited += 1
+            raise RetryAfter(1)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if random.random() < self.timeout_rate:
+            if random.random() < 0.5:
+                raise TimedOut() from httpx.ConnectTimeout('connect')
+            # Сообщение дошло, но ответа не дождались
+            self.window.append(now)
+            self.delivered[chat_id] += 1
+            raise TimedOut() from httpx.ReadTimeout('read')
+        self.window.append(now)
+        self.delivered[chat_id] += 1
+
+
+async def sequential(bot: FakeBot, users: list, text: str) -> dict:
+    """Прежний способ: по одному сообщению, ошибки только логируются"""
+    started = time.monotonic()
+    failed = 0
+    for user_id in users:
+        try:
+            await bot.send_message(chat_id=user_id, text=text, parse_mode='HTML')
+        except Exception:
+            failed += 1
+    return {'elapsed': time.monotonic() - started, 'failed': failed}
+
+
+async def concurrent(bot: FakeBot, users: list, text: str, rate: float, concurrency: int):
+    broadcaster = Broadcaster(bot, limiter=TokenBucket(rate), concurrency=concurrency, base_delay=0.2)
+    return await broadcaster.broadcast(users, text, name='benchmark', parse_mode='HTML')
+
+
+def make_bot(args, blocked) -> FakeBot:
+    return FakeBot(args.latency, args.timeouts, blocked)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=150)
+    parser.add_argument('--latency', type=float, default=0.1, help='задержка ответа Telegram, сек')
+    parser.add_argument('--timeouts', type=float, default=0.02, help='доля запросов с TimedOut')
+    parser.add_argument('--blocked', type=float, default=0.05, help='доля заблокировавших бота')
+    parser.add_argument('--rate', type=float, default=config.BROADCAST_RATE)
+    parser.add_argument('--concurrency', type=int, default=config.BROADCAST_CONCURRENCY)
+    args = parser.parse_args()
+
+    # Предупреждения о RetryAfter видны в итоговом отчёте
+    logging.getLogger('broadcast').setLevel(logging.ERROR)
+    random.seed(42)
+    users = list(range(1, args.users + 1))
+    blocked = set(random.sample(users, int(len(users) * args.blocked)))
+    text = "🔔 <b>Время обеда!</b>"
+    reachable = len(users) - len(blocked)
+
+    bot = make_bot(args, blocked)
+    old = asyncio.run(sequential(bot, users, text))
+    old_sent = sum(bot.delivered.values())
+
+    bot = make_bot(args, blocked)
+    report = asyncio.run(concurrent(bot, users, text, args.rate, args.concurrency))
+    new = report.as_dict()
+    new_sent = sum(bot.delivered.values())
+    # Доставленные без ответа попадают в отчёт как uncertain
+    assert new['sent'] <= new_sent <= new['sent'] + new['uncertain'], \
+        "отчёт расходится с доставленным"
+    assert max(bot.delivered.values()) == 1, "кому-то сообщение доставлено дважды"
+
+    print(f"Получателей: {len(users)}, доступных: {reachable}, задержка {args.latency * 1000:.0f} мс")
+    print()
+    print(f"{'Способ':<22}{'доставлено':>12}{'потеряно':>10}{'сек':>8}{'сообщ./с':>10}")
+    print(f"{'по очереди':<22}{old_sent:>12}{reachable - old_sent:>10}{old['elapsed']:>8.1f}"
+          f"{old_sent / old['elapsed']:>10.1f}")
+    print(f"{'Broadcaster':<22}{new_sent:>12}{reachable - new_sent:>10}{new['elapsed']:>8.1f}"
+          f"{new['per_second']:>10.1f}")
+    print()
+    print(report.summary())
+    print(f"RetryAfter от имитации Telegram: {bot.rate_limited}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк корзины: запись на каждое нажатие против CartStore
+
+Прежний add_item_callback на каждое нажатие выполнял INSERT OR REPLACE
+с quantity=1 - отдельную транзакцию, а повторное нажатие не увеличивало
+количество. CartStore меняет количество в памяти (с журналом) и пишет
+накопившиеся изменения одной транзакцией.
+
+Запуск:
+    python benchmark_cart.py [--users 50] [--taps 10] [--dishes 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from async_db import AsyncDatabase
+from cart import CartStore
+from database import Database
+
+
+def seed(db: Database, dishes: int, users: int) -> tuple:
+    """Ресторан с меню и голосование на сегодня"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO restaurants (name) VALUES (?)", ("Ресторан",))
+    restaurant_id = cursor.lastrowid
+    cursor.executemany(
+        "INSERT INTO menu_items (restaurant_id, name, price) VALUES (?, ?, ?)",
+        [(restaurant_id, f"Блюдо {d}", 1000 + d) for d in range(dishes)]
+    )
+    item_ids = [row['id'] for row in cursor.execute("SELECT id FROM menu_items").fetchall()]
+    cursor.executemany(
+        "INSERT INTO users (user_id, username, first_name, access_status) VALUES (?, ?, ?, 'approved')",
+        [(uid, f"user{uid}", f"Имя{uid}") for uid in range(1000, 1000 + users)]
+    )
+    cursor.execute("INSERT INTO polls (date, created_by) VALUES (date('now'), 1000)")
+    poll_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return poll_id, item_ids
+
+
+def writes(db: Database) -> int:
+    """Число выполненных записей в user_orders (по профилировщику)"""
+    return sum(query['count'] for query in db.get_query_stats(100)
+               if 'user_orders' in query['sql'] and not query['sql'].startswith('SELECT'))
+
+
+async def run(args):
+    random.seed(42)
+    workdir = tempfile.mkdtemp()
+    database = Database(os.path.join(workdir, 'benchmark.db'))
+    db = AsyncDatabase(database)
+    poll_id, item_ids = seed(database, args.dishes, args.users)
+    taps = [(1000 + u, random.choice(item_ids)) for u in range(args.users) for _ in range(args.taps)]
+    random.shuffle(taps)
+    expected = {}
+    for user_id, item_id in taps:
+        expected[(user_id, item_id)] = expected.get((user_id, item_id), 0) + 1
+
+    # Прежний путь: одна транзакция на нажатие
+    database.reset_query_stats()
+    started = time.perf_counter()
+    await asyncio.gather(*(db.add_order(poll_id, user_id, item_id, quantity=1) for user_id, item_id in taps))
+    old_time = time.perf_counter() - started
+    old_writes = writes(database)
+    old_rows = await db.get_all_orders(poll_id)
+    old_correct = sum(1 for row in old_rows if row['quantity'] == expected[(row['user_id'], row['menu_item_id'])])
+    for user_id in range(1000, 1000 + args.users):
+        await db.clear_user_orders(poll_id, user_id)
+
+    # CartStore: нажатия в памяти и журнале, одна запись в конце
+    store = CartStore(db, os.path.join(workdir, 'cart_journal.jsonl'), delay=3600, max_delay=3600)
+    await store.start()
+    database.reset_query_stats()
+    started = time.perf_counter()
+    await asyncio.gather(*(store.increment(poll_id, user_id, item_id) for user_id, item_id in taps))
+    await store.flush()
+    new_time = time.perf_counter() - started
+    new_writes = writes(database)
+    new_rows = await db.get_all_orders(poll_id)
+    new_correct = sum(1 for row in new_rows if row['quantity'] == expected[(row['user_id'], row['menu_item_id'])])
+    await store.close()
+    db.close()
+
+    print(f"Нажатий: {len(taps)}, пользователей: {args.users}, позиций в корзинах: {len(expected)}")
+    print()
+    print(f"{'Способ':<22}{'время, мс':>11}{'записей SQL':>13}{'верных позиций':>16}")
+    print(f"{'add_order на нажатие':<22}{old_time * 1000:>11.1f}{old_writes:>13}{old_correct:>10}/{len(expected)}")
+    print(f"{'CartStore':<22}{new_time * 1000:>11.1f}{new_writes:>13}{new_correct:>10}/{len(expected)}")
+    print()
+    print(f"Транзакций записи: {len(taps)} -> {store.flushes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--taps', type=int, default=10)
+    parser.add_argument('--dishes', type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк индексов БД
+
+Создаёт временную SQLite базу с историей голосований за год, затем для
+каждого частого запроса показывает план (EXPLAIN QUERY PLAN) и среднее
+время выполнения без вторичных индексов и с ними.
+
+Запуск:
+    python benchmark_indexes.py [--days 365] [--users 60] [--repeat 300]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import Database
+from migrations import INDEXES
+
+# Запросы в том виде, в каком их выполняет Database
+HOT_QUERIES = {
+    'get_active_poll': (
+        "SELECT * FROM polls WHERE date = ? AND status = 'active' ORDER BY created_at DESC LIMIT 1",
+        lambda ctx: (ctx['today'],)
+    ),
+    'get_restaurant_menu': (
+        "SELECT * FROM menu_items WHERE restaurant_id = ? AND is_available = 1 ORDER BY category, name",
+        lambda ctx: (random.choice(ctx['restaurant_ids']),)
+    ),
+    'get_participants': (
+        "SELECT u.* FROM users u JOIN lunch_participants lp ON u.user_id = lp.user_id "
+        "WHERE lp.poll_id = ? ORDER BY u.first_name",
+        lambda ctx: (ctx['active_poll_id'],)
+    ),
+    'get_poll_votes': (
+        "SELECT r.id, r.name, COUNT(v.id) as votes FROM restaurants r "
+        "LEFT JOIN votes v ON r.id = v.restaurant_id AND v.poll_id = ? "
+        "WHERE r.is_active = 1 GROUP BY r.id, r.name ORDER BY votes DESC, r.name",
+        lambda ctx: (ctx['active_poll_id'],)
+    ),
+    'get_all_orders': (
+        "SELECT uo.*, u.first_name, mi.name as dish_name, mi.price, r.name as restaurant_name "
+        "FROM user_orders uo JOIN users u ON uo.user_id = u.user_id "
+        "JOIN menu_items mi ON uo.menu_item_id = mi.id JOIN restaurants r ON mi.restaurant_id = r.id "
+        "WHERE uo.poll_id = ? ORDER BY u.first_name, mi.category, mi.name",
+        lambda ctx: (ctx['active_poll_id'],)
+    ),
+}
+
+CATEGORIES = ["Холодные закуски", "Салаты", "Супы", "Шашлыки", "Горячие блюда", "Гарниры", "Десерты", "Напитки"]
+
+
+def seed(db: Database, days: int, users: int, restaurants: int, dishes: int) -> dict:
+    """Заполнить базу историей голосований за days дней"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+
+    user_ids = list(range(1000, 1000 + users))
+    cursor.executemany(
+        "INSERT INTO users (user_id, username, first_name, access_status) VALUES (?, ?, ?, 'approved')",
+        [(uid, f"user{uid}", f"Имя{uid}") for uid in user_ids]
+    )
+
+    restaurant_ids = []
+    menu = {}
+    for r in range(restaurants):
+        cursor.execute("INSERT INTO restaurants (name) VALUES (?)", (f"Ресторан {r}",))
+        rid = cursor.lastrowid
+        restaurant_ids.append(rid)
+        rows = [(rid, f"Блюдо {r}-{d}", 500 + d * 10, CATEGORIES[d % len(CATEGORIES)]) for d in range(dishes)]
+        cursor.executemany(
+            "INSERT INTO menu_items (restaurant_id, name, price, category) VALUES (?, ?, ?, ?)", rows
+        )
+    for row in cursor.execute("SELECT id, restaurant_id FROM menu_items").fetchall():
+        menu.setdefault(row['restaurant_id'], []).append(row['id'])
+
+    today = date.today()
+    poll_id = None
+    for offset in range(days, -1, -1):
+        day = (today - timedelta(days=offset)).isoformat()
+        status = 'active' if offset == 0 else 'closed'
+        cursor.execute(
+            "INSERT INTO polls (created_by, date, status) VALUES (?, ?, ?)", (user_ids[0], day, status)
+        )
+        poll_id = cursor.lastrowid
+        voters = random.sample(user_ids, k=int(users * 0.8))
+        votes = [(poll_id, uid, random.choice(restaurant_ids)) for uid in voters]
+        cursor.executemany("INSERT INTO votes (poll_id, user_id, restaurant_id) VALUES (?, ?, ?)", votes)
+        cursor.executemany(
+            "INSERT INTO lunch_participants (poll_id, user_id) VALUES (?, ?)", [(poll_id, uid) for uid in voters]
+        )
+        winner_menu = menu[random.choice(restaurant_ids)]
+        orders = {(poll_id, uid, item) for uid in voters for item in random.sample(winner_menu, k=2)}
+        cursor.executemany(
+            "INSERT INTO user_orders (poll_id, user_id, menu_item_id) VALUES (?, ?, ?)", list(orders)
+        )
+
+    conn.commit()
+    conn.close()
+    return {'today': today.isoformat(), 'restaurant_ids': restaurant_ids, 'active_poll_id': poll_id}
+
+
+def query_plan(db: Database, sql: str, params: tuple) -> list:
+    conn = db.get_connection()
+    try:
+        return [row['detail'] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    finally:
+        conn.close()
+
+
+def measure(db: Database, sql: str, make_params, ctx: dict, repeat: int) -> float:
+    """Среднее время запроса в микросекундах"""
+    conn = db.get_connection()
+    try:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, make_params(ctx)).fetchall()
+        return (time.perf_counter() - started) / repeat * 1_000_000
+    finally:
+        conn.close()
+
+
+def set_indexes(db: Database, enabled: bool):
+    conn = db.get_connection()
+    try:
+        for name, table, columns in INDEXES:
+            if enabled:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+            else:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+        conn.execute("ANALYZE")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--users', type=int, default=60)
+    parser.add_argument('--restaurants', type=int, default=8)
+    parser.add_argument('--dishes', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=300)
+    args = parser.parse_args()
+
+    random.seed(42)
+    path = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    db = Database(path)
+    ctx = seed(db, args.days, args.users, args.restaurants, args.dishes)
+
+    counts = {}
+    conn = db.get_connection()
+    for table in ('polls', 'votes', 'lunch_participants', 'user_orders', 'menu_items'):
+        counts[table] = conn.execute(f"SELECT COUNT(*) AS n FROM {table}").fetchone()['n']
+    conn.close()
+    print("Данные: " + ", ".join(f"{t}={n}" for t, n in counts.items()))
+    print()
+
+    results = {}
+    for enabled in (False, True):
+        set_indexes(db, enabled)
+        label = 'с индексами' if enabled else 'без индексов'
+        for name, (sql, make_params) in HOT_QUERIES.items():
+            plan = query_plan(db, sql, make_params(ctx))
+            latency = measure(db, sql, make_params, ctx, args.repeat)
+            results.setdefault(name, {})[enabled] = latency
+            print(f"[{label}] {name}: {latency:.1f} мкс")
+            for line in plan:
+                print(f"    {line}")
+        print()
+
+    print(f"{'Запрос':<22}{'без, мкс':>12}{'с, мкс':>12}{'ускорение':>12}")
+    for name, row in results.items():
+        speedup = row[False] / row[True] if row[True] else 0
+        print(f"{name:<22}{row[False]:>12.1f}{row[True]:>12.1f}{speedup:>11.1f}x")
+
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сборки заказа для /send_order
+
+Сравнивает прежний путь (get_all_orders + get_order_summary, фильтр заказов
+по названию ресторана и поиск any(...) по всем заказам для каждого блюда)
+с Database.get_order_aggregate - одним запросом по restaurant_id.
+
+Прежняя сводка не выбирала menu_item_id, и /send_order падал на KeyError;
+для сравнения её запрос дополнен mi.id AS menu_item_id, остальное как было.
+
+Запуск:
+    python benchmark_orders.py [--orders 500] [--restaurants 5] [--repeat 200]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmark_indexes import CATEGORIES
+from database import Database
+from order_document import format_order_text
+
+LEGACY_SUMMARY_SQL = '''
+    SELECT mi.id AS menu_item_id, mi.name, mi.price, r.name as restaurant_name,
+           SUM(uo.quantity) as total_quantity,
+           COUNT(DISTINCT uo.user_id) as user_count
+    FROM user_orders uo
+    JOIN menu_items mi ON uo.menu_item_id = mi.id
+    JOIN restaurants r ON mi.restaurant_id = r.id
+    WHERE uo.poll_id = ?
+    GROUP BY mi.id, mi.name, mi.price, r.name
+    ORDER BY r.name, mi.name
+'''
+
+
+def seed(db: Database, orders: int, restaurants: int, dishes: int, per_user: int) -> dict:
+    """Одно голосование с orders заказами; у победителя - большая часть"""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    menu = {}
+    for r in range(restaurants):
+        cursor.execute("INSERT INTO restaurants (name) VALUES (?)", (f"Ресторан {r}",))
+        rid = cursor.lastrowid
+        rows = [(rid, f"Блюдо {r}-{d:02d}", 500 + d * 10, CATEGORIES[d % len(CATEGORIES)]) for d in range(dishes)]
+        cursor.executemany("INSERT INTO menu_items (restaurant_id, name, price, category) VALUES (?, ?, ?, ?)", rows)
+    for row in cursor.execute("SELECT id, restaurant_id FROM menu_items").fetchall():
+        menu.setdefault(row['restaurant_id'], []).append(row['id'])
+    winner_id = min(menu)
+
+    users = orders // per_user
+    user_ids = list(range(1000, 1000 + users))
+    cursor.executemany(
+        "INSERT INTO users (user_id, username, first_name, access_status) VALUES (?, ?, ?, 'approved')",
+        [(uid, f"user{uid}", f"Имя{uid}") for uid in user_ids]
+    )
+    cursor.execute("INSERT INTO polls (date, created_by) VALUES (date('now'), ?)", (user_ids[0],))
+    poll_id = cursor.lastrowid
+    rows = []
+    for uid in user_ids:
+        # 80% участников заказывают у победителя
+        rid = winner_id if random.random() < 0.8 else random.choice(list(menu))
+        for item_id in random.sample(menu[rid], per_user):
+            rows.append((poll_id, uid, item_id, random.randint(1, 3)))
+    cursor.executemany(
+        "INSERT INTO user_orders (poll_id, user_id, menu_item_id, quantity) VALUES (?, ?, ?, ?)", rows
+    )
+    cursor.execute("INSERT INTO votes (poll_id, user_id, restaurant_id) VALUES (?, ?, ?)",
+                   (poll_id, user_ids[0], winner_id))
+    conn.commit()
+    conn.close()
+    return {'poll_id': poll_id, 'winner_id': winner_id, 'orders': len(rows)}
+
+
+def legacy_order(db: Database, poll: dict, winner_id: int) -> tuple:
+    """Прежний send_order_command: (сумма, участников, текст)"""
+    poll_id = poll['id']
+    votes = db.get_poll_votes(poll_id)
+    restaurant = db.get_restaurant(votes[0][0] if votes else winner_id)
+    all_orders = db.get_all_orders(poll_id)
+    restaurant_orders = [o for o in all_orders if o['restaurant_name'] == restaurant['name']]
+    conn = db.get_connection()
+    try:
+        order_summary = [dict(row) for row in conn.execute(LEGACY_SUMMARY_SQL, (poll_id,)).fetchall()]
+    finally:
+        conn.close()
+
+    order_text = f"📦 <b>ЗАКАЗ для {restaurant.get('emoji', '🍽️')} {restaurant['name']}</b>\n\n"
+    order_text += f"📅 Дата: {poll['date']}\n"
+    participants = len(set([o['user_id'] for o in restaurant_orders]))
+    order_text += f"👥 Участников: {participants}\n\n"
+    order_text += "<b>━━━ СВОДКА ЗАКАЗА ━━━</b>\n\n"
+    total_sum = 0
+    for item in order_summary:
+        if any(o['menu_item_id'] == item['menu_item_id'] for o in restaurant_orders):
+            total = item['price'] * item['total_quantity']
+            total_sum += total
+            order_text += f"<b>{item['name']}</b> x{item['total_quantity']} = {int(total)}֏\n"
+    order_text += f"\n💰 <b>ИТОГО: {int(total_sum)}֏</b>\n\n"
+    order_text += "<b>━━━ ПО УЧАСТНИКАМ ━━━</b>\n\n"
+    users_orders = {}
+    for order in restaurant_orders:
+        users_orders.setdefault(order['first_name'], []).append(order)
+    for user_name, orders in users_orders.items():
+        order_text += f"👤 <b>{user_name}:</b>\n"
+        user_total = 0
+        for order in orders:
+            price = order['price'] * order['quantity']
+            user_total += price
+            order_text += f"  • {order['dish_name']} x{order['quantity']} — {int(price)}֏\n"
+        order_text += f"  💵 Сумма: {int(user_total)}֏\n\n"
+    return total_sum, participants, order_text
+
+
+def aggregate_order(db: Database, poll: dict, winner_id: int) -> tuple:
+    """Новый путь: (сумма, участников, текст)"""
+    votes = db.get_poll_votes(poll['id'])
+    restaurant_id = votes[0][0] if votes else winner_id
+    restaurant = db.get_restaurant(restaurant_id)
+    aggregate = db.get_order_aggregate(poll['id'], restaurant_id)
+    return aggregate['total'], aggregate['participant_count'], format_order_text(restaurant, poll, aggregate)
+
+
+def measure(func, repeat: int) -> float:
+    """Среднее время вызова в миллисекундах"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--restaurants', type=int, default=5)
+    parser.add_argument('--dishes', type=int, default=40)
+    parser.add_argument('--per-user', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    random.seed(42)
+    db = Database(os.path.join(tempfile.mkdtemp(), 'benchmark.db'))
+    info = seed(db, args.orders, args.restaurants, args.dishes, args.per_user)
+    poll = db.get_poll_by_id(info['poll_id'])
+
+    old = legacy_order(db, poll, info['winner_id'])
+    new = aggregate_order(db, poll, info['winner_id'])
+    assert old[:2] == new[:2], f"итоги различаются: {old[:2]} != {new[:2]}"
+    assert old[2] == new[2], "тексты заказа различаются"
+
+    print(f"Заказов в голосовании: {info['orders']}, у победителя: участников {new[1]}, сумма {int(new[0])}֏")
+    print()
+    db.reset_query_stats()
+    results = {
+        'прежний путь': measure(lambda: legacy_order(db, poll, info['winner_id']), args.repeat),
+        'get_order_aggregate': measure(lambda: aggregate_order(db, poll, info['winner_id']), args.repeat),
+    }
+    baseline = results['прежний путь']
+    print(f"{'Способ':<24}{'мс/заказ':>10}{'ускорение':>12}")
+    for name, latency in results.items():
+        print(f"{name:<24}{latency:>10.2f}{baseline / latency:>11.1f}x")
+    print()
+    print("Запросы за прогон (из профилировщика):")
+    for query in db.get_query_stats(5):
+        print(f"  {query['count']:>5} x {query['avg'] * 1000:6.2f} мс  {query['sql'][:90]}")
+    db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк выбора обработчика нажатия кнопки
+
+Сравнивает, сколько стоит найти обработчик для callback_data при разном
+числе маршрутов:
+- regex: список CallbackQueryHandler с pattern, проверяемых по очереди
+  (check_update), как PTB делает для группы обработчиков;
+- scan: перебор всех префиксов старого формата в поисках самого длинного;
+- router compact: CallbackRouter.resolve для данных callback_codec;
+- router legacy: CallbackRouter.resolve для строк старого формата (префиксное дерево).
+
+Нажатия распределены по маршрутам равномерно, время - на одно нажатие.
+
+Запуск:
+    python benchmark_router.py [--routes 10 40 100 400 1000] [--clicks 20000]
+"""
+import argparse
+import random
+import time
+
+from telegram import CallbackQuery, Update, User
+from telegram.ext import CallbackQueryHandler
+
+from callback_codec import INT, encode, parse_legacy
+from callback_router import CallbackRouter
+
+
+async def _noop(update, context):
+    pass
+
+
+def build(routes: int) -> tuple:
+    """(regex-обработчики, router, действия) для routes маршрутов с одним числовым полем"""
+    actions = {f"action{i}": (f"c{i}", (INT,)) for i in range(routes)}
+    legacy = {f"action{i}_": f"action{i}" for i in range(routes)}
+    handlers = [CallbackQueryHandler(_noop, pattern=rf'^action{i}_\d+$') for i in range(routes)]
+    router = CallbackRouter(actions, legacy)
+    for action in actions:
+        router.route(action, _noop)
+    return handlers, router, actions, legacy
+
+
+def make_update(data: str) -> Update:
+    user = User(id=1, first_name='Bench', is_bot=False)
+    query = CallbackQuery(id='1', from_user=user, chat_instance='bench', data=data)
+    return Update(update_id=1, callback_query=query)
+
+
+def measure(func, items: list) -> float:
+    """Среднее время на элемент, мкс"""
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+def prefix_scan(prefixes: dict, actions: dict):
+    def resolve(data):
+        prefix = max((prefix for prefix in prefixes if data.startswith(prefix)), key=len)
+        return parse_legacy(prefixes[prefix], data[len(prefix):], actions)
+    return resolve
+
+
+def linear_match(handlers: list):
+    def match(update):
+        for handler in handlers:
+            if handler.check_update(update):
+                return handler
+        return None
+    return match
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', type=int, nargs='+', default=[10, 40, 100, 400, 1000])
+    parser.add_argument('--clicks', type=int, default=20000)
+    args = parser.parse_args()
+
+    random.seed(42)
+    print(f"Нажатий на замер: {args.clicks}")
+    print()
+    print(f"{'маршрутов':>10}{'regex, мкс':>12}{'scan, мкс':>11}{'compact, мкс':>14}{'legacy, мкс':>13}{'ускорение':>11}")
+    for routes in args.routes:
+        handlers, router, actions, legacy = build(routes)
+        clicks = [(random.randrange(routes), random.randrange(1, 10 ** 6)) for _ in range(args.clicks)]
+        legacy_updates = [make_update(f"action{i}_{value}") for i, value in clicks]
+        compact_data = [encode(f"action{i}", value, actions=actions) for i, value in clicks]
+        legacy_data = [update.callback_query.data for update in legacy_updates]
+
+        # Проверка: все способы находят один и тот же маршрут
+        match = linear_match(handlers)
+        scan = prefix_scan(legacy, actions)
+        for (i, value), update, compact in zip(clicks[:100], legacy_updates, compact_data):
+            assert match(update) is handlers[i]
+            assert scan(update.callback_query.data) == (f"action{i}", (value,))
+            assert router.resolve(compact)[0] == (f"action{i}", (value,))
+            assert router.resolve(update.callback_query.data)[0] == (f"action{i}", (value,))
+
+        regex = measure(match, legacy_updates)
+        scanned = measure(scan, legacy_data)
+        compact = measure(router.resolve, compact_data)
+        legacy = measure(router.resolve, legacy_data)
+        print(f"{routes:>10}{regex:>12.2f}{scanned:>11.2f}{compact:>14.2f}{legacy:>13.2f}{regex / compact:>10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
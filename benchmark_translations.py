@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк переводов
+
+Сравнивает прежний get_text (поиск по TRANSLATIONS с запасным языком и
+str.format в try/except) со скомпилированным каталогом на наборе вызовов,
+из которых собираются типичные экраны.
+
+Запуск:
+    python benchmark_translations.py [--repeat 20000]
+"""
+import argparse
+import time
+
+import translations
+from translations import TRANSLATIONS, LANGUAGES
+
+
+def legacy_get_text(key: str, lang: str = 'ru', **kwargs) -> str:
+    """get_text до компиляции каталога"""
+    if key not in TRANSLATIONS:
+        return f"[Missing: {key}]"
+
+    translation = TRANSLATIONS[key].get(lang, TRANSLATIONS[key].get('ru', key))
+
+    if kwargs:
+        try:
+            translation = translation.format(**kwargs)
+        except KeyError:
+            pass
+
+    return translation
+
+
+def legacy_get_category_name(category: str, lang: str = 'ru') -> str:
+    category_map = {
+        "Холодные закуски": "category_cold_appetizers",
+        "Горячие закуски": "category_hot_appetizers",
+        "Салаты": "category_salads",
+        "Супы": "category_soups",
+        "Шашлыки": "category_kebabs",
+        "Горячие блюда": "category_hot_dishes",
+        "Гарниры": "category_side_dishes",
+        "Десерты": "category_desserts",
+        "Напитки": "category_drinks",
+    }
+    key = category_map.get(category)
+    if key:
+        return legacy_get_text(key, lang)
+    return category
+
+
+# Вызовы, из которых собираются экраны (как в handlers.py)
+SCREENS = {
+    'приветствие /start': lambda t, c, lang: [
+        t('welcome_title', lang), t('welcome_text', lang), t('what_i_can', lang),
+        t('feature_voting', lang), t('feature_menu', lang), t('feature_participants', lang),
+        t('feature_reminders', lang), t('feature_orders', lang), t('choose_action', lang),
+        t('btn_start_voting', lang), t('btn_menu_list', lang), t('btn_results', lang),
+        t('btn_participants', lang), t('btn_my_order', lang),
+    ],
+    'результаты голосования': lambda t, c, lang: [
+        t('voting_results', lang), t('participants_count', lang), t('menu_restaurant', lang),
+        t('select_category', lang), t('btn_select_dishes', lang), t('btn_participants', lang),
+        t('back_to_voting', lang),
+    ] + [c(category, lang) for category in ("Салаты", "Супы", "Шашлыки", "Гарниры", "Десерты", "Напитки")],
+    'блюда категории': lambda t, c, lang: [
+        t('dishes_in_category', lang, count=12), t('dishes_shown', lang, count=12),
+        t('no_menu', lang, name='Ресторан'), t('btn_participants', lang), t('btn_results', lang),
+        t('back_to_main', lang), c("Горячие блюда", lang),
+    ],
+}
+
+
+def measure(build, get_text, get_category_name, repeat: int) -> float:
+    """Среднее время сборки экрана в микросекундах (по всем языкам)"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for lang in LANGUAGES:
+            build(get_text, get_category_name, lang)
+    return (time.perf_counter() - started) / (repeat * len(LANGUAGES)) * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20000)
+    args = parser.parse_args()
+
+    # Реализации должны давать одинаковый текст
+    for name, build in SCREENS.items():
+        for lang in LANGUAGES + ('xx',):
+            old = build(legacy_get_text, legacy_get_category_name, lang)
+            new = build(translations.get_text, translations.get_category_name, lang)
+            assert old == new, f"{name} [{lang}]: тексты различаются"
+
+    print(f"{'Экран':<26}{'вызовов':>9}{'было, мкс':>12}{'стало, мкс':>12}{'ускорение':>11}")
+    for name, build in SCREENS.items():
+        calls = len(build(translations.get_text, translations.get_category_name, 'ru'))
+        before = measure(build, legacy_get_text, legacy_get_category_name, args.repeat)
+        after = measure(build, translations.get_text, translations.get_category_name, args.repeat)
+        print(f"{name:<26}{calls:>9}{before:>12.2f}{after:>12.2f}{before / after:>10.1f}x")
+
+    problems = translations.check_catalogue()
+    print()
+    print(f"Проверка каталога: {'проблем нет' if not problems else len(problems)}")
+    for problem in problems:
+        print(f"  {problem}")
+
+
+if __name__ == '__main__':
+    main()
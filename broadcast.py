@@ -0,0 +1,281 @@
+"""
+Массовая рассылка сообщений с учётом лимитов Telegram
+
+Telegram допускает около 30 сообщений в секунду от бота в целом и около
+одного в секунду в один чат; при превышении отвечает RetryAfter. Рассылка
+идёт несколькими параллельными отправителями через общий ограничитель
+скорости (token bucket), RetryAfter приостанавливает всю рассылку на
+указанное время, сетевые ошибки повторяются с экспоненциальной паузой.
+Таймаут после отправки запроса не повторяется: сообщение могло дойти,
+и повтор продублировал бы его - такой получатель считается 'uncertain'.
+Отказ Telegram (BadRequest) - 'rejected', повтор его не исправит;
+'failed' - сообщение не ушло, и его можно отправить снова.
+
+Использование:
+    report = await Broadcaster(bot).broadcast(user_ids, text, parse_mode='HTML')
+    logger.info(report.summary())
+"""
+import asyncio
+import logging
+import random
+import time
+import httpx
+from telegram.error import BadRequest, ChatMigrated, Forbidden, NetworkError, RetryAfter, TimedOut
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости: rate токенов в секунду, не больше capacity подряд
+
+    acquire() ждёт токен; ожидающие обслуживаются по очереди.
+    pause() останавливает выдачу токенов (после RetryAfter).
+    Небольшой capacity по умолчанию: Telegram считает сообщения в скользящем
+    окне, и всплеск в начале рассылки вместе с ровным потоком превысил бы лимит.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        # После паузы начинаем с пустого ведра, без всплеска
+        self._tokens = 0.0
+        self._updated = max(self._updated, self._paused_until)
+
+
+# Общий лимит бота: один на процесс, для всех рассылок сразу
+GLOBAL_LIMIT = TokenBucket(config.BROADCAST_RATE)
+
+
+def _may_have_been_sent(error: TimedOut) -> bool:
+    """Таймаут после отправки запроса (а не при подключении или ожидании пула)"""
+    return not isinstance(error.__cause__, (httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+class Delivery:
+    """Результат отправки одному получателю"""
+
+    __slots__ = ('chat_id', 'status', 'attempts', 'error')
+
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.status = 'pending'
+        self.attempts = 0
+        self.error = None
+
+
+class BroadcastReport:
+    """Итоги рассылки"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.deliveries = []
+        self.retries = 0
+        self.rate_limited = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    def count(self, status: str) -> int:
+        return sum(1 for d in self.deliveries if d.status == status)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def as_dict(self) -> dict:
+        elapsed = self.elapsed
+        sent = self.count('sent')
+        return {
+            'name': self.name,
+            'total': len(self.deliveries),
+            'sent': sent,
+            'blocked': self.count('blocked'),
+            'rejected': self.count('rejected'),
+            'failed': self.count('failed'),
+            'uncertain': self.count('uncertain'),
+            'retries': self.retries,
+            'rate_limited': self.rate_limited,
+            'elapsed': elapsed,
+            'per_second': sent / elapsed if elapsed else 0.0,
+        }
+
+    def summary(self) -> str:
+        stats = self.as_dict()
+        return (
+            f"Рассылка '{self.name}': отправлено {stats['sent']} из {stats['total']}, "
+            f"заблокировали бота {stats['blocked']}, отклонено {stats['rejected']}, ошибок {stats['failed']}, "
+            f"без ответа (могли дойти) {stats['uncertain']}, "
+            f"повторов {stats['retries']} (RetryAfter: {stats['rate_limited']}), "
+            f"{stats['elapsed']:.1f} с, {stats['per_second']:.1f} сообщ./с"
+        )
+
+
+class Broadcaster:
+    """
+    Рассылка одного сообщения многим получателям
+
+    concurrency - сколько сообщений отправляется одновременно (скрывает
+    задержку сети), скорость при этом ограничивает limiter.
+    """
+
+    def __init__(self, bot, limiter: TokenBucket = None, concurrency: int = config.BROADCAST_CONCURRENCY,
+                 per_chat_rate: float = 1.0, max_retries: int = config.BROADCAST_MAX_RETRIES,
+                 base_delay: float = 1.0):
+        self.bot = bot
+        self.limiter = limiter or GLOBAL_LIMIT
+        self.concurrency = concurrency
+        self.per_chat_rate = per_chat_rate
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+
+    async def broadcast(self, recipients, text: str, name: str = 'broadcast', on_status=None,
+                        **send_kwargs) -> BroadcastReport:
+        """
+        Отправить text всем recipients (chat_id)
+
+        recipients - любой итерируемый или асинхронно итерируемый источник:
+        получатели читаются по мере отправки, без сборки полного списка.
+        on_status(chat_id, status) - корутина, вызывается с 'sending' перед
+        первой попыткой и с итоговым статусом после; её ошибка прерывает
+        рассылку (broadcast() поднимает её после остановки отправителей).
+        """
+        report = BroadcastReport(name)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        # Лимиты чатов живут одну рассылку: Broadcaster долгоживущий, и
+        # общий словарь рос бы с каждым чатом, которому бот когда-либо писал
+        chat_limits = {}
+        # Ошибка on_status: остальным получателям уже не отправляем (они
+        # остаются 'pending'), но очередь разбираем, чтобы не встал источник
+        aborted = None
+
+        async def worker():
+            nonlocal aborted
+            while True:
+                delivery = await queue.get()
+                try:
+                    if delivery is None:
+                        return
+                    if aborted is not None:
+                        continue
+                    try:
+                        if on_status:
+                            await on_status(delivery.chat_id, 'sending')
+                        await self._deliver(delivery, text, send_kwargs, report, chat_limits)
+                        if on_status:
+                            await on_status(delivery.chat_id, delivery.status)
+                    except Exception as e:
+                        aborted = e
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        try:
+            if hasattr(recipients, '__aiter__'):
+                async for chat_id in recipients:
+                    delivery = Delivery(chat_id)
+                    report.deliveries.append(delivery)
+                    await queue.put(delivery)
+            else:
+                for chat_id in recipients:
+                    delivery = Delivery(chat_id)
+                    report.deliveries.append(delivery)
+                    await queue.put(delivery)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            report.finished = time.monotonic()
+        if aborted is not None:
+            raise aborted
+        return report
+
+    async def _deliver(self, delivery: Delivery, text: str, send_kwargs: dict, report: BroadcastReport,
+                       chat_limits: dict):
+        chat_id = delivery.chat_id
+        while True:
+            limit = chat_limits.get(chat_id)
+            if limit is None:
+                limit = chat_limits[chat_id] = TokenBucket(self.per_chat_rate)
+            await limit.acquire()
+            await self.limiter.acquire()
+            delivery.attempts += 1
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **send_kwargs)
+                delivery.status = 'sent'
+                return
+            except RetryAfter as e:
+                # Лимит превышен: Telegram сам говорит, сколько ждать - ждут все
+                report.rate_limited += 1
+                self.limiter.pause(float(e.retry_after))
+                logger.warning(f"RetryAfter {e.retry_after} с при рассылке '{report.name}'")
+                error = e
+                delay = 0.0
+            except ChatMigrated as e:
+                # Группа стала супергруппой - отправляем в новый чат
+                chat_id = e.new_chat_id
+                error = e
+                delay = 0.0
+            except Forbidden as e:
+                # Пользователь заблокировал бота - повторять бессмысленно
+                delivery.status = 'blocked'
+                delivery.error = str(e)
+                return
+            except BadRequest as e:
+                delivery.status = 'rejected'
+                delivery.error = str(e)
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                return
+            except TimedOut as e:
+                if _may_have_been_sent(e):
+                    delivery.status = 'uncertain'
+                    delivery.error = str(e)
+                    logger.warning(f"Нет ответа на отправку пользователю {chat_id}, не повторяем: {e}")
+                    return
+                # Запрос не ушёл (таймаут подключения или пула) - можно повторить
+                error = e
+                delay = self.base_delay * 2 ** (delivery.attempts - 1) * (0.5 + random.random())
+            except NetworkError as e:
+                error = e
+                delay = self.base_delay * 2 ** (delivery.attempts - 1) * (0.5 + random.random())
+            except Exception as e:
+                delivery.status = 'failed'
+                delivery.error = str(e)
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id}: {e}")
+                return
+
+            if delivery.attempts > self.max_retries:
+                delivery.status = 'failed'
+                delivery.error = str(error)
+                logger.error(f"Не удалось отправить сообщение пользователю {chat_id} после {delivery.attempts} попыток: {error}")
+                return
+            report.retries += 1
+            if delay:
+                await asyncio.sleep(delay)
@@ -0,0 +1,537 @@
+"""
+Кэши данных в памяти процесса
+
+Рестораны и меню читаются почти на каждое нажатие кнопки, а меняются
+только командами админа. Поэтому Database держит их в памяти и сбрасывает
+кэш в своих же методах записи (add_*/update_*/delete_*).
+
+Также кэшируются профили пользователей (язык, статус доступа): их читает
+почти каждый обработчик и декоратор require_access, сегодняшнее активное
+голосование - с него начинается большинство обработчиков, и счётчики
+голосов, по которым строится экран результатов. RenderCache хранит уже
+отрисованные экраны меню.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    _TZ = ZoneInfo(config.TIMEZONE)
+except ZoneInfoNotFoundError:
+    logger.warning(f"Часовой пояс {config.TIMEZONE} не найден, используется локальное время сервера")
+    _TZ = None
+
+
+# (дата, unix-время ближайшей полуночи) - дата пересчитывается раз в сутки
+_today = (None, 0.0)
+
+
+def local_today() -> str:
+    """Сегодняшняя дата (YYYY-MM-DD) в часовом поясе config.TIMEZONE"""
+    global _today
+    date, until = _today
+    if time.time() < until:
+        return date
+    now = datetime.now(_TZ)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), now.tzinfo)
+    date = now.strftime('%Y-%m-%d')
+    _today = (date, midnight.timestamp())
+    return date
+
+# Маркер "в кэше нет" (None - допустимое значение, например "ресторан не найден")
+MISS = object()
+
+# Категория для блюд без категории
+DEFAULT_CATEGORY = 'Основное меню'
+
+
+class CatalogCache:
+    """
+    Кэш ресторанов и меню
+
+    Рестораны хранятся одним снимком (их мало), меню - по id ресторана,
+    уже сгруппированное по категориям. Любой сброс увеличивает version:
+    загрузка, начатая до сброса, в кэш не попадёт (см. store_*). Перезагрузка
+    по TTL, получившая другие данные (их поменял другой процесс), тоже
+    увеличивает version - по ней сбрасываются зависимые кэши (RenderCache).
+
+    Возвращаемые словари общие для всех вызовов - их нельзя изменять.
+    """
+
+    def __init__(self, ttl: float = config.CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._restaurants = None
+        self._menus = {}
+        self._items = {}
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def _fresh(self, entry) -> bool:
+        return entry is not None and time.monotonic() - entry['loaded_at'] < self.ttl
+
+    # ========== Чтение ==========
+
+    def lookup_restaurants(self):
+        """Снимок ресторанов {'all', 'active', 'by_id'} или MISS"""
+        with self._lock:
+            if self._fresh(self._restaurants):
+                self._hits += 1
+                return self._restaurants
+            return MISS
+
+    def lookup_menu(self, restaurant_id: int):
+        """Меню ресторана {'all', 'available', 'by_category'} или MISS"""
+        with self._lock:
+            entry = self._menus.get(restaurant_id)
+            if self._fresh(entry):
+                self._hits += 1
+                return entry
+            return MISS
+
+    def lookup_item(self, item_id: int):
+        """Блюдо из уже загруженных меню или MISS"""
+        with self._lock:
+            item = self._items.get(item_id)
+            if item is not None and self._fresh(self._menus.get(item['restaurant_id'])):
+                self._hits += 1
+                return item
+            return MISS
+
+    # ========== Загрузка ==========
+
+    def store_restaurants(self, rows: list, version: int) -> dict:
+        """Сохранить рестораны (rows отсортированы по имени)"""
+        snapshot = {
+            'all': rows,
+            'active': [r for r in rows if r['is_active'] == 1],
+            'by_id': {r['id']: r for r in rows},
+            'loaded_at': time.monotonic(),
+        }
+        with self._lock:
+            self._misses += 1
+            if version == self.version:
+                self._changed_on_reload(self._restaurants, rows)
+                self._restaurants = snapshot
+        return snapshot
+
+    def store_menu(self, restaurant_id: int, rows: list, version: int) -> dict:
+        """Сохранить меню ресторана (rows отсортированы по категории и названию)"""
+        available = [item for item in rows if item['is_available'] == 1]
+        by_category = {}
+        for item in available:
+            by_category.setdefault(item['category'] or DEFAULT_CATEGORY, []).append(item)
+        entry = {
+            'all': rows,
+            'available': available,
+            'by_category': by_category,
+            'loaded_at': time.monotonic(),
+        }
+        with self._lock:
+            self._misses += 1
+            if version == self.version:
+                self._changed_on_reload(self._menus.get(restaurant_id), rows)
+                self._drop_menu(restaurant_id)
+                self._menus[restaurant_id] = entry
+                for item in rows:
+                    self._items[item['id']] = item
+        return entry
+
+    def _changed_on_reload(self, previous, rows: list):
+        """Перезагрузка устаревшей записи нашла изменения - новая версия"""
+        if previous is not None and previous['all'] != rows:
+            self.version += 1
+            self._invalidations += 1
+
+    def record_miss(self):
+        with self._lock:
+            self._misses += 1
+
+    # ========== Сброс ==========
+
+    def _drop_menu(self, restaurant_id: int):
+        entry = self._menus.pop(restaurant_id, None)
+        if entry:
+            for item in entry['all']:
+                self._items.pop(item['id'], None)
+
+    def invalidate_restaurants(self):
+        with self._lock:
+            self.version += 1
+            self._invalidations += 1
+            self._restaurants = None
+
+    def invalidate_menu(self, restaurant_id: int):
+        with self._lock:
+            self.version += 1
+            self._invalidations += 1
+            self._drop_menu(restaurant_id)
+
+    def invalidate_item(self, item_id: int):
+        """Сбросить меню, в котором есть блюдо (если оно загружено)"""
+        with self._lock:
+            self.version += 1
+            self._invalidations += 1
+            item = self._items.get(item_id)
+            if item is not None:
+                self._drop_menu(item['restaurant_id'])
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._invalidations += 1
+            self._restaurants = None
+            self._menus.clear()
+            self._items.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else 0.0,
+                'invalidations': self._invalidations,
+                'menus': len(self._menus),
+                'restaurants_loaded': self._restaurants is not None,
+                'version': self.version,
+            }
+
+
+class ProfileCache:
+    """
+    LRU-кэш профилей пользователей с TTL
+
+    Профиль - словарь с колонками user_id, username, first_name, last_name,
+    language, access_status, is_admin или None, если пользователя нет в БД.
+    Сбрасывается методами Database, меняющими эти колонки.
+    """
+
+    def __init__(self, max_size: int = config.PROFILE_CACHE_SIZE, ttl: float = config.PROFILE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._profiles = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def lookup(self, user_id: int):
+        """Профиль (или None - пользователя нет) либо MISS"""
+        with self._lock:
+            entry = self._profiles.get(user_id)
+            if entry is None:
+                return MISS
+            profile, loaded_at = entry
+            if time.monotonic() - loaded_at >= self.ttl:
+                del self._profiles[user_id]
+                return MISS
+            self._profiles.move_to_end(user_id)
+            self._hits += 1
+            return profile
+
+    def store(self, user_id: int, profile, version: int):
+        with self._lock:
+            self._misses += 1
+            if version != self.version:
+                return profile
+            self._profiles[user_id] = (profile, time.monotonic())
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.max_size:
+                self._profiles.popitem(last=False)
+                self._evictions += 1
+        return profile
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self.version += 1
+            self._invalidations += 1
+            self._profiles.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._invalidations += 1
+            self._profiles.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else 0.0,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'size': len(self._profiles),
+                'max_size': self.max_size,
+            }
+
+
+class ActivePollRegistry:
+    """
+    Активное голосование на сегодня
+
+    Хранится только для одной даты: с наступлением полуночи (по
+    config.TIMEZONE) запрос на новую дату не совпадает с сохранённой и
+    голосование загружается заново. Отсутствие голосования тоже кэшируется.
+    create_poll записывает новое голосование сразу, close_poll сбрасывает.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._lock = threading.Lock()
+        self._date = None
+        self._poll = None
+        self._hits = 0
+        self._misses = 0
+
+    def lookup(self, date: str):
+        """Голосование (или None - его нет) либо MISS"""
+        with self._lock:
+            if date != self._date:
+                return MISS
+            self._hits += 1
+            return self._poll
+
+    def store(self, date: str, poll, version: int):
+        with self._lock:
+            self._misses += 1
+            if version == self.version:
+                self._date = date
+                self._poll = poll
+        return poll
+
+    def set(self, date: str, poll: dict):
+        """Новое голосование на дату (после create_poll)"""
+        with self._lock:
+            self.version += 1
+            self._date = date
+            self._poll = poll
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._date = None
+            self._poll = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else 0.0,
+                'date': self._date,
+                'poll_id': self._poll['id'] if self._poll else None,
+            }
+
+
+class VoteTally:
+    """Голоса одного голосования: выбор каждого пользователя и счётчики по ресторанам"""
+
+    def __init__(self, poll_id: int, choices: dict):
+        self.poll_id = poll_id
+        self.choices = dict(choices)
+        self.counts = {}
+        for restaurant_id in self.choices.values():
+            self.counts[restaurant_id] = self.counts.get(restaurant_id, 0) + 1
+        # Растёт с каждым изменившим результат голосом
+        self.version = 0
+
+    def vote(self, user_id: int, restaurant_id: int):
+        """Учесть голос (переголосование снимает голос с прежнего выбора)"""
+        previous = self.choices.get(user_id)
+        if previous == restaurant_id:
+            return
+        if previous is not None:
+            self.counts[previous] -= 1
+            if not self.counts[previous]:
+                del self.counts[previous]
+        self.choices[user_id] = restaurant_id
+        self.counts[restaurant_id] = self.counts.get(restaurant_id, 0) + 1
+        self.version += 1
+
+
+class VoteTallyCache:
+    """
+    Счётчики голосов последних голосований (LRU)
+
+    Заполняется из таблицы votes при первом обращении к голосованию
+    (или при старте - Database.warm_up), дальше обновляется add_vote
+    за O(1), поэтому результаты не требуют чтения votes.
+    """
+
+    def __init__(self, max_polls: int = config.VOTE_TALLY_POLLS):
+        self.max_polls = max_polls
+        self.version = 0
+        self._lock = threading.Lock()
+        self._tallies = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def _get(self, poll_id: int):
+        tally = self._tallies.get(poll_id)
+        if tally is None:
+            return None
+        self._tallies.move_to_end(poll_id)
+        self._hits += 1
+        return tally
+
+    def lookup_counts(self, poll_id: int):
+        """{restaurant_id: голосов} или MISS"""
+        with self._lock:
+            tally = self._get(poll_id)
+            return MISS if tally is None else dict(tally.counts)
+
+    def lookup_choice(self, poll_id: int, user_id: int):
+        """restaurant_id (None - не голосовал) или MISS"""
+        with self._lock:
+            tally = self._get(poll_id)
+            return MISS if tally is None else tally.choices.get(user_id)
+
+    def lookup_version(self, poll_id: int):
+        with self._lock:
+            tally = self._get(poll_id)
+            return MISS if tally is None else tally.version
+
+    def store(self, poll_id: int, choices: dict, version: int) -> VoteTally:
+        tally = VoteTally(poll_id, choices)
+        with self._lock:
+            self._misses += 1
+            if version == self.version:
+                self._tallies[poll_id] = tally
+                self._tallies.move_to_end(poll_id)
+                while len(self._tallies) > self.max_polls:
+                    self._tallies.popitem(last=False)
+        return tally
+
+    def record_vote(self, poll_id: int, user_id: int, restaurant_id: int):
+        """Голос записан в БД - обновить счётчики, если голосование загружено"""
+        with self._lock:
+            self.version += 1
+            tally = self._tallies.get(poll_id)
+            if tally is not None:
+                tally.vote(user_id, restaurant_id)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._tallies.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else 0.0,
+                'polls': len(self._tallies),
+                'votes': sum(len(t.choices) for t in self._tallies.values()),
+            }
+
+
+class RenderCache:
+    """
+    Готовые экраны меню: (текст, клавиатура) по ключу экрана
+
+    Экран зависит только от каталога, поэтому все записи привязаны к
+    версии CatalogCache: как только каталог изменился (версия выросла),
+    кэш очищается целиком. Экран живёт не дольше ttl (TTL каталога):
+    попадание в этот кэш не читает каталог, и без срока жизни его
+    перезагрузка по TTL никогда бы не случилась. InlineKeyboardMarkup
+    неизменяемый - один объект можно отправлять всем пользователям.
+    """
+
+    def __init__(self, max_size: int = config.RENDER_CACHE_SIZE, ttl: float = config.CATALOG_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._lock = threading.Lock()
+        self._screens = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def _current(self, version: int) -> bool:
+        """Версия актуальна? Более новая версия очищает кэш, устаревшая - игнорируется"""
+        if self.version is None or version > self.version:
+            self._screens.clear()
+            self.version = version
+        return version == self.version
+
+    def get(self, version: int, key: tuple):
+        """(текст, клавиатура) или None"""
+        with self._lock:
+            entry = self._screens.get(key) if self._current(version) else None
+            if entry is None or time.monotonic() - entry[1] >= self.ttl:
+                self._misses += 1
+                return None
+            self._screens.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, version: int, key: tuple, screen: tuple) -> tuple:
+        with self._lock:
+            if not self._current(version):
+                return screen
+            self._screens[key] = (screen, time.monotonic())
+            self._screens.move_to_end(key)
+            while len(self._screens) > self.max_size:
+                self._screens.popitem(last=False)
+        return screen
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / total if total else 0.0,
+                'size': len(self._screens),
+            }
+
+
+class CategoryRegistry:
+    """
+    Категории меню и их короткие id (таблица menu_categories)
+
+    В callback_data кладётся id категории, а не её название. Категории
+    только добавляются и id не меняют, поэтому реестр не сбрасывается.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._names = {}
+
+    def store(self, rows):
+        """Добавить пары (id, название)"""
+        with self._lock:
+            for category_id, name in rows:
+                self._ids[name] = category_id
+                self._names[category_id] = name
+
+    def id_of(self, name: str):
+        """id категории или None, если её ещё нет в реестре"""
+        return self._ids.get(name)
+
+    def name_of(self, category_id: int):
+        """Название категории или None"""
+        return self._names.get(category_id)
+
+    def missing(self, names) -> list:
+        """Названия, которых нет в реестре"""
+        return [name for name in names if name not in self._ids]
+
+    def __len__(self):
+        return len(self._ids)
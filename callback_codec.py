@@ -0,0 +1,261 @@
+"""
+Компактный формат callback_data
+
+Telegram ограничивает callback_data 64 байтами. Раньше в неё писались строки
+вида add_item_{id}_{restaurant_id}_{категория}: длинное название категории
+кириллицей (2 байта на букву) в лимит не помещалось, а каждый обработчик
+разбирал данные своим split('_', n).
+
+Теперь кнопка - это код действия и типизированные поля через точку:
+encode('order_cat', 12, 'Горячие блюда') -> "oc.c.3". Целые числа пишутся
+в base62, категории - своим id из реестра menu_categories (Database.categories),
+короткие строки - как есть. Схема полей каждого действия - в ACTIONS.
+
+Маршрутизация нажатий по коду действия - callback_router.CallbackRouter.
+"""
+import re
+from typing import NamedTuple
+
+# Лимит Telegram на callback_data, байт
+CALLBACK_DATA_LIMIT = 64
+
+SEPARATOR = '.'
+
+# Типы полей
+INT = 'int'
+CATEGORY = 'category'
+WORD = 'word'
+
+# действие: (код, типы полей). Коды не меняются и не переиспользуются -
+# кнопки в уже отправленных сообщениях продолжают их присылать.
+# Выведены из употребления: nd (next_dish)
+ACTIONS = {
+    # Голосование и участники
+    'vote': ('v', (INT,)),
+    'show_results': ('r', ()),
+    'results_cat': ('rc', (INT, CATEGORY)),
+    'show_participants': ('p', ()),
+    'leave_lunch': ('ll', ()),
+    # Меню
+    'menu': ('m', (INT,)),
+    'category': ('mc', (INT, CATEGORY)),
+    'show_menu_list': ('ml', ()),
+    # Навигация и язык
+    'back_to_main': ('bm', ()),
+    'back_to_voting': ('bv', ()),
+    'start_lunch': ('go', ()),
+    'change_language': ('cl', ()),
+    'set_lang': ('sl', (WORD,)),
+    # Заказы
+    'order': ('o', (INT,)),
+    'my_orders': ('mo', ()),
+    'remove_order': ('ro', (INT,)),
+    'clear_orders': ('co', ()),
+    'show_my_order': ('so', ()),
+    # Система заказа блюд
+    'order_from': ('of', (INT,)),
+    'order_cat': ('oc', (INT, CATEGORY)),
+    'add_item': ('a', (INT,)),
+    'cart_dec': ('cd', (INT, INT)),
+    'show_cart': ('sc', (INT,)),
+    'finish_order': ('fo', ()),
+    'clear_cart': ('cc', ()),
+    # Администратор
+    'admin_panel': ('ap', ()),
+    'admin_restaurants': ('ar', ()),
+    'admin_menus': ('am', ()),
+    'admin_stats': ('as', ()),
+    'admin_users': ('au', ()),
+    'pending_users': ('pu', ()),
+    'approve_user': ('ua', (INT,)),
+    'reject_user': ('ur', (INT,)),
+    'confirm_order': ('oy', (INT,)),
+    'reject_order': ('on', (INT,)),
+}
+
+
+def index_actions(actions: dict) -> dict:
+    """Индекс для decode: код -> (действие, типы полей)"""
+    index = {code: (action, fields) for action, (code, fields) in actions.items()}
+    if len(index) != len(actions):
+        raise ValueError("Коды действий повторяются")
+    return index
+
+
+_BY_CODE = index_actions(ACTIONS)
+
+_DIGITS = '0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_DIGIT_VALUES = {digit: value for value, digit in enumerate(_DIGITS)}
+# Без '_': подчёркивание есть только в кнопках старого формата
+_WORD_RE = re.compile(r'^[A-Za-z0-9-]+$')
+
+
+class CallbackError(ValueError):
+    """callback_data не в формате encode() или с неизвестными значениями"""
+
+
+class Callback(NamedTuple):
+    action: str
+    args: tuple
+
+
+# ========== Поля ==========
+
+def _encode_int(value: int) -> str:
+    value = int(value)
+    if value < 0:
+        return '-' + _encode_int(-value)
+    digits = []
+    while True:
+        value, digit = divmod(value, 62)
+        digits.append(_DIGITS[digit])
+        if not value:
+            return ''.join(reversed(digits))
+
+
+def _decode_int(text: str) -> int:
+    sign = 1
+    if text.startswith('-'):
+        sign, text = -1, text[1:]
+    if not text:
+        raise CallbackError("пустое число")
+    value = 0
+    for char in text:
+        digit = _DIGIT_VALUES.get(char)
+        if digit is None:
+            raise CallbackError(f"недопустимый символ {char!r} в числе")
+        value = value * 62 + digit
+    return sign * value
+
+
+def _categories():
+    from services import db
+    return db.categories
+
+
+def _encode_category(name: str) -> str:
+    category_id = _categories().id_of(name)
+    if category_id is None:
+        raise CallbackError(f"категории {name!r} нет в реестре")
+    return _encode_int(category_id)
+
+
+def _decode_category(text: str) -> str:
+    name = _categories().name_of(_decode_int(text))
+    if name is None:
+        raise CallbackError(f"неизвестная категория {text}")
+    return name
+
+
+def _encode_word(value: str) -> str:
+    if not _WORD_RE.match(value):
+        raise CallbackError(f"строка {value!r} недопустима в callback_data")
+    return value
+
+
+def _decode_word(text: str) -> str:
+    return _encode_word(text)
+
+
+_ENCODERS = {INT: _encode_int, CATEGORY: _encode_category, WORD: _encode_word}
+_DECODERS = {INT: _decode_int, CATEGORY: _decode_category, WORD: _decode_word}
+
+
+# ========== Кодирование ==========
+
+def encode(action: str, *values, actions: dict = ACTIONS) -> str:
+    """callback_data для кнопки действия action с полями values"""
+    code, fields = actions[action]
+    if len(values) != len(fields):
+        raise CallbackError(f"{action}: ожидается полей {len(fields)}, передано {len(values)}")
+    data = SEPARATOR.join([code] + [_ENCODERS[kind](value) for kind, value in zip(fields, values)])
+    if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        raise CallbackError(f"{action}: callback_data длиннее {CALLBACK_DATA_LIMIT} байт")
+    return data
+
+
+def decode(data: str, index: dict = _BY_CODE) -> Callback:
+    """Разобрать callback_data; CallbackError - данные не в формате encode()"""
+    code, *parts = (data or '').split(SEPARATOR)
+    entry = index.get(code)
+    if entry is None:
+        raise CallbackError(f"неизвестный код действия {code!r}")
+    action, fields = entry
+    if len(parts) != len(fields):
+        raise CallbackError(f"{action}: ожидается полей {len(fields)}, получено {len(parts)}")
+    return Callback(action, tuple(_DECODERS[kind](part) for kind, part in zip(fields, parts)))
+
+
+# ========== Кнопки старого формата ==========
+
+# Префиксы кнопок до callback_codec -> действие. Поля после префикса
+# разделены '_', последнее текстовое поле забирает остаток строки
+LEGACY_PREFIXES = {
+    'vote_': 'vote',
+    'show_results': 'show_results',
+    'results_cat_': 'results_cat',
+    'show_participants': 'show_participants',
+    'leave_lunch': 'leave_lunch',
+    'menu_': 'menu',
+    'category_': 'category',
+    'show_menu_list': 'show_menu_list',
+    'back_to_main': 'back_to_main',
+    'back_to_voting': 'back_to_voting',
+    'start_lunch': 'start_lunch',
+    'change_language': 'change_language',
+    'set_lang_': 'set_lang',
+    'order_': 'order',
+    'my_orders': 'my_orders',
+    'remove_order_': 'remove_order',
+    'clear_orders': 'clear_orders',
+    'show_my_order': 'show_my_order',
+    'order_from_': 'order_from',
+    'order_cat_': 'order_cat',
+    'add_item_': 'add_item',
+    'cart_dec_': 'cart_dec',
+    'show_cart_': 'show_cart',
+    'finish_order': 'finish_order',
+    'clear_cart': 'clear_cart',
+    'admin_panel': 'admin_panel',
+    'admin_stats': 'admin_stats',
+    'admin_users': 'admin_users',
+    'pending_users': 'pending_users',
+    'approve_user_': 'approve_user',
+    'reject_user_': 'reject_user',
+    'confirm_order_': 'confirm_order',
+    'reject_order_': 'reject_order',
+}
+
+
+def is_legacy(data: str) -> bool:
+    """Подчёркивание бывает только в старом формате"""
+    return '_' in data
+
+
+def _legacy_field(kind: str, text: str):
+    if kind == INT:
+        try:
+            return int(text)
+        except ValueError:
+            raise CallbackError(f"не число: {text!r}") from None
+    if not text:
+        raise CallbackError("пустое поле")
+    # Старые кнопки несли название категории целиком
+    return text
+
+
+def parse_legacy(action: str, rest: str, actions: dict = ACTIONS) -> Callback:
+    """Поля действия action из остатка строки старого формата после префикса"""
+    fields = actions[action][1]
+    if not fields:
+        if rest:
+            raise CallbackError(f"{action}: лишние данные {rest!r}")
+        return Callback(action, ())
+    if fields[-1] in (CATEGORY, WORD):
+        parts = rest.split('_', len(fields) - 1)
+    else:
+        # Хвост после числовых полей (add_item_{id}_{ресторан}_{категория}) не нужен
+        parts = rest.split('_', len(fields))[:len(fields)]
+    if len(parts) != len(fields):
+        raise CallbackError(f"{action}: ожидается полей {len(fields)}, получено {len(parts)}")
+    return Callback(action, tuple(_legacy_field(kind, part) for kind, part in zip(fields, parts)))
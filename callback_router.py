@@ -0,0 +1,146 @@
+"""
+Маршрутизатор нажатий inline-кнопок
+
+CallbackRouter - один CallbackQueryHandler на все кнопки, кроме шагов
+ConversationHandler:
+
+- данные в формате callback_codec разбираются decode() и ищутся в словаре
+  по коду действия;
+- строки старого формата (vote_5, order_cat_3_Супы) из уже отправленных
+  сообщений ищутся в префиксном дереве: самый длинный префикс из
+  LEGACY_PREFIXES находится за длину строки, без перебора всех префиксов.
+
+Стоимость выбора маршрута не зависит от числа маршрутов. Обработчик каждого
+маршрута замеряется под своим именем (metrics.instrument), число нажатий по
+маршрутам и время разбора - в bot_callback_routes_total и
+bot_callback_dispatch_seconds. Нажатия логирует сам маршрутизатор.
+"""
+import logging
+import time
+from telegram.ext import CallbackQueryHandler
+from callback_codec import (
+    ACTIONS, LEGACY_PREFIXES, Callback, CallbackError, decode, index_actions, is_legacy, parse_legacy
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Кнопки шагов ConversationHandler (см. main.py). Нажатые вне своего диалога
+# (он завершён или бот перезапущен) доходят сюда - отвечаем без уведомления
+CONVERSATION_PREFIXES = ('request_access', 'cancel_access', 'addmenu_', 'setmgr_', 'cancel_setmgr')
+
+
+class PrefixTrie:
+    """Префиксное дерево: поиск самого длинного префикса строки за O(её длины)"""
+
+    _VALUE = object()
+
+    def __init__(self):
+        self._root = {}
+        self.size = 0
+
+    def insert(self, prefix: str, value):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if self._VALUE not in node:
+            self.size += 1
+        node[self._VALUE] = value
+
+    def longest(self, text: str):
+        """(префикс, значение) для самого длинного префикса text или None"""
+        node = self._root
+        found = None
+        for position, char in enumerate(text):
+            node = node.get(char)
+            if node is None:
+                break
+            if self._VALUE in node:
+                found = (position + 1, node[self._VALUE])
+        if found is None:
+            return None
+        length, value = found
+        return text[:length], value
+
+
+class CallbackRouter:
+    """
+    Один CallbackQueryHandler на все кнопки, кроме шагов ConversationHandler
+
+    Регистрируется после обработчиков с pattern; обработчик маршрута
+    получает поля кнопки в context.args.
+    """
+
+    def __init__(self, actions: dict = ACTIONS, legacy_prefixes: dict = LEGACY_PREFIXES,
+                 conversation_prefixes: tuple = CONVERSATION_PREFIXES):
+        self.actions = actions
+        self._index = index_actions(actions)
+        self._routes = {}
+        self._legacy = PrefixTrie()
+        for prefix, action in legacy_prefixes.items():
+            self._legacy.insert(prefix, action)
+        for prefix in conversation_prefixes:
+            self._legacy.insert(prefix, None)
+
+    def route(self, action: str, callback):
+        """Обработчик действия action"""
+        if action not in self.actions:
+            raise KeyError(f"Действие {action} не описано в ACTIONS")
+        if action in self._routes:
+            raise ValueError(f"Для действия {action} обработчик уже зарегистрирован")
+        self._routes[action] = metrics.instrument(callback.__name__, callback)
+
+    def resolve(self, data: str) -> tuple:
+        """
+        (Callback, формат) для callback_data
+
+        Подчёркивание бывает только в старом формате - по нему и выбирается
+        способ разбора. Кнопка шага диалога - Callback(None, ()) и формат
+        'conversation'. CallbackError - данные не распознаны.
+        """
+        if not is_legacy(data):
+            return decode(data, self._index), 'compact'
+        match = self._legacy.longest(data)
+        if match is None:
+            raise CallbackError(f"неизвестный префикс {data!r}")
+        prefix, action = match
+        if action is None:
+            return Callback(None, ()), 'conversation'
+        return parse_legacy(action, data[len(prefix):], self.actions), 'legacy'
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        started = time.perf_counter()
+        try:
+            (action, args), data_format = self.resolve(query.data or '')
+        except CallbackError as e:
+            action, args, data_format = None, (), 'unknown'
+            logger.info(f"Кнопка не распознана ({query.data!r}) от user {update.effective_user.id}: {e}")
+        metrics.CALLBACK_DISPATCH_SECONDS.observe(time.perf_counter() - started, data_format)
+        metrics.CALLBACK_ROUTES.inc(action or data_format, data_format)
+
+        if data_format == 'unknown':
+            await query.answer("⚠️ Кнопка устарела - откройте меню заново", show_alert=True)
+            return
+        if data_format == 'conversation':
+            logger.info(f"Кнопка {query.data} вне диалога от user {update.effective_user.id}")
+            await query.answer()
+            return
+        logger.info(f"📞 CALLBACK: {query.data} ({action}) от user {update.effective_user.id}")
+        context.args = list(args)
+        return await self._routes[action](update, context)
+
+    def handler(self) -> CallbackQueryHandler:
+        """
+        CallbackQueryHandler для application.add_handler
+
+        Raises: ValueError - не у всех действий ACTIONS есть обработчик
+        """
+        missing = [action for action in self.actions if action not in self._routes]
+        if missing:
+            raise ValueError(f"Нет обработчиков для действий: {', '.join(missing)}")
+        async def dispatch(update, context):
+            return await self.dispatch(update, context)
+        # Маршруты уже замеряются по отдельности
+        dispatch._instrumented = True
+        return CallbackQueryHandler(dispatch)
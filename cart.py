@@ -0,0 +1,332 @@
+"""
+Корзины заказов в памяти процесса
+
+Нажатие "добавить блюдо" меняет количество в корзине пользователя в памяти,
+а не пишет в БД. Накопившиеся изменения всех корзин записываются в
+user_orders одной транзакцией (Database.save_cart_items): через
+CART_FLUSH_DELAY сек после последнего изменения (но не позже
+CART_FLUSH_MAX_DELAY после первого), при просмотре корзины, при
+завершении заказа, перед сборкой заказа для ресторана и при остановке бота.
+
+Каждое изменение сначала дописывается в журнал (CART_JOURNAL, строка JSON
+с абсолютным количеством), а уже потом применяется в памяти. После записи
+в БД в журнал добавляется отметка. При старте бота изменения без отметки
+переигрываются в БД, после чего журнал очищается; повторная запись
+абсолютных количеств безопасна.
+
+Корзина загружается из БД при первом изменении и после записи в БД
+выгружается из памяти. Все изменения user_orders из обработчиков идут
+через CartStore - иначе загруженная корзина разошлась бы с БД.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class CartJournal:
+    """
+    Журнал изменений корзин (write-ahead), строка JSON на запись
+
+    {"n": номер, "p": poll_id, "u": user_id, "i": menu_item_id, "q": количество} - изменение;
+    {"n": номер, "p": poll_id, "u": user_id, "f": номер} - изменения корзины
+    с номерами до "f" включительно записаны в БД.
+    """
+
+    def __init__(self, path: str, fsync: bool = config.CART_JOURNAL_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._file = None
+        self.seq = 0
+
+    def replay(self) -> dict:
+        """Изменения, не записанные в БД: {(poll_id, user_id): {menu_item_id: quantity}}"""
+        pending = {}
+        if not os.path.exists(self.path):
+            return pending
+        with open(self.path, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя строка после падения процесса
+                    logger.warning(f"Журнал корзин {self.path}: строка {number} повреждена, пропускаем")
+                    continue
+                self.seq = max(self.seq, record['n'])
+                key = (record['p'], record['u'])
+                if 'f' in record:
+                    items = pending.get(key, {})
+                    for item_id in [item_id for item_id, (_, seq) in items.items() if seq <= record['f']]:
+                        del items[item_id]
+                    if not items:
+                        pending.pop(key, None)
+                else:
+                    pending.setdefault(key, {})[record['i']] = (record['q'], record['n'])
+        return {key: {item_id: quantity for item_id, (quantity, _) in items.items()}
+                for key, items in pending.items()}
+
+    def append(self, records: list) -> int:
+        """Дописать записи (поля кроме "n"); возвращает номер последней"""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        lines = []
+        for record in records:
+            self.seq += 1
+            lines.append(json.dumps({'n': self.seq, **record}, separators=(',', ':')))
+        self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        return self.seq
+
+    def truncate(self):
+        """Очистить журнал - все изменения в БД"""
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, 'w', encoding='utf-8')
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Cart:
+    """Корзина одного пользователя в одном голосовании"""
+
+    __slots__ = ('quantities', 'dirty', 'seq')
+
+    def __init__(self, quantities: dict):
+        self.quantities = quantities
+        # Блюда, изменённые после последней записи в БД
+        self.dirty = set()
+        # Номер последней записи журнала по этой корзине
+        self.seq = 0
+
+
+class CartStore:
+    """
+    Корзины пользователей с отложенной пакетной записью в user_orders
+
+    Все методы вызываются из event loop. database - AsyncDatabase
+    (по умолчанию services.db).
+    """
+
+    def __init__(self, database=None, journal_path: str = config.CART_JOURNAL,
+                 delay: float = config.CART_FLUSH_DELAY, max_delay: float = config.CART_FLUSH_MAX_DELAY):
+        self._database = database
+        self.journal = CartJournal(journal_path) if journal_path else None
+        self.delay = delay
+        self.max_delay = max_delay
+        self._carts = {}
+        self._loading = {}
+        self._flush_lock = asyncio.Lock()
+        self._timer = None
+        self._first_change = None
+        self._background = set()
+        self.changes = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    @property
+    def database(self):
+        if self._database is None:
+            from services import db
+            self._database = db
+        return self._database
+
+    # ========== Жизненный цикл ==========
+
+    async def start(self):
+        """Записать в БД изменения из журнала, оставшиеся с прошлого запуска"""
+        if self.journal is None:
+            return
+        pending = self.journal.replay()
+        if pending:
+            rows = [(poll_id, user_id, item_id, quantity)
+                    for (poll_id, user_id), items in pending.items()
+                    for item_id, quantity in items.items()]
+            await self.database.save_cart_items(rows)
+            logger.info(f"Журнал корзин: восстановлено изменений {len(rows)} в корзинах {len(pending)}")
+        self.journal.truncate()
+
+    async def close(self):
+        """Записать всё несохранённое и закрыть журнал"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        if self.journal is not None:
+            self.journal.close()
+
+    # ========== Изменения ==========
+
+    async def increment(self, poll_id: int, user_id: int, menu_item_id: int, step: int = 1) -> int:
+        """Добавить блюдо; возвращает новое количество"""
+        cart = await self._cart(poll_id, user_id)
+        quantity = cart.quantities.get(menu_item_id, 0) + step
+        self._apply(poll_id, user_id, cart, {menu_item_id: quantity})
+        return quantity
+
+    async def decrement(self, poll_id: int, user_id: int, menu_item_id: int, step: int = 1) -> int:
+        """Убрать одну порцию блюда; при нуле блюдо удаляется из корзины"""
+        cart = await self._cart(poll_id, user_id)
+        current = cart.quantities.get(menu_item_id, 0)
+        if current == 0:
+            return 0
+        quantity = max(current - step, 0)
+        self._apply(poll_id, user_id, cart, {menu_item_id: quantity})
+        return quantity
+
+    async def set_quantity(self, poll_id: int, user_id: int, menu_item_id: int, quantity: int) -> int:
+        """Задать количество блюда (0 - удалить)"""
+        cart = await self._cart(poll_id, user_id)
+        quantity = max(quantity, 0)
+        if cart.quantities.get(menu_item_id, 0) != quantity:
+            self._apply(poll_id, user_id, cart, {menu_item_id: quantity})
+        return quantity
+
+    async def remove(self, poll_id: int, user_id: int, menu_item_id: int) -> bool:
+        """Удалить блюдо из корзины; False - его там не было"""
+        cart = await self._cart(poll_id, user_id)
+        if not cart.quantities.get(menu_item_id):
+            return False
+        self._apply(poll_id, user_id, cart, {menu_item_id: 0})
+        return True
+
+    async def clear(self, poll_id: int, user_id: int):
+        """Очистить корзину"""
+        cart = await self._cart(poll_id, user_id)
+        changes = {item_id: 0 for item_id, quantity in cart.quantities.items() if quantity}
+        if changes:
+            self._apply(poll_id, user_id, cart, changes)
+
+    async def get_quantities(self, poll_id: int, user_id: int) -> dict:
+        """Текущие количества {menu_item_id: quantity} (с учётом несохранённых)"""
+        cart = await self._cart(poll_id, user_id)
+        return {item_id: quantity for item_id, quantity in cart.quantities.items() if quantity}
+
+    async def _cart(self, poll_id: int, user_id: int) -> Cart:
+        key = (poll_id, user_id)
+        cart = self._carts.get(key)
+        if cart is not None:
+            return cart
+        # Одновременные нажатия одного пользователя ждут одну загрузку
+        task = self._loading.get(key)
+        if task is None:
+            task = self._loading[key] = asyncio.ensure_future(self.database.get_cart_quantities(poll_id, user_id))
+            task.add_done_callback(lambda _: self._loading.pop(key, None))
+        quantities = await asyncio.shield(task)
+        cart = self._carts.get(key)
+        if cart is None:
+            cart = self._carts[key] = Cart(dict(quantities))
+        return cart
+
+    def _apply(self, poll_id: int, user_id: int, cart: Cart, changes: dict):
+        # Сначала журнал, потом память: упавший процесс восстановит изменение
+        if self.journal is not None:
+            cart.seq = self.journal.append(
+                [{'p': poll_id, 'u': user_id, 'i': item_id, 'q': quantity} for item_id, quantity in changes.items()]
+            )
+        for item_id, quantity in changes.items():
+            if quantity > 0:
+                cart.quantities[item_id] = quantity
+            else:
+                cart.quantities.pop(item_id, None)
+            cart.dirty.add(item_id)
+        # Корзина могла быть выгружена записью в БД, пока загружалась
+        self._carts[(poll_id, user_id)] = cart
+        self.changes += len(changes)
+        self._schedule()
+
+    # ========== Запись в БД ==========
+
+    def _schedule(self):
+        """Отложить запись: debounce с верхней границей max_delay"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        if self._first_change is None:
+            self._first_change = now
+        delay = min(self.delay, self._first_change + self.max_delay - now)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(max(delay, 0), self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        task = asyncio.ensure_future(self._flush_in_background())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _flush_in_background(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Не удалось записать корзины в БД, повторим позже: {e}")
+            self._schedule()
+
+    async def flush(self, poll_id: int = None, user_id: int = None) -> int:
+        """
+        Записать несохранённые изменения корзин в БД одной транзакцией
+
+        Без аргументов - все корзины, с poll_id - корзины голосования,
+        с poll_id и user_id - одну корзину. Returns: число записанных строк
+        """
+        async with self._flush_lock:
+            batch = {
+                key: cart for key, cart in self._carts.items()
+                if cart.dirty and (poll_id is None or key[0] == poll_id)
+                and (user_id is None or key[1] == user_id)
+            }
+            if not batch:
+                return 0
+            rows = []
+            snapshot = {}
+            for key, cart in batch.items():
+                snapshot[key] = (cart.dirty, cart.seq)
+                for item_id in cart.dirty:
+                    rows.append((key[0], key[1], item_id, cart.quantities.get(item_id, 0)))
+                cart.dirty = set()
+
+            try:
+                await self.database.save_cart_items(rows)
+            except Exception:
+                # Изменения остаются несохранёнными (и в журнале)
+                for key, cart in batch.items():
+                    cart.dirty |= snapshot[key][0]
+                raise
+
+            self.flushes += 1
+            self.rows_written += len(rows)
+            if self.journal is not None:
+                self.journal.append([{'p': key[0], 'u': key[1], 'f': seq} for key, (_, seq) in snapshot.items()])
+            # Сохранённые корзины выгружаем: следующее изменение перечитает их из БД
+            for key in [key for key, cart in self._carts.items() if not cart.dirty]:
+                del self._carts[key]
+
+            if not any(cart.dirty for cart in self._carts.values()):
+                self._first_change = None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if self.journal is not None:
+                    self.journal.truncate()
+            logger.debug(f"Корзины записаны в БД: корзин {len(batch)}, строк {len(rows)}")
+            return len(rows)
+
+    def get_stats(self) -> dict:
+        """Статистика: изменений, записей в БД, строк, корзин в памяти"""
+        return {
+            'changes': self.changes,
+            'flushes': self.flushes,
+            'rows_written': self.rows_written,
+            'carts': len(self._carts),
+            'pending': sum(len(cart.dirty) for cart in self._carts.values()),
+        }
+
+
+carts = CartStore()
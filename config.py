@@ -1,6 +1,7 @@
 """
 Конфигурация бота
 """
+import hashlib
 import os
 from dotenv import load_dotenv
 
@@ -15,6 +16,18 @@ ADMIN_ID = int(os.getenv('ADMIN_ID', 0))
 # Время уведомления о обеде
 LUNCH_TIME = os.getenv('LUNCH_TIME', '12:00')
 
+# Сколько секунд после назначенного времени уведомление ещё отправляется,
+# если бот в это время был остановлен (перезапуск, деплой)
+SCHEDULER_MISFIRE_GRACE = int(os.getenv('SCHEDULER_MISFIRE_GRACE', 1800))
+
+# Через сколько секунд повторить рассылку задания, если она упала или дошла
+# не до всех (повтор - только пока не вышло SCHEDULER_MISFIRE_GRACE)
+SCHEDULER_RETRY_DELAY = int(os.getenv('SCHEDULER_RETRY_DELAY', 60))
+
+# За сколько секунд до LUNCH_TIME подготовить итоги (победитель, текст,
+# получатели), чтобы в назначенное время только отправить; 0 - не готовить
+PREFINALIZE_SECONDS = int(os.getenv('PREFINALIZE_SECONDS', 60))
+
 # Часовой пояс
 TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
 
@@ -28,5 +41,82 @@ if DATABASE_URL:
 else:
     # SQLite локально
     DATABASE_TYPE = 'sqlite'
-    DATABASE_NAME = 'lunch_bot.db'
 
+# Файл SQLite (используется когда DATABASE_URL не задан)
+DATABASE_NAME = os.getenv('DATABASE_NAME', 'lunch_bot.db')
+
+
+# Пул соединений с БД
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+
+# Максимум запросов к БД, ожидающих выполнения в пуле потоков
+DB_EXECUTOR_QUEUE = int(os.getenv('DB_EXECUTOR_QUEUE', 100))
+
+# Профилировщик SQL: статистика по запросам (/db_stats), запросы дольше
+# SLOW_QUERY_MS пишутся в лог, с SLOW_QUERY_EXPLAIN - вместе с планом
+QUERY_PROFILER = os.getenv('QUERY_PROFILER', 'true').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 100))
+SLOW_QUERY_EXPLAIN = os.getenv('SLOW_QUERY_EXPLAIN', 'false').lower() in ('1', 'true', 'yes')
+
+# Кэш ресторанов и меню: запись через Database сбрасывает его сразу,
+# TTL (сек) - страховка от изменений, сделанных другими процессами (add_*.py);
+# столько же живут готовые экраны меню
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', 600))
+
+# Кэш профилей пользователей (язык, статус доступа): число записей и TTL (сек)
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 1000))
+PROFILE_CACHE_TTL = float(os.getenv('PROFILE_CACHE_TTL', 300))
+
+# Сколько последних голосований держать со счётчиками голосов в памяти
+VOTE_TALLY_POLLS = int(os.getenv('VOTE_TALLY_POLLS', 16))
+
+# Сколько готовых экранов меню держать в памяти
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', 256))
+
+# Рассылки: сообщений в секунду на весь бот (лимит Telegram ~30),
+# сколько отправлять одновременно и сколько раз повторять при сетевых ошибках
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', 25))
+BROADCAST_CONCURRENCY = int(os.getenv('BROADCAST_CONCURRENCY', 8))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', 3))
+
+# Заказ менеджеру текстовым файлом (send_document): always, never или
+# auto - если заказ не поместился в одно сообщение
+ORDER_DOCUMENT = os.getenv('ORDER_DOCUMENT', 'auto').lower()
+
+# Корзина: изменения копятся в памяти и пишутся в БД одной транзакцией
+# через CART_FLUSH_DELAY сек после последнего нажатия (но не позже
+# CART_FLUSH_MAX_DELAY после первого). До записи в БД они хранятся
+# в журнале CART_JOURNAL (пустое значение - без журнала);
+# CART_JOURNAL_FSYNC - сбрасывать журнал на диск после каждой записи
+CART_FLUSH_DELAY = float(os.getenv('CART_FLUSH_DELAY', 2))
+CART_FLUSH_MAX_DELAY = float(os.getenv('CART_FLUSH_MAX_DELAY', 10))
+CART_JOURNAL = os.getenv('CART_JOURNAL', 'cart_journal.jsonl')
+CART_JOURNAL_FSYNC = os.getenv('CART_JOURNAL_FSYNC', 'false').lower() in ('1', 'true', 'yes')
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').lower()
+
+# Метрики (GET /metrics): отдельный сервер на METRICS_PORT, если он задан.
+# Не на публичном порту webhook - /metrics не защищён секретом
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '0.0.0.0')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))
+
+# Webhook: адрес и порт встроенного HTTP-сервера (на Railway порт приходит в PORT)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', 8080)))
+# Публичный адрес бота (https://...), на который Telegram будет слать обновления.
+# Если не задан, webhook в Telegram не регистрируется (локальная проверка)
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+# Секретный путь: по умолчанию выводится из токена, чтобы не меняться между перезапусками
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH') or (
+    'telegram/' + hashlib.sha256((BOT_TOKEN or '').encode()).hexdigest()[:32]
+)
+# Значение заголовка X-Telegram-Bot-Api-Secret-Token (символы A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN')
+# Максимум обновлений, ожидающих обработки; при переполнении Telegram получает 503 и повторит позже
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))
+
+# Пропускать обновления, накопившиеся пока бот был выключен
+# (по умолчанию нет - они обрабатываются после запуска)
+DROP_PENDING_UPDATES = os.getenv('DROP_PENDING_UPDATES', 'false').lower() in ('1', 'true', 'yes')
@@ -1,204 +1,133 @@
 """
 Модуль для работы с базой данных
 """
-import sqlite3
-from datetime import datetime
-from typing import List, Optional, Tuple
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
 import config
+from caches import (
+    DEFAULT_CATEGORY, MISS, ActivePollRegistry, CatalogCache, CategoryRegistry, ProfileCache,
+    VoteTallyCache, local_today,
+)
+from db_backends import create_backend
+from db_pool import ConnectionPool
+from migrations import run_migrations
+from query_profiler import ProfilingConnection, QueryProfiler, explain
+
+logger = logging.getLogger(__name__)
+
+# Формат job_runs.started_at - как CURRENT_TIMESTAMP в SQLite
+JOB_RUN_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
 
 
 class Database:
-    def __init__(self, db_name: str = config.DATABASE_NAME):
-        self.db_name = db_name
+    def __init__(self, db_name: str = None, pool_size: int = config.DB_POOL_SIZE, backend=None):
+        """
+        db_name - файл SQLite; если не указан, бэкенд выбирается по config
+        (DATABASE_URL -> PostgreSQL, иначе config.DATABASE_NAME)
+        backend - готовый бэкенд (например, PostgresBackend с заглушкой для тестов)
+        """
+        self.backend = backend or create_backend(db_name)
+        self.db_name = db_name or getattr(self.backend, 'path', None)
+        self.pool = ConnectionPool(
+            connect=self.backend.connect,
+            size=pool_size,
+            timeout=config.DB_POOL_TIMEOUT,
+            setup=self.backend.setup,
+            ping=self.backend.ping,
+            reset=self.backend.reset,
+        )
+        # Статистика SQL-запросов (None - профилирование выключено)
+        self.profiler = QueryProfiler(self.backend) if config.QUERY_PROFILER else None
+        self.catalog = CatalogCache()
+        self.profiles = ProfileCache()
+        self.active_poll = ActivePollRegistry()
+        self.tallies = VoteTallyCache()
+        # Категории меню <-> id для callback_data (см. callback_codec)
+        self.categories = CategoryRegistry()
+        # Чтения, которые могут обойтись без SQL: имя метода -> функция,
+        # возвращающая ответ из кэша или MISS (использует AsyncDatabase)
+        self.cached_reads = {
+            'get_user_profile': self._peek_user_profile,
+            'get_user_language': self._peek_user_language,
+            'get_user_access_status': self._peek_user_access_status,
+            'is_admin': self._peek_is_admin,
+            'get_restaurant': self._peek_restaurant,
+            'get_all_restaurants': self._peek_all_restaurants,
+            'get_restaurant_menu': self._peek_restaurant_menu,
+            'get_menu_by_category': self._peek_menu_by_category,
+            'get_menu_item': self._peek_menu_item,
+            'get_active_poll': self._peek_active_poll,
+            'get_poll_votes': self._peek_poll_votes,
+            'get_user_vote': self._peek_user_vote,
+            'get_poll_version': self._peek_poll_version,
+        }
+        logger.info(f"База данных: {self.backend.describe()}")
         self.init_db()
+        self.load_categories()
     
     def get_connection(self):
-        """Получить соединение с БД"""
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row
+        """Получить соединение с БД из пула (close() возвращает его в пул)"""
+        conn = self.pool.connection()
+        if self.profiler is not None:
+            return ProfilingConnection(conn, self.profiler)
         return conn
     
+    def get_pool_stats(self) -> dict:
+        """Статистика пула соединений"""
+        return self.pool.get_stats()
+    
+    def get_cache_stats(self) -> dict:
+        """Статистика кэшей"""
+        return {
+            'catalog': self.catalog.get_stats(),
+            'profiles': self.profiles.get_stats(),
+            'active_poll': self.active_poll.get_stats(),
+            'tallies': self.tallies.get_stats(),
+        }
+    
+    def get_query_stats(self, limit: int = 10, order_by: str = 'total') -> List[dict]:
+        """Самые дорогие SQL-запросы: [{'sql', 'count', 'total', 'avg', 'max', 'slow'}]"""
+        return self.profiler.top(limit, order_by) if self.profiler else []
+    
+    def reset_query_stats(self):
+        """Обнулить статистику SQL-запросов"""
+        if self.profiler:
+            self.profiler.reset()
+    
+    def explain_query(self, sql: str, params=()) -> List[str]:
+        """План выполнения запроса (SELECT, UPDATE, DELETE), см. query_profiler.explain"""
+        conn = self.pool.connection()
+        try:
+            return explain(self.backend, conn, sql, params)
+        finally:
+            conn.close()
+    
+    def warm_up(self):
+        """Загрузить в кэши то, что понадобится первым же обработчикам"""
+        self._load_restaurants()
+        poll = self.get_active_poll()
+        if poll:
+            self._load_tally_counts(poll['id'])
+    
+    def close(self):
+        """Закрыть все соединения пула"""
+        self.pool.close_all()
+    
     def init_db(self):
-        """Инициализация базы данных"""
+        """Привести схему БД к актуальной версии (см. migrations.py)"""
+        started = time.perf_counter()
         conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Таблица пользователей
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                last_name TEXT,
-                is_admin INTEGER DEFAULT 0,
-                language TEXT DEFAULT 'ru',
-                access_status TEXT DEFAULT 'pending',
-                requested_at TIMESTAMP,
-                approved_at TIMESTAMP,
-                department TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Миграция: добавление поля language
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN language TEXT DEFAULT 'ru'")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        # Миграция: добавление полей для whitelist системы
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN access_status TEXT DEFAULT 'pending'")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN requested_at TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN approved_at TIMESTAMP")
-        except sqlite3.OperationalError:
-            pass
-        
-        try:
-            cursor.execute("ALTER TABLE users ADD COLUMN department TEXT")
-        except sqlite3.OperationalError:
-            pass
-        
-        # Устанавливаем админу статус "approved"
-        try:
-            cursor.execute("UPDATE users SET access_status = 'approved' WHERE is_admin = 1")
-            conn.commit()
-        except:
-            pass
-        
-        # Таблица ресторанов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS restaurants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                address TEXT,
-                phone TEXT,
-                emoji TEXT DEFAULT '🍽️',
-                photo_url TEXT,
-                is_active INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Миграция: добавление полей emoji и photo_url если их нет
         try:
-            cursor.execute("ALTER TABLE restaurants ADD COLUMN emoji TEXT DEFAULT '🍽️'")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        try:
-            cursor.execute("ALTER TABLE restaurants ADD COLUMN photo_url TEXT")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        # Таблица меню
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS menu_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                restaurant_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                description TEXT,
-                price REAL NOT NULL,
-                category TEXT,
-                is_available INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-            )
-        ''')
-        
-        # Миграция: добавление photo_url для блюд
-        try:
-            cursor.execute("ALTER TABLE menu_items ADD COLUMN photo_url TEXT")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        # Миграция: добавление badges (бейджи: новинка, хит, острое и т.д.)
-        try:
-            cursor.execute("ALTER TABLE menu_items ADD COLUMN badges TEXT")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        # Таблица голосований
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS polls (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                created_by INTEGER NOT NULL,
-                date DATE NOT NULL,
-                status TEXT DEFAULT 'active',
-                winner_restaurant_id INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                closed_at TIMESTAMP,
-                FOREIGN KEY (created_by) REFERENCES users (user_id),
-                FOREIGN KEY (winner_restaurant_id) REFERENCES restaurants (id)
-            )
-        ''')
-        
-        # Таблица голосов
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS votes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                poll_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                restaurant_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (poll_id) REFERENCES polls (id),
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                FOREIGN KEY (restaurant_id) REFERENCES restaurants (id),
-                UNIQUE(poll_id, user_id)
-            )
-        ''')
-        
-        # Таблица участников обеда
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS lunch_participants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                poll_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (poll_id) REFERENCES polls (id),
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                UNIQUE(poll_id, user_id)
-            )
-        ''')
-        
-        # Таблица заказов блюд
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                poll_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                menu_item_id INTEGER NOT NULL,
-                quantity INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (poll_id) REFERENCES polls (id),
-                FOREIGN KEY (user_id) REFERENCES users (user_id),
-                FOREIGN KEY (menu_item_id) REFERENCES menu_items (id),
-                UNIQUE(poll_id, user_id, menu_item_id)
-            )
-        ''')
-        
-        # Миграция: добавление полей manager_telegram_id и manager_phone
-        try:
-            cursor.execute("ALTER TABLE restaurants ADD COLUMN manager_telegram_id INTEGER")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        try:
-            cursor.execute("ALTER TABLE restaurants ADD COLUMN manager_phone TEXT")
-        except sqlite3.OperationalError:
-            pass  # Поле уже существует
-        
-        conn.commit()
-        conn.close()
+            before, after = run_migrations(conn, self.backend)
+        finally:
+            conn.close()
+        elapsed = (time.perf_counter() - started) * 1000
+        if before == after:
+            logger.info(f"Схема БД актуальна (версия {after}), проверка заняла {elapsed:.1f} мс")
+        else:
+            logger.info(f"Схема БД обновлена с версии {before} до {after} за {elapsed:.1f} мс")
     
     # ========== Пользователи ==========
     
@@ -229,17 +158,61 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.profiles.invalidate(user_id)
     
-    def get_user_language(self, user_id: int) -> str:
-        """Получить язык пользователя"""
+    def get_user_profile(self, user_id: int) -> Optional[dict]:
+        """
+        Профиль пользователя: имя, язык, статус доступа, is_admin (флаг из БД)
+        None - пользователя нет в БД. Словарь из кэша - не изменять.
+        """
+        profile = self.profiles.lookup(user_id)
+        if profile is not MISS:
+            return profile
+        version = self.profiles.version
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute('SELECT language FROM users WHERE user_id = ?', (user_id,))
+            cursor.execute('''
+                SELECT user_id, username, first_name, last_name, language, access_status, is_admin
+                FROM users WHERE user_id = ?
+            ''', (user_id,))
             result = cursor.fetchone()
-            return result['language'] if result else 'ru'
         finally:
             conn.close()
+        return self.profiles.store(user_id, dict(result) if result else None, version)
+    
+    def _peek_user_profile(self, user_id: int):
+        return self.profiles.lookup(user_id)
+    
+    def _peek_user_language(self, user_id: int):
+        profile = self.profiles.lookup(user_id)
+        return profile if profile is MISS else self._profile_language(profile)
+    
+    def _peek_user_access_status(self, user_id: int):
+        profile = self.profiles.lookup(user_id)
+        return profile if profile is MISS else self._profile_access_status(profile)
+    
+    def _peek_is_admin(self, user_id: int):
+        if user_id == config.ADMIN_ID:
+            return True
+        profile = self.profiles.lookup(user_id)
+        return profile if profile is MISS else self._profile_is_admin(profile)
+    
+    @staticmethod
+    def _profile_language(profile) -> str:
+        return profile['language'] if profile else 'ru'
+    
+    @staticmethod
+    def _profile_access_status(profile) -> str:
+        return profile['access_status'] if profile else 'pending'
+    
+    @staticmethod
+    def _profile_is_admin(profile) -> bool:
+        return bool(profile and profile['is_admin'] == 1)
+    
+    def get_user_language(self, user_id: int) -> str:
+        """Получить язык пользователя"""
+        return self._profile_language(self.get_user_profile(user_id))
     
     def set_user_language(self, user_id: int, language: str):
         """Установить язык пользователя"""
@@ -250,17 +223,11 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.profiles.invalidate(user_id)
     
     def get_user_access_status(self, user_id: int) -> str:
         """Получить статус доступа пользователя"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT access_status FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            return result['access_status'] if result else 'pending'
-        finally:
-            conn.close()
+        return self._profile_access_status(self.get_user_profile(user_id))
     
     def request_access(self, user_id: int, department: str = None):
         """Запросить доступ к боту"""
@@ -277,6 +244,7 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.profiles.invalidate(user_id)
     
     def approve_user(self, user_id: int):
         """Одобрить пользователя"""
@@ -292,6 +260,7 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.profiles.invalidate(user_id)
     
     def reject_user(self, user_id: int):
         """Отклонить пользователя"""
@@ -302,6 +271,7 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.profiles.invalidate(user_id)
     
     def get_pending_users(self):
         """Получить список пользователей ожидающих одобрения"""
@@ -338,26 +308,29 @@ class Database:
     
     def _is_db_admin(self, user_id: int) -> bool:
         """Проверить в БД"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            cursor.execute('SELECT is_admin FROM users WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            return result and result['is_admin'] == 1
-        finally:
-            conn.close()
+        return self._profile_is_admin(self.get_user_profile(user_id))
     
     def set_admin(self, user_id: int, is_admin: bool = True):
-        """Установить статус администратора"""
+        """Установить статус администратора; админ сразу получает доступ ('approved')"""
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute('''
-                UPDATE users SET is_admin = ? WHERE user_id = ?
-            ''', (1 if is_admin else 0, user_id))
+            if is_admin:
+                cursor.execute('''
+                    UPDATE users
+                    SET is_admin = 1,
+                        access_status = 'approved',
+                        approved_at = COALESCE(approved_at, CURRENT_TIMESTAMP)
+                    WHERE user_id = ?
+                ''', (user_id,))
+            else:
+                cursor.execute('''
+                    UPDATE users SET is_admin = 0 WHERE user_id = ?
+                ''', (user_id,))
             conn.commit()
         finally:
             conn.close()
+            self.profiles.invalidate(user_id)
     
     def get_all_users(self) -> List[dict]:
         """Получить всех пользователей"""
@@ -387,30 +360,38 @@ class Database:
             return cursor.lastrowid
         finally:
             conn.close()
+            self.catalog.invalidate_restaurants()
     
-    def get_restaurant(self, restaurant_id: int) -> Optional[dict]:
-        """Получить ресторан по ID"""
+    def _load_restaurants(self) -> dict:
+        """Снимок всех ресторанов (из кэша или одним запросом)"""
+        snapshot = self.catalog.lookup_restaurants()
+        if snapshot is not MISS:
+            return snapshot
+        version = self.catalog.version
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute('SELECT * FROM restaurants WHERE id = ?', (restaurant_id,))
-            result = cursor.fetchone()
-            return dict(result) if result else None
+            cursor.execute('SELECT * FROM restaurants ORDER BY name')
+            rows = [dict(row) for row in cursor.fetchall()]
         finally:
             conn.close()
+        return self.catalog.store_restaurants(rows, version)
+    
+    def _peek_restaurant(self, restaurant_id: int):
+        snapshot = self.catalog.lookup_restaurants()
+        return MISS if snapshot is MISS else snapshot['by_id'].get(restaurant_id)
+    
+    def _peek_all_restaurants(self, active_only: bool = True):
+        snapshot = self.catalog.lookup_restaurants()
+        return MISS if snapshot is MISS else list(snapshot['active' if active_only else 'all'])
+    
+    def get_restaurant(self, restaurant_id: int) -> Optional[dict]:
+        """Получить ресторан по ID (словарь из кэша - не изменять)"""
+        return self._load_restaurants()['by_id'].get(restaurant_id)
     
     def get_all_restaurants(self, active_only: bool = True) -> List[dict]:
         """Получить все рестораны"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        try:
-            if active_only:
-                cursor.execute('SELECT * FROM restaurants WHERE is_active = 1 ORDER BY name')
-            else:
-                cursor.execute('SELECT * FROM restaurants ORDER BY name')
-            return [dict(row) for row in cursor.fetchall()]
-        finally:
-            conn.close()
+        return list(self._load_restaurants()['active' if active_only else 'all'])
     
     def update_restaurant(self, restaurant_id: int, name: str = None, description: str = None, 
                          address: str = None, phone: str = None, manager_telegram_id: int = None,
@@ -448,6 +429,7 @@ class Database:
                 conn.commit()
         finally:
             conn.close()
+            self.catalog.invalidate_restaurants()
     
     def set_restaurant_manager(self, restaurant_id: int, manager_telegram_id: int, 
                               manager_phone: str = None):
@@ -467,6 +449,7 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.catalog.invalidate_restaurants()
     
     # ========== Меню ==========
     
@@ -485,25 +468,89 @@ class Database:
             return cursor.lastrowid
         finally:
             conn.close()
+            self.catalog.invalidate_menu(restaurant_id)
+    
+    def _load_menu(self, restaurant_id: int) -> dict:
+        """Меню ресторана целиком (из кэша или одним запросом)"""
+        entry = self.catalog.lookup_menu(restaurant_id)
+        if entry is not MISS:
+            return entry
+        version = self.catalog.version
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT * FROM menu_items 
+                WHERE restaurant_id = ? 
+                ORDER BY category, name
+            ''', (restaurant_id,))
+            rows = [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+        # Категории меню должны быть в реестре до того, как попадут в кнопки
+        self.register_categories({row['category'] or DEFAULT_CATEGORY for row in rows})
+        return self.catalog.store_menu(restaurant_id, rows, version)
+    
+    def load_categories(self):
+        """Загрузить реестр категорий меню"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT id, name FROM menu_categories')
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        self.categories.store((row['id'], row['name']) for row in rows)
+    
+    def register_categories(self, names) -> None:
+        """Добавить в реестр категории, которых в нём ещё нет"""
+        missing = self.categories.missing(names)
+        if not missing:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany('INSERT OR IGNORE INTO menu_categories (name) VALUES (?)',
+                               [(name,) for name in missing])
+            conn.commit()
+            placeholders = ', '.join('?' * len(missing))
+            cursor.execute(f'SELECT id, name FROM menu_categories WHERE name IN ({placeholders})', missing)
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        self.categories.store((row['id'], row['name']) for row in rows)
+    
+    def _peek_restaurant_menu(self, restaurant_id: int, available_only: bool = True):
+        entry = self.catalog.lookup_menu(restaurant_id)
+        return MISS if entry is MISS else list(entry['available' if available_only else 'all'])
+    
+    def _peek_menu_by_category(self, restaurant_id: int):
+        entry = self.catalog.lookup_menu(restaurant_id)
+        return MISS if entry is MISS else dict(entry['by_category'])
+    
+    def _peek_menu_item(self, item_id: int):
+        return self.catalog.lookup_item(item_id)
     
     def get_restaurant_menu(self, restaurant_id: int, available_only: bool = True) -> List[dict]:
         """Получить меню ресторана"""
+        return list(self._load_menu(restaurant_id)['available' if available_only else 'all'])
+    
+    def get_menu_by_category(self, restaurant_id: int) -> dict:
+        """Доступные блюда ресторана по категориям: {категория: [блюда]}"""
+        return dict(self._load_menu(restaurant_id)['by_category'])
+    
+    def get_menu_item(self, item_id: int) -> Optional[dict]:
+        """Получить блюдо по ID"""
+        item = self.catalog.lookup_item(item_id)
+        if item is not MISS:
+            return item
+        self.catalog.record_miss()
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
-            if available_only:
-                cursor.execute('''
-                    SELECT * FROM menu_items 
-                    WHERE restaurant_id = ? AND is_available = 1 
-                    ORDER BY category, name
-                ''', (restaurant_id,))
-            else:
-                cursor.execute('''
-                    SELECT * FROM menu_items 
-                    WHERE restaurant_id = ? 
-                    ORDER BY category, name
-                ''', (restaurant_id,))
-            return [dict(row) for row in cursor.fetchall()]
+            cursor.execute('SELECT * FROM menu_items WHERE id = ?', (item_id,))
+            result = cursor.fetchone()
+            return dict(result) if result else None
         finally:
             conn.close()
     
@@ -539,6 +586,7 @@ class Database:
                 conn.commit()
         finally:
             conn.close()
+            self.catalog.invalidate_item(item_id)
     
     def delete_menu_item(self, item_id: int):
         """Удалить блюдо из меню"""
@@ -549,13 +597,15 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.catalog.invalidate_item(item_id)
     
     # ========== Голосования ==========
     
     def create_poll(self, user_id: int, date: str = None) -> int:
         """Создать голосование"""
+        today = local_today()
         if date is None:
-            date = datetime.now().strftime('%Y-%m-%d')
+            date = today
         
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -564,15 +614,28 @@ class Database:
                 INSERT INTO polls (created_by, date, status)
                 VALUES (?, ?, 'active')
             ''', (user_id, date))
+            poll_id = cursor.lastrowid
             conn.commit()
-            return cursor.lastrowid
+            if date == today:
+                cursor.execute('SELECT * FROM polls WHERE id = ?', (poll_id,))
+                self.active_poll.set(date, dict(cursor.fetchone()))
+            return poll_id
         finally:
             conn.close()
     
+    def _peek_active_poll(self, date: str = None):
+        return self.active_poll.lookup(date or local_today())
+    
     def get_active_poll(self, date: str = None) -> Optional[dict]:
-        """Получить активное голосование"""
+        """Получить активное голосование (на сегодня - из кэша, словарь не изменять)"""
+        today = local_today()
         if date is None:
-            date = datetime.now().strftime('%Y-%m-%d')
+            date = today
+        if date == today:
+            poll = self.active_poll.lookup(date)
+            if poll is not MISS:
+                return poll
+        version = self.active_poll.version
         
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -584,9 +647,12 @@ class Database:
                 LIMIT 1
             ''', (date,))
             result = cursor.fetchone()
-            return dict(result) if result else None
         finally:
             conn.close()
+        poll = dict(result) if result else None
+        if date == today:
+            self.active_poll.store(date, poll, version)
+        return poll
     
     def get_poll_by_id(self, poll_id: int) -> Optional[dict]:
         """Получить голосование по ID"""
@@ -609,29 +675,113 @@ class Database:
                 VALUES (?, ?, ?)
             ''', (poll_id, user_id, restaurant_id))
             conn.commit()
-            return True
         except Exception as e:
             print(f"Error adding vote: {e}")
             return False
         finally:
             conn.close()
+        self.tallies.record_vote(poll_id, user_id, restaurant_id)
+        return True
+    
+    def _load_tally_counts(self, poll_id: int) -> dict:
+        """Счётчики голосов {restaurant_id: голосов} (из кэша или одним запросом)"""
+        counts = self.tallies.lookup_counts(poll_id)
+        if counts is not MISS:
+            return counts
+        version = self.tallies.version
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT user_id, restaurant_id FROM votes WHERE poll_id = ?', (poll_id,))
+            choices = {row['user_id']: row['restaurant_id'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+        return dict(self.tallies.store(poll_id, choices, version).counts)
+    
+    @staticmethod
+    def _rank_restaurants(restaurants: List[dict], counts: dict) -> List[dict]:
+        """Активные рестораны с числом голосов: по убыванию голосов, затем по имени"""
+        ranked = [
+            {'restaurant_id': r['id'], 'name': r['name'], 'emoji': r['emoji'] or '🍽️',
+             'votes': counts.get(r['id'], 0)}
+            for r in restaurants
+        ]
+        ranked.sort(key=lambda t: (-t['votes'], t['name']))
+        return ranked
+    
+    def _peek_poll_votes(self, poll_id: int):
+        snapshot = self.catalog.lookup_restaurants()
+        counts = self.tallies.lookup_counts(poll_id)
+        if snapshot is MISS or counts is MISS:
+            return MISS
+        return [(t['restaurant_id'], t['name'], t['votes'])
+                for t in self._rank_restaurants(snapshot['active'], counts)]
     
     def get_poll_votes(self, poll_id: int) -> List[Tuple[int, str, int]]:
         """Получить результаты голосования (restaurant_id, restaurant_name, vote_count)"""
+        counts = self._load_tally_counts(poll_id)
+        ranked = self._rank_restaurants(self._load_restaurants()['active'], counts)
+        return [(t['restaurant_id'], t['name'], t['votes']) for t in ranked]
+    
+    def _peek_poll_version(self, poll_id: int):
+        return self.tallies.lookup_version(poll_id)
+    
+    def get_poll_version(self, poll_id: int) -> int:
+        """Номер версии результатов: меняется с каждым голосом, изменившим счёт"""
+        version = self.tallies.lookup_version(poll_id)
+        if version is MISS:
+            self._load_tally_counts(poll_id)
+            version = self.tallies.lookup_version(poll_id)
+        return 0 if version is MISS else version
+    
+    def get_poll_scoreboard(self, poll_id: int) -> dict:
+        """
+        Всё для экрана результатов за одно обращение к БД
+        
+        Returns:
+            {
+                'tallies': [{'restaurant_id', 'name', 'emoji', 'votes'}, ...]
+                           (активные рестораны, по убыванию голосов, затем по имени),
+                'total_votes': всего голосов,
+                'participant_count': число участников,
+                'winner': ресторан-лидер или None (если голосов нет),
+                'winner_categories': [(категория, число блюд), ...] меню лидера,
+            }
+        """
+        # Голоса - из счётчиков в памяти, рестораны - из кэша каталога
+        counts = self._load_tally_counts(poll_id)
+        tallies = self._rank_restaurants(self._load_restaurants()['active'], counts)
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
             cursor.execute('''
-                SELECT r.id, r.name, COUNT(v.id) as votes
-                FROM restaurants r
-                LEFT JOIN votes v ON r.id = v.restaurant_id AND v.poll_id = ?
-                WHERE r.is_active = 1
-                GROUP BY r.id, r.name
-                ORDER BY votes DESC, r.name
+                SELECT COUNT(*) AS n FROM lunch_participants lp
+                JOIN users u ON u.user_id = lp.user_id
+                WHERE lp.poll_id = ?
             ''', (poll_id,))
-            return [(row['id'], row['name'], row['votes']) for row in cursor.fetchall()]
+            participant_count = cursor.fetchone()['n']
         finally:
             conn.close()
+        
+        # Меню лидера - тоже из кэша каталога
+        winner = None
+        winner_categories = []
+        if tallies and tallies[0]['votes'] > 0:
+            winner_id = tallies[0]['restaurant_id']
+            winner = self.get_restaurant(winner_id)
+            counts = {}
+            for item in self.get_restaurant_menu(winner_id):
+                counts[item['category']] = counts.get(item['category'], 0) + 1
+            winner_categories = sorted(counts.items(), key=lambda c: c[0] or '')
+        
+        return {
+            'tallies': tallies,
+            'total_votes': sum(t['votes'] for t in tallies),
+            'participant_count': participant_count,
+            'winner': winner,
+            'winner_categories': winner_categories,
+        }
     
     def close_poll(self, poll_id: int, winner_restaurant_id: int = None):
         """Закрыть голосование"""
@@ -646,18 +796,152 @@ class Database:
             conn.commit()
         finally:
             conn.close()
+            self.active_poll.invalidate()
+    
+    def _peek_user_vote(self, poll_id: int, user_id: int):
+        return self.tallies.lookup_choice(poll_id, user_id)
     
     def get_user_vote(self, poll_id: int, user_id: int) -> Optional[int]:
         """Получить голос пользователя"""
+        choice = self.tallies.lookup_choice(poll_id, user_id)
+        if choice is MISS:
+            self._load_tally_counts(poll_id)
+            choice = self.tallies.lookup_choice(poll_id, user_id)
+        if choice is MISS:
+            # Голосование не попало в кэш (параллельная запись) - читаем из БД
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute('''
+                    SELECT restaurant_id FROM votes 
+                    WHERE poll_id = ? AND user_id = ?
+                ''', (poll_id, user_id))
+                result = cursor.fetchone()
+                choice = result['restaurant_id'] if result else None
+            finally:
+                conn.close()
+        return choice
+    
+    def get_users_without_vote(self, poll_id: int) -> List[int]:
+        """
+        user_id пользователей с доступом к боту (одобренные и админ),
+        ещё не проголосовавших в голосовании
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
+            # NOT EXISTS идёт по индексу UNIQUE(poll_id, user_id) таблицы votes
             cursor.execute('''
-                SELECT restaurant_id FROM votes 
-                WHERE poll_id = ? AND user_id = ?
-            ''', (poll_id, user_id))
+                SELECT u.user_id FROM users u
+                WHERE (u.access_status = 'approved' OR u.user_id = ?)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM votes v WHERE v.poll_id = ? AND v.user_id = u.user_id
+                  )
+            ''', (config.ADMIN_ID, poll_id))
+            return [row['user_id'] for row in cursor.fetchall()]
+        finally:
+            conn.close()
+    
+    # ========== Запуски заданий планировщика ==========
+    
+    def claim_job_run(self, job_id: str, run_date: str, stale_after: int) -> bool:
+        """
+        Занять запуск задания за день
+        
+        Запуск, упавший с ошибкой ('failed') или оставшийся в 'running'
+        без отметки touch_job_run дольше stale_after сек (процесс
+        остановился посреди рассылки), занимается заново.
+        
+        Returns:
+            True - запуск наш, False - задание за этот день уже выполнено
+            или выполняется (в том числе другим экземпляром бота)
+        """
+        # Время начала пишем сами (UTC): сравнение не зависит от часов и
+        # часового пояса сервера БД
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        started_at = now.strftime(JOB_RUN_TIME_FORMAT)
+        stale_before = (now - timedelta(seconds=stale_after)).strftime(JOB_RUN_TIME_FORMAT)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT OR IGNORE INTO job_runs (job_id, run_date, started_at, heartbeat_at)
+                VALUES (?, ?, ?, ?)
+            ''', (job_id, run_date, started_at, started_at))
+            if cursor.rowcount == 0:
+                cursor.execute('''
+                    UPDATE job_runs
+                    SET status = 'running', started_at = ?, heartbeat_at = ?, finished_at = NULL, error = NULL
+                    WHERE job_id = ? AND run_date = ?
+                      AND (status = 'failed'
+                           OR (status = 'running' AND COALESCE(heartbeat_at, started_at) < ?))
+                ''', (started_at, started_at, job_id, run_date, stale_before))
+            conn.commit()
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+    
+    def touch_job_run(self, job_id: str, run_date: str):
+        """Отметить, что запуск задания ещё выполняется (heartbeat_at, UTC)"""
+        heartbeat_at = datetime.now(timezone.utc).strftime(JOB_RUN_TIME_FORMAT)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE job_runs SET heartbeat_at = ?
+                WHERE job_id = ? AND run_date = ? AND status = 'running'
+            ''', (heartbeat_at, job_id, run_date))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def finish_job_run(self, job_id: str, run_date: str, status: str = 'done', error: str = None):
+        """Отметить запуск задания завершённым ('done') или упавшим ('failed')"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                UPDATE job_runs SET status = ?, finished_at = CURRENT_TIMESTAMP, error = ?
+                WHERE job_id = ? AND run_date = ?
+            ''', (status, error, job_id, run_date))
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def get_job_run(self, job_id: str, run_date: str) -> Optional[dict]:
+        """Запуск задания за день или None; started_at и heartbeat_at - UTC"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('SELECT * FROM job_runs WHERE job_id = ? AND run_date = ?', (job_id, run_date))
             result = cursor.fetchone()
-            return result['restaurant_id'] if result else None
+            return dict(result) if result else None
+        finally:
+            conn.close()
+    
+    def get_job_deliveries(self, job_id: str, run_date: str) -> Dict[int, str]:
+        """Статусы доставки рассылки задания за день: {chat_id: статус}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT chat_id, status FROM job_deliveries
+                WHERE job_id = ? AND run_date = ?
+            ''', (job_id, run_date))
+            return {row['chat_id']: row['status'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+    
+    def set_job_delivery(self, job_id: str, run_date: str, chat_id: int, status: str):
+        """Записать статус доставки рассылки задания одному получателю"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT OR REPLACE INTO job_deliveries (job_id, run_date, chat_id, status, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (job_id, run_date, chat_id, status))
+            conn.commit()
         finally:
             conn.close()
     
@@ -769,6 +1053,49 @@ class Database:
         finally:
             conn.close()
     
+    def get_cart_quantities(self, poll_id: int, user_id: int) -> Dict[int, int]:
+        """Количества блюд в заказе пользователя: {menu_item_id: quantity}"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT menu_item_id, quantity FROM user_orders
+                WHERE poll_id = ? AND user_id = ?
+            ''', (poll_id, user_id))
+            return {row['menu_item_id']: row['quantity'] for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+    def save_cart_items(self, rows: List[tuple]) -> int:
+        """
+        Записать изменения корзин одной транзакцией
+
+        Args:
+            rows: (poll_id, user_id, menu_item_id, quantity); quantity <= 0 - удалить блюдо
+
+        Returns:
+            число записанных строк
+        """
+        upserts = [row for row in rows if row[3] > 0]
+        deletes = [row[:3] for row in rows if row[3] <= 0]
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if upserts:
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO user_orders (poll_id, user_id, menu_item_id, quantity)
+                    VALUES (?, ?, ?, ?)
+                ''', upserts)
+            if deletes:
+                cursor.executemany('''
+                    DELETE FROM user_orders
+                    WHERE poll_id = ? AND user_id = ? AND menu_item_id = ?
+                ''', deletes)
+            conn.commit()
+            return len(rows)
+        finally:
+            conn.close()
+
     def get_all_orders(self, poll_id: int) -> List[dict]:
         """Получить все заказы для голосования"""
         conn = self.get_connection()
@@ -822,4 +1149,82 @@ class Database:
             return [dict(row) for row in cursor.fetchall()]
         finally:
             conn.close()
+    
+    def get_order_aggregate(self, poll_id: int, restaurant_id: int) -> dict:
+        """
+        Заказ в ресторан одним запросом: по блюдам, по участникам и итог
+        
+        Returns:
+            {
+                'dishes': [{'menu_item_id', 'name', 'price', 'quantity', 'user_count', 'total'}]
+                          (по названию блюда),
+                'users': [{'user_id', 'first_name', 'last_name', 'username', 'total',
+                           'lines': [{'menu_item_id', 'dish_name', 'category', 'price', 'quantity', 'total'}]}]
+                         (по имени; строки - по категории и названию блюда),
+                'participant_count': участников с заказом,
+                'quantity': всего порций,
+                'total': сумма заказа,
+            }
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            # Фильтр по restaurant_id в SQL: заказы из других ресторанов не читаются
+            cursor.execute('''
+                SELECT uo.user_id, uo.menu_item_id, uo.quantity,
+                       u.first_name, u.last_name, u.username,
+                       mi.name AS dish_name, mi.price, mi.category
+                FROM user_orders uo
+                JOIN menu_items mi ON uo.menu_item_id = mi.id
+                JOIN users u ON uo.user_id = u.user_id
+                WHERE uo.poll_id = ? AND mi.restaurant_id = ?
+                ORDER BY u.first_name, uo.user_id, mi.category, mi.name
+            ''', (poll_id, restaurant_id))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        
+        dishes = {}
+        users = []
+        user = None
+        total = 0
+        quantity = 0
+        for row in rows:
+            price = row['price'] or 0
+            line_total = price * row['quantity']
+            total += line_total
+            quantity += row['quantity']
+            
+            dish = dishes.get(row['menu_item_id'])
+            if dish is None:
+                dish = dishes[row['menu_item_id']] = {
+                    'menu_item_id': row['menu_item_id'], 'name': row['dish_name'], 'price': price,
+                    'quantity': 0, 'user_count': 0, 'total': 0,
+                }
+            dish['quantity'] += row['quantity']
+            dish['user_count'] += 1
+            dish['total'] += line_total
+            
+            # Строки одного пользователя идут подряд (ORDER BY ..., user_id)
+            if user is None or user['user_id'] != row['user_id']:
+                user = {
+                    'user_id': row['user_id'], 'first_name': row['first_name'],
+                    'last_name': row['last_name'], 'username': row['username'],
+                    'lines': [], 'total': 0,
+                }
+                users.append(user)
+            user['lines'].append({
+                'menu_item_id': row['menu_item_id'], 'dish_name': row['dish_name'],
+                'category': row['category'], 'price': price, 'quantity': row['quantity'],
+                'total': line_total,
+            })
+            user['total'] += line_total
+        
+        return {
+            'dishes': sorted(dishes.values(), key=lambda d: d['name']),
+            'users': users,
+            'participant_count': len(users),
+            'quantity': quantity,
+            'total': total,
+        }
 
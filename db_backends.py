@@ -0,0 +1,284 @@
+"""
+Бэкенды базы данных: SQLite (локально) и PostgreSQL (Railway)
+
+Database пишет SQL в диалекте SQLite с параметрами "?". Бэкенд PostgreSQL
+переводит такие запросы на лету: "?" -> "%s", INSERT OR REPLACE/IGNORE ->
+ON CONFLICT, lastrowid -> RETURNING id, типы в DDL.
+"""
+import re
+import sqlite3
+from functools import lru_cache
+from typing import Callable, Optional
+import config
+
+# PRAGMA применяются один раз при открытии соединения
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+)
+
+
+class SQLiteBackend:
+    """SQLite: один файл, соединения из пула"""
+
+    name = 'sqlite'
+    OperationalError = sqlite3.OperationalError
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def connect(self):
+        """Открыть новое соединение (вызывается пулом)"""
+        # Соединение может использоваться из разных потоков, но пул
+        # гарантирует, что одновременно его держит только один
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def setup(self, conn):
+        """Настроить соединение один раз после открытия"""
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+
+    def ping(self, conn):
+        conn.execute('SELECT 1')
+
+    def reset(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+    def table_exists(self, cursor, table: str) -> bool:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        return cursor.fetchone() is not None
+
+    def table_columns(self, cursor, table: str) -> set:
+        cursor.execute(f'PRAGMA table_info({table})')
+        return {row['name'] for row in cursor.fetchall()}
+
+    def explain(self, cursor, sql: str, params=()) -> list:
+        """План выполнения запроса - строки EXPLAIN QUERY PLAN"""
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row['detail'] for row in cursor.fetchall()]
+
+    def describe(self) -> str:
+        return f"sqlite:{self.path}"
+
+
+# ========== PostgreSQL ==========
+
+# Уникальные ключи таблиц - нужны для перевода INSERT OR REPLACE в ON CONFLICT
+CONFLICT_KEYS = {
+    'users': ('user_id',),
+    'votes': ('poll_id', 'user_id'),
+    'lunch_participants': ('poll_id', 'user_id'),
+    'user_orders': ('poll_id', 'user_id', 'menu_item_id'),
+    'job_runs': ('job_id', 'run_date'),
+    'job_deliveries': ('job_id', 'run_date', 'chat_id'),
+}
+
+# Таблицы с автоинкрементным id - для них INSERT возвращает id (аналог lastrowid)
+SERIAL_TABLES = {'restaurants', 'menu_items', 'polls', 'votes', 'lunch_participants', 'user_orders'}
+
+_INSERT_RE = re.compile(
+    r'^\s*INSERT\s+(?:OR\s+(REPLACE|IGNORE)\s+)?INTO\s+(\w+)\s*\(([^)]*)\)',
+    re.IGNORECASE
+)
+_FOREIGN_KEY_RE = re.compile(r',\s*FOREIGN\s+KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)', re.IGNORECASE)
+_BIGINT_COLUMNS_RE = re.compile(r'\b(user_id|chat_id|created_by|manager_telegram_id)\s+INTEGER\b', re.IGNORECASE)
+
+
+@lru_cache(maxsize=512)
+def translate_sql(sql: str, with_params: bool = True):
+    """
+    Перевести запрос из диалекта SQLite в PostgreSQL
+
+    with_params=False - запрос выполняется без параметров: psycopg2 тогда
+    не подставляет их и не разбирает %, поэтому % не удваивается.
+
+    Returns:
+        (sql, returns_id) - returns_id=True если к запросу добавлен RETURNING id
+    """
+    text = sql.strip().rstrip(';')
+    head = text.lstrip().upper()
+
+    if head.startswith('CREATE TABLE') or head.startswith('ALTER TABLE'):
+        text = re.sub(r'INTEGER\s+PRIMARY\s+KEY\s+AUTOINCREMENT', 'SERIAL PRIMARY KEY', text, flags=re.IGNORECASE)
+        text = _BIGINT_COLUMNS_RE.sub(r'\1 BIGINT', text)
+        text = re.sub(r'\bREAL\b', 'DOUBLE PRECISION', text)
+        text = re.sub(r'\bADD\s+COLUMN\s+(?!IF\s)', 'ADD COLUMN IF NOT EXISTS ', text, flags=re.IGNORECASE)
+        # SQLite не проверяет внешние ключи (PRAGMA foreign_keys выключен),
+        # поэтому и в PostgreSQL их не создаём - поведение бэкендов одинаковое
+        text = _FOREIGN_KEY_RE.sub('', text)
+
+    returns_id = False
+    match = _INSERT_RE.match(text)
+    if match:
+        mode, table, columns = match.group(1), match.group(2), match.group(3)
+        mode = mode.upper() if mode else None
+        if mode:
+            text = re.sub(r'^\s*INSERT\s+OR\s+\w+\s+INTO', 'INSERT INTO', text, flags=re.IGNORECASE)
+        if mode == 'IGNORE':
+            text += ' ON CONFLICT DO NOTHING'
+        elif mode == 'REPLACE':
+            keys = CONFLICT_KEYS.get(table.lower())
+            if not keys:
+                raise ValueError(f"Неизвестен уникальный ключ таблицы {table} для INSERT OR REPLACE")
+            cols = [c.strip() for c in columns.split(',')]
+            updates = [f"{c} = EXCLUDED.{c}" for c in cols if c not in keys]
+            if updates:
+                text += f" ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}"
+            else:
+                text += ' ON CONFLICT DO NOTHING'
+        if table.lower() in SERIAL_TABLES and 'RETURNING' not in text.upper():
+            text += ' RETURNING id'
+            returns_id = True
+
+    if with_params:
+        text = text.replace('%', '%%').replace('?', '%s')
+    return text, returns_id
+
+
+class PostgresCursor:
+    """Курсор, принимающий запросы в диалекте SQLite"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.lastrowid = None
+
+    def execute(self, sql: str, params=()):
+        params = tuple(params or ())
+        text, returns_id = translate_sql(sql, bool(params))
+        self._cursor.execute(text, params or None)
+        self.lastrowid = None
+        if returns_id:
+            row = self._cursor.fetchone()
+            self.lastrowid = row['id'] if row else None
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        text, _ = translate_sql(sql)
+        self._cursor.executemany(text, [tuple(p) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class PostgresConnection:
+    """Соединение psycopg2 с интерфейсом, которого ждёт Database"""
+
+    def __init__(self, conn, cursor_factory=None):
+        self._conn = conn
+        self._cursor_factory = cursor_factory
+
+    def cursor(self):
+        if self._cursor_factory:
+            return PostgresCursor(self._conn.cursor(cursor_factory=self._cursor_factory))
+        return PostgresCursor(self._conn.cursor())
+
+    def execute(self, sql: str, params=()):
+        return self.cursor().execute(sql, params)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+    @property
+    def in_transaction(self) -> bool:
+        # psycopg2 открывает транзакцию даже на SELECT (autocommit выключен)
+        return self._conn.get_transaction_status() != 0  # TRANSACTION_STATUS_IDLE
+
+    @property
+    def raw(self):
+        return self._conn
+
+
+class PostgresBackend:
+    """
+    PostgreSQL через psycopg2
+
+    connect можно подменить (заглушка в тестах или своё подключение);
+    по умолчанию используется psycopg2.connect(dsn) с RealDictCursor,
+    чтобы строки читались как row['column'] и dict(row), как в SQLite.
+    """
+
+    name = 'postgresql'
+
+    def __init__(self, dsn: str, connect: Optional[Callable] = None):
+        self.dsn = dsn
+        self._connect = connect
+        self._cursor_factory = None
+        if connect is None:
+            import psycopg2
+            import psycopg2.extras
+            self._connect = lambda: psycopg2.connect(dsn)
+            self._cursor_factory = psycopg2.extras.RealDictCursor
+            self.OperationalError = psycopg2.ProgrammingError
+        else:
+            self.OperationalError = Exception
+
+    def connect(self):
+        return PostgresConnection(self._connect(), self._cursor_factory)
+
+    def setup(self, conn):
+        pass
+
+    def ping(self, conn):
+        conn.execute('SELECT 1')
+        conn.rollback()
+
+    def reset(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
+    def table_exists(self, cursor, table: str) -> bool:
+        cursor.execute(
+            "SELECT 1 FROM information_schema.tables WHERE table_schema = current_schema() AND table_name = ?",
+            (table,)
+        )
+        return cursor.fetchone() is not None
+
+    def table_columns(self, cursor, table: str) -> set:
+        cursor.execute(
+            "SELECT column_name AS name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = ?",
+            (table,)
+        )
+        return {row['name'] for row in cursor.fetchall()}
+
+    def explain(self, cursor, sql: str, params=()) -> list:
+        """План выполнения запроса - строки EXPLAIN"""
+        cursor.execute('EXPLAIN ' + sql, params)
+        return [next(iter(row.values())) if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+
+    def describe(self) -> str:
+        # Не выводим пароль из DATABASE_URL в логи
+        return 'postgresql:' + re.sub(r'//[^@/]*@', '//***@', self.dsn)
+
+
+def create_backend(db_name: str = None):
+    """Выбрать бэкенд по конфигурации (DATABASE_URL -> PostgreSQL, иначе SQLite)"""
+    if db_name is None and config.DATABASE_TYPE == 'postgresql':
+        return PostgresBackend(config.DATABASE_URL)
+    return SQLiteBackend(db_name or config.DATABASE_NAME)
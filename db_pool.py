@@ -0,0 +1,250 @@
+"""
+Пул соединений с базой данных
+
+Соединения создаются один раз, настраиваются (PRAGMA и т.п.) при создании
+и затем переиспользуются между вызовами методов Database.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Не удалось получить соединение из пула за отведённое время"""
+
+
+class PoolStats:
+    """Счётчики работы пула"""
+
+    def __init__(self):
+        self.checkouts = 0          # Сколько раз выдавали соединение
+        self.hits = 0               # Выдано уже открытое соединение
+        self.misses = 0             # Пришлось открыть новое соединение
+        self.waits = 0              # Сколько раз ждали свободное соединение
+        self.wait_time = 0.0        # Суммарное время ожидания (сек)
+        self.max_wait_time = 0.0    # Максимальное время ожидания (сек)
+        self.health_check_failures = 0
+        self.discarded = 0          # Сколько соединений закрыто как неисправные
+
+    def as_dict(self) -> dict:
+        return {
+            'checkouts': self.checkouts,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / self.checkouts if self.checkouts else 0.0,
+            'waits': self.waits,
+            'wait_time': self.wait_time,
+            'avg_wait_time': self.wait_time / self.checkouts if self.checkouts else 0.0,
+            'max_wait_time': self.max_wait_time,
+            'health_check_failures': self.health_check_failures,
+            'discarded': self.discarded,
+        }
+
+
+class PooledConnection:
+    """
+    Обёртка над соединением из пула
+
+    Ведёт себя как обычное соединение, но close() возвращает его в пул,
+    а не закрывает. Поэтому существующий код вида
+    conn = db.get_connection() ... conn.close() работает без изменений.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', conn):
+        self._pool = pool
+        self._conn = conn
+        self._released = False
+
+    @property
+    def raw(self):
+        """Исходное соединение драйвера"""
+        return self._conn
+
+    def close(self):
+        """Вернуть соединение в пул"""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул переиспользуемых соединений
+
+    connect - функция, открывающая новое соединение
+    setup - вызывается один раз для каждого нового соединения (PRAGMA и т.п.)
+    ping - проверка живости соединения, выбрасывает исключение если оно сломано
+    reset - вызывается при возврате соединения в пул (откат незакрытой транзакции)
+    """
+
+    def __init__(self, connect: Callable, size: int = 5, timeout: float = 10.0,
+                 setup: Optional[Callable] = None, ping: Optional[Callable] = None,
+                 reset: Optional[Callable] = None, health_check_interval: float = 30.0):
+        if size < 1:
+            raise ValueError("Размер пула должен быть не меньше 1")
+        self._connect = connect
+        self._setup = setup
+        self._ping = ping
+        self._reset = reset
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = []             # [(conn, время возврата в пул)]
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self.stats = PoolStats()
+
+    # ========== Выдача и возврат ==========
+
+    def acquire(self):
+        """Получить исходное соединение из пула (ждёт, если все заняты)"""
+        started = time.perf_counter()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Пул соединений закрыт")
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    reused = True
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn, idle_since = None, None
+                    reused = False
+                    break
+                remaining = self.timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"Нет свободных соединений в пуле (size={self.size}) за {self.timeout} сек"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+        try:
+            if reused:
+                conn = self._check_health(conn, idle_since)
+            else:
+                conn = self._open()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+
+        wait_time = time.perf_counter() - started
+        with self._cond:
+            stats = self.stats
+            stats.checkouts += 1
+            if reused:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+            if waited:
+                stats.waits += 1
+            stats.wait_time += wait_time
+            stats.max_wait_time = max(stats.max_wait_time, wait_time)
+        return conn
+
+    def release(self, conn, discard: bool = False):
+        """Вернуть соединение в пул"""
+        if not discard and self._reset:
+            try:
+                self._reset(conn)
+            except Exception as e:
+                logger.warning(f"Соединение не удалось сбросить, закрываем: {e}")
+                discard = True
+
+        with self._cond:
+            if discard or self._closed:
+                self._created -= 1
+                self._close_quietly(conn)
+                if discard:
+                    self.stats.discarded += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def connection(self) -> PooledConnection:
+        """Получить соединение-обёртку, которое возвращается в пул по close()"""
+        return PooledConnection(self, self.acquire())
+
+    @contextmanager
+    def checkout(self):
+        """Контекстный менеджер: выдать исходное соединение и вернуть его в пул"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Закрыть все простаивающие соединения и больше не выдавать новые"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def get_stats(self) -> dict:
+        """Статистика пула: hit rate, ожидание, число выдач"""
+        with self._cond:
+            result = self.stats.as_dict()
+            result.update({
+                'size': self.size,
+                'open': self._created,
+                'idle': len(self._idle),
+                'in_use': self._created - len(self._idle),
+            })
+            return result
+
+    # ========== Внутреннее ==========
+
+    def _open(self):
+        conn = self._connect()
+        if self._setup:
+            try:
+                self._setup(conn)
+            except Exception:
+                self._close_quietly(conn)
+                raise
+        return conn
+
+    def _check_health(self, conn, idle_since: float):
+        """Проверить соединение, которое долго простаивало; при ошибке открыть новое"""
+        if not self._ping or time.monotonic() - idle_since < self.health_check_interval:
+            return conn
+        try:
+            self._ping(conn)
+            return conn
+        except Exception as e:
+            logger.warning(f"Соединение из пула не прошло проверку, переоткрываем: {e}")
+            with self._cond:
+                self.stats.health_check_failures += 1
+                self.stats.discarded += 1
+            self._close_quietly(conn)
+            return self._open()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -3,13 +3,13 @@
 """
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from database import Database
+from caches import DEFAULT_CATEGORY, RenderCache
+from callback_codec import encode
+from cart import carts
+from services import db
 from translations import get_text, get_category_name
-from datetime import datetime
 import config
 
-db = Database()
-
 
 # ========== Хелперы для форматирования ==========
 
@@ -39,6 +39,27 @@ def get_category_emoji(category_name: str) -> str:
         return "🍽️"
 
 
+# Порядок категорий в меню (остальные - после них, в порядке меню)
+CATEGORY_ORDER = [
+    "Холодные закуски",
+    "Горячие закуски", 
+    "Салаты",
+    "Супы",
+    "Шашлыки",
+    "Горячие блюда",
+    "Гарниры",
+    "Десерты",
+    "Напитки"
+]
+
+
+def sort_categories(categories) -> list:
+    """Категории в порядке CATEGORY_ORDER, затем остальные"""
+    ordered = [cat for cat in CATEGORY_ORDER if cat in categories]
+    ordered.extend(cat for cat in categories if cat not in CATEGORY_ORDER)
+    return ordered
+
+
 def format_menu_beautiful(restaurant_name: str, restaurant_emoji: str, menu_items: list, mode: str = "view") -> str:
     """
     Красиво форматировать меню ресторана
@@ -46,63 +67,209 @@ def format_menu_beautiful(restaurant_name: str, restaurant_emoji: str, menu_item
     mode: "view" - просмотр меню, "order" - выбор блюд для заказа
     """
     if mode == "order":
-        text = f"╔═══════════════════════╗\n"
-        text += f"   🛒 <b>МЕНЮ {restaurant_emoji} {restaurant_name.upper()}</b>\n"
-        text += f"╚═══════════════════════╝\n"
-        text += f"<i>Нажмите на блюдо чтобы добавить в корзину</i>\n\n"
+        lines = [
+            "╔═══════════════════════╗",
+            f"   🛒 <b>МЕНЮ {restaurant_emoji} {restaurant_name.upper()}</b>",
+            "╚═══════════════════════╝",
+            "<i>Нажмите на блюдо чтобы добавить в корзину</i>",
+            "",
+        ]
     else:
-        text = f"\n╔═══════════════════════╗\n"
-        text += f"   🍽️ <b>МЕНЮ {restaurant_emoji} {restaurant_name.upper()}</b>\n"
-        text += f"╚═══════════════════════╝\n\n"
+        lines = [
+            "",
+            "╔═══════════════════════╗",
+            f"   🍽️ <b>МЕНЮ {restaurant_emoji} {restaurant_name.upper()}</b>",
+            "╚═══════════════════════╝",
+            "",
+        ]
     
     # Группируем по категориям
     categories = {}
     for item in menu_items:
-        category = item['category'] or 'Основное меню'
-        if category not in categories:
-            categories[category] = []
-        categories[category].append(item)
-    
-    # Определяем порядок категорий
-    category_order = [
-        "Холодные закуски",
-        "Горячие закуски", 
-        "Салаты",
-        "Супы",
-        "Шашлыки",
-        "Горячие блюда",
-        "Гарниры",
-        "Десерты",
-        "Напитки"
+        categories.setdefault(item['category'] or 'Основное меню', []).append(item)
+    
+    # Выводим категории с красивым форматированием в обоих режимах
+    for category in sort_categories(categories):
+        lines.append(f"┌─ {get_category_emoji(category)} <b>{category}</b>")
+        lines.append("│")
+        lines.extend(_dish_lines(categories[category]))
+        lines.append(f"└{'─' * 25}")
+        lines.append("")
+    
+    lines.append("")
+    return "\n".join(lines)
+
+
+def _dish_lines(items: list) -> list:
+    """Строки блюд внутри рамки категории"""
+    lines = []
+    for item in items:
+        price = f"{int(item['price'])}" if item['price'] else "—"
+        lines.append(f"│  • {item['name']}")
+        lines.append(f"│    💰 <b>{price} ֏</b>")
+    return lines
+
+
+# ========== Экраны меню ==========
+# Экраны зависят только от каталога и языка, поэтому отрисовываются один раз
+# и хранятся в RenderCache до следующего изменения каталога
+
+screens = RenderCache()
+
+
+def render_menu_categories(restaurant: dict, categories: dict, lang: str = None) -> tuple:
+    """Просмотр меню: список категорий"""
+    restaurant_id = restaurant['id']
+    keyboard = [
+        [InlineKeyboardButton(f"📂 {category}", callback_data=encode('category', restaurant_id, category))]
+        for category in categories
     ]
+    keyboard.append([
+        InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
+    ])
     
-    # Сортируем категории по определенному порядку
-    sorted_categories = []
-    for cat in category_order:
-        if cat in categories:
-            sorted_categories.append((cat, categories[cat]))
+    lines = [f"📋 <b>Меню: {restaurant['name']}</b>", ""]
+    if restaurant['address']:
+        lines.append(f"📍 {restaurant['address']}")
+    if restaurant['phone']:
+        lines.append(f"📞 {restaurant['phone']}")
+    lines.append("")
+    lines.append("<i>Выберите категорию:</i>")
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+def render_menu_category(restaurant: dict, category: str, items: list, lang: str = None) -> tuple:
+    """Просмотр меню: блюда категории"""
+    restaurant_id = restaurant['id']
+    text = (
+        f"📋 <b>{restaurant['name']}</b>\n"
+        f"📂 <b>{category}</b>\n\n"
+        "<i>Нажмите на блюдо, чтобы добавить в заказ:</i>\n\n"
+    )
     
-    # Добавляем остальные категории которых нет в списке
-    for cat, items in categories.items():
-        if cat not in category_order:
-            sorted_categories.append((cat, items))
+    # Создаем кнопки для каждого блюда
+    keyboard = []
+    for item in items:
+        price = f"{item['price']:.0f} ֏" if item['price'] else ""
+        button_text = f"{item['name']} - {price}"
+        # Ограничиваем длину текста кнопки
+        if len(button_text) > 60:
+            button_text = button_text[:57] + "..."
+        keyboard.append([
+            InlineKeyboardButton(button_text, callback_data=encode('order', item['id']))
+        ])
     
-    # Выводим категории с красивым форматированием в обоих режимах
-    for idx, (category, items) in enumerate(sorted_categories):
-        category_emoji = get_category_emoji(category)
-        
-        text += f"┌─ {category_emoji} <b>{category}</b>\n"
-        text += f"│\n"
-        
-        for item in items:
-            price = f"{int(item['price'])}" if item['price'] else "—"
-            # Форматируем цену красиво
-            text += f"│  • {item['name']}\n"
-            text += f"│    💰 <b>{price} ֏</b>\n"
-        
-        text += f"└{'─' * 25}\n\n"
+    # Добавляем кнопки навигации
+    keyboard.append([
+        InlineKeyboardButton("🛒 Мой заказ", callback_data=encode('my_orders')),
+        InlineKeyboardButton("◀️ Назад", callback_data=encode('menu', restaurant_id))
+    ])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def render_order_categories(restaurant: dict, categories: dict, lang: str = None) -> tuple:
+    """Заказ: список категорий с числом блюд"""
+    restaurant_id = restaurant['id']
+    rest_emoji = restaurant.get('emoji', '🍽️')
+    text = (
+        "╔═══════════════════════╗\n"
+        f"   🛒 <b>{restaurant['name'].upper()}</b> {rest_emoji}\n"
+        "╚═══════════════════════╝\n\n"
+        "📋 <b>Выберите категорию:</b>"
+    )
     
-    return text
+    # Создаём кнопки для каждой категории
+    keyboard = []
+    for category in sort_categories(categories):
+        keyboard.append([
+            InlineKeyboardButton(
+                f"{get_category_emoji(category)} {category} ({len(categories[category])})",
+                callback_data=encode('order_cat', restaurant_id, category)
+            )
+        ])
+    
+    # Добавляем кнопки управления
+    keyboard.append([
+        InlineKeyboardButton("🛒 Моя корзина", callback_data=encode('show_cart', restaurant_id)),
+        InlineKeyboardButton("🏠 Назад", callback_data=encode('show_results'))
+    ])
+    return text, InlineKeyboardMarkup(keyboard)
+
+
+def render_order_category(restaurant: dict, category: str, items: list, lang: str) -> tuple:
+    """Заказ: блюда категории с кнопками добавления в корзину"""
+    restaurant_id = restaurant['id']
+    rest_emoji = restaurant.get('emoji', '🍽️')
+    
+    # Формируем текст с блюдами
+    lines = [
+        "╔═══════════════════════╗",
+        f"   {rest_emoji} <b>{restaurant['name'].upper()}</b>",
+        "╚═══════════════════════╝",
+        "",
+        f"┌─ {get_category_emoji(category)} <b>{category}</b>",
+        "│",
+    ]
+    lines.extend(_dish_lines(items))
+    lines.append(f"└{'─' * 25}")
+    lines.append("")
+    lines.append("<i>Нажмите на блюдо чтобы добавить в корзину</i>")
+    
+    # Создаём кнопки для каждого блюда
+    keyboard = []
+    for item in items:
+        price = f"{int(item['price'])}֏" if item['price'] else ""
+        keyboard.append([
+            InlineKeyboardButton(
+                f"➕ {item['name']} ({price})",
+                callback_data=encode('add_item', item['id'])
+            )
+        ])
+    
+    # Добавляем кнопки управления
+    keyboard.append([
+        InlineKeyboardButton("⬅️ Назад к категориям", callback_data=encode('order_from', restaurant_id)),
+        InlineKeyboardButton("🛒 Корзина", callback_data=encode('show_cart', restaurant_id))
+    ])
+    keyboard.append([
+        InlineKeyboardButton(get_text('btn_participants', lang), callback_data=encode('show_participants')),
+        InlineKeyboardButton(get_text('btn_results', lang), callback_data=encode('show_results'))
+    ])
+    keyboard.append([
+        InlineKeyboardButton(get_text('back_to_main', lang), callback_data=encode('back_to_main'))
+    ])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+async def get_menu_screen(render, restaurant_id: int, category: str = None, lang: str = None):
+    """
+    Экран меню из кэша (или отрисованный и сохранённый)
+    
+    render - одна из функций render_*: с category рисует блюда категории,
+    без неё - список категорий. None - ресторана нет или показать нечего.
+    """
+    # Версию читаем до данных: экран, нарисованный по более новым данным,
+    # под старой версией не попадёт к читателям новой
+    version = db.catalog.version
+    key = (render.__name__, restaurant_id, category, lang)
+    screen = screens.get(version, key)
+    if screen is not None:
+        return screen
+    
+    restaurant = await db.get_restaurant(restaurant_id)
+    if not restaurant:
+        return None
+    categories = await db.get_menu_by_category(restaurant_id)
+    if category is None:
+        if not categories:
+            return None
+        screen = render(restaurant, categories, lang)
+    else:
+        items = categories.get(category)
+        if not items:
+            return None
+        screen = render(restaurant, category, items, lang)
+    return screens.put(version, key, screen)
 
 
 # ========== Общие команды ==========
@@ -112,8 +279,8 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     # Добавляем пользователя в БД если его нет
-    lang = db.get_user_language(user.id)
-    db.add_user(
+    lang = await db.get_user_language(user.id)
+    await db.add_user(
         user_id=user.id,
         username=user.username or "",
         first_name=user.first_name or "",
@@ -122,12 +289,12 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     
     # Проверяем доступ
-    access_status = db.get_user_access_status(user.id)
+    access_status = await db.get_user_access_status(user.id)
     
     # Админ всегда имеет доступ
     if user.id == int(config.ADMIN_ID):
         access_status = 'approved'
-        db.approve_user(user.id)
+        await db.approve_user(user.id)
     
     # Если доступ не одобрен - показываем форму запроса
     if access_status != 'approved':
@@ -152,17 +319,17 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Создаём интерактивное меню
     keyboard = [
-        [InlineKeyboardButton(get_text('btn_start_voting', lang), callback_data="start_lunch")],
-        [InlineKeyboardButton(get_text('btn_menu_list', lang), callback_data="show_menu_list")],
-        [InlineKeyboardButton(get_text('btn_results', lang), callback_data="show_results"),
-         InlineKeyboardButton(get_text('btn_participants', lang), callback_data="show_participants")],
-        [InlineKeyboardButton(get_text('btn_my_order', lang), callback_data="show_my_order")],
-        [InlineKeyboardButton(get_text('btn_language', lang), callback_data="change_language")],
+        [InlineKeyboardButton(get_text('btn_start_voting', lang), callback_data=encode('start_lunch'))],
+        [InlineKeyboardButton(get_text('btn_menu_list', lang), callback_data=encode('show_menu_list'))],
+        [InlineKeyboardButton(get_text('btn_results', lang), callback_data=encode('show_results')),
+         InlineKeyboardButton(get_text('btn_participants', lang), callback_data=encode('show_participants'))],
+        [InlineKeyboardButton(get_text('btn_my_order', lang), callback_data=encode('show_my_order'))],
+        [InlineKeyboardButton(get_text('btn_language', lang), callback_data=encode('change_language'))],
     ]
     
     # Добавляем админ панель если это админ
     if user.id == int(config.ADMIN_ID):
-        keyboard.append([InlineKeyboardButton(get_text('btn_admin_panel', lang), callback_data="admin_panel")])
+        keyboard.append([InlineKeyboardButton(get_text('btn_admin_panel', lang), callback_data=encode('admin_panel'))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -202,21 +369,21 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def lunch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /lunch - начать голосование"""
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
     # Проверяем, есть ли уже активное голосование
-    active_poll = db.get_active_poll()
+    active_poll = await db.get_active_poll()
     
     if not active_poll:
         # Создаем новое голосование
-        poll_id = db.create_poll(user_id)
+        poll_id = await db.create_poll(user_id)
         context.user_data['current_poll_id'] = poll_id
     else:
         poll_id = active_poll['id']
         context.user_data['current_poll_id'] = poll_id
     
     # Получаем список ресторанов
-    restaurants = db.get_all_restaurants()
+    restaurants = await db.get_all_restaurants()
     
     if not restaurants:
         await update.message.reply_text(get_text('no_restaurants_short', lang))
@@ -230,26 +397,26 @@ async def lunch_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard.append([
             InlineKeyboardButton(
                 f"{emoji} {restaurant['name']}", 
-                callback_data=f"vote_{restaurant['id']}"
+                callback_data=encode('vote', restaurant['id'])
             )
         ])
     
     # Добавляем кнопки управления (улучшенный порядок)
     keyboard.append([
-        InlineKeyboardButton(get_text('btn_participants', lang), callback_data="show_participants"),
-        InlineKeyboardButton(get_text('btn_results', lang), callback_data="show_results")
+        InlineKeyboardButton(get_text('btn_participants', lang), callback_data=encode('show_participants')),
+        InlineKeyboardButton(get_text('btn_results', lang), callback_data=encode('show_results'))
     ])
     keyboard.append([
-        InlineKeyboardButton(get_text('btn_menu_restaurants', lang), callback_data="show_menu_list")
+        InlineKeyboardButton(get_text('btn_menu_restaurants', lang), callback_data=encode('show_menu_list'))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     # Получаем текущие голоса
-    user_vote = db.get_user_vote(poll_id, user_id)
+    user_vote = await db.get_user_vote(poll_id, user_id)
     vote_text = ""
     if user_vote:
-        restaurant = db.get_restaurant(user_vote)
+        restaurant = await db.get_restaurant(user_vote)
         if restaurant:
             rest_emoji = restaurant.get('emoji', '🍽️')
             vote_text = f"\n\n{get_text('your_choice', lang)} {rest_emoji} <b>{restaurant['name']}</b>"
@@ -268,14 +435,14 @@ async def vote_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
-    restaurant_id = int(query.data.split('_')[1])
+    lang = await db.get_user_language(user_id)
+    restaurant_id, = context.args
     
     # Получаем активное голосование
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
         keyboard = [[
-            InlineKeyboardButton(get_text('back_to_voting', lang), callback_data="back_to_voting")
+            InlineKeyboardButton(get_text('back_to_voting', lang), callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(get_text('voting_not_found', lang), reply_markup=reply_markup)
@@ -284,22 +451,22 @@ async def vote_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     poll_id = poll['id']
     
     # Добавляем голос
-    db.add_vote(poll_id, user_id, restaurant_id)
+    await db.add_vote(poll_id, user_id, restaurant_id)
     
     # Автоматически записываем на обед
-    db.add_participant(poll_id, user_id)
+    await db.add_participant(poll_id, user_id)
     
     # Получаем информацию о ресторане
-    restaurant = db.get_restaurant(restaurant_id)
+    restaurant = await db.get_restaurant(restaurant_id)
     rest_emoji = restaurant.get('emoji', '🍽️')
     
     # Добавляем кнопки для перехода к результатам или возврата к голосованию
     keyboard = [
         [
-            InlineKeyboardButton(get_text('btn_results', lang), callback_data="show_results"),
-            InlineKeyboardButton(get_text('btn_participants', lang), callback_data="show_participants")
+            InlineKeyboardButton(get_text('btn_results', lang), callback_data=encode('show_results')),
+            InlineKeyboardButton(get_text('btn_participants', lang), callback_data=encode('show_participants'))
         ],
-        [InlineKeyboardButton(get_text('back_to_voting', lang), callback_data="back_to_voting")]
+        [InlineKeyboardButton(get_text('back_to_voting', lang), callback_data=encode('back_to_voting'))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -313,78 +480,62 @@ async def vote_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def results_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /results - показать результаты голосования"""
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         await update.message.reply_text(get_text('voting_not_started', lang))
         return
     
-    poll_id = poll['id']
-    votes = db.get_poll_votes(poll_id)
-    participants = db.get_participants(poll_id)
+    # Голоса, участники и меню лидера - одним вызовом
+    scoreboard = await db.get_poll_scoreboard(poll['id'])
+    participant_count = scoreboard['participant_count']
     
-    if not votes or all(v[2] == 0 for v in votes):
+    if not scoreboard['total_votes']:
         await update.message.reply_text(get_text('no_votes_yet', lang))
         return
     
     result_text = f"{get_text('voting_results', lang)}\n\n"
-    
-    # Находим победителя
-    winner_id = None
     max_votes = 0
     
-    for idx, (rest_id, rest_name, vote_count) in enumerate(votes, 1):
+    for idx, tally in enumerate(scoreboard['tallies'], 1):
+        vote_count = tally['votes']
         if vote_count > 0:
-            # Получаем emoji для ресторана
-            restaurant = db.get_restaurant(rest_id)
-            rest_emoji = restaurant.get('emoji', '🍽️') if restaurant else '🍽️'
-            bar = "🟩" * vote_count + "⬜" * (len(participants) - vote_count) if participants else "🟩" * vote_count
+            bar = "🟩" * vote_count + "⬜" * (participant_count - vote_count) if participant_count else "🟩" * vote_count
             
             # Отмечаем лидера
-            leader_mark = "🏆 " if vote_count >= max_votes and vote_count > 0 else ""
-            result_text += f"{leader_mark}{idx}. {rest_emoji} <b>{rest_name}</b>\n   {bar} {vote_count} голос(ов)\n\n"
-            
-            if vote_count > max_votes:
-                max_votes = vote_count
-                winner_id = rest_id
+            leader_mark = "🏆 " if vote_count >= max_votes else ""
+            result_text += f"{leader_mark}{idx}. {tally['emoji']} <b>{tally['name']}</b>\n   {bar} {vote_count} голос(ов)\n\n"
+            max_votes = max(max_votes, vote_count)
     
-    result_text += f"\n{get_text('participants_count', lang)} {len(participants)}\n"
+    result_text += f"\n{get_text('participants_count', lang)} {participant_count}\n"
     
     # Показываем категории меню ПОБЕДИТЕЛЯ голосования
-    if winner_id:
-        winner_restaurant = db.get_restaurant(winner_id)
-        menu_items = db.get_restaurant_menu(winner_id)
+    winner_restaurant = scoreboard['winner']
+    if winner_restaurant:
+        winner_id = winner_restaurant['id']
         
-        if winner_restaurant and menu_items:
+        if scoreboard['winner_categories']:
             rest_emoji = winner_restaurant.get('emoji', '🍽️')
             result_text += f"\n{rest_emoji} <b>{get_text('menu_restaurant', lang)} \"{winner_restaurant['name']}\":</b>\n"
             result_text += get_text('select_category', lang)
             
-            # Группируем блюда по категориям
-            categories = {}
-            for item in menu_items:
-                category = item['category']
-                if category not in categories:
-                    categories[category] = []
-                categories[category].append(item)
-            
             # Создаём кнопки для категорий
             keyboard = []
-            for category in sorted(categories.keys()):
+            for category, item_count in scoreboard['winner_categories']:
                 category_emoji = get_category_emoji(category)
                 category_name = get_category_name(category, lang)
                 keyboard.append([
                     InlineKeyboardButton(
-                        f"{category_emoji} {category_name} ({len(categories[category])})",
-                        callback_data=f"results_cat_{winner_id}_{category}"
+                        f"{category_emoji} {category_name} ({item_count})",
+                        callback_data=encode('results_cat', winner_id, category or DEFAULT_CATEGORY)
                     )
                 ])
             
             # Кнопка "Выбрать блюда"
             keyboard.append([
-                InlineKeyboardButton(get_text('btn_select_dishes', lang), callback_data=f"order_from_{winner_id}")
+                InlineKeyboardButton(get_text('btn_select_dishes', lang), callback_data=encode('order_from', winner_id))
             ])
             
             reply_markup = InlineKeyboardMarkup(keyboard)
@@ -401,92 +552,75 @@ async def show_results_callback(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         keyboard = [[
-            InlineKeyboardButton(get_text('to_main_menu', lang), callback_data="back_to_voting")
+            InlineKeyboardButton(get_text('to_main_menu', lang), callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(get_text('voting_not_found', lang), reply_markup=reply_markup)
         return
     
-    poll_id = poll['id']
-    votes = db.get_poll_votes(poll_id)
-    participants = db.get_participants(poll_id)
+    # Голоса, участники и меню лидера - одним вызовом
+    scoreboard = await db.get_poll_scoreboard(poll['id'])
     
-    if not votes or all(v[2] == 0 for v in votes):
+    if not scoreboard['total_votes']:
         keyboard = [[
-            InlineKeyboardButton(get_text('back_to_voting', lang), callback_data="back_to_voting")
+            InlineKeyboardButton(get_text('back_to_voting', lang), callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(get_text('no_votes_yet', lang), reply_markup=reply_markup)
         return
     
     result_text = f"{get_text('voting_results', lang)}\n\n"
-    
-    # Находим победителя
-    winner_id = None
     max_votes = 0
     
-    for idx, (rest_id, rest_name, vote_count) in enumerate(votes, 1):
+    for idx, tally in enumerate(scoreboard['tallies'], 1):
+        vote_count = tally['votes']
         if vote_count > 0:
-            # Получаем emoji для ресторана
-            restaurant = db.get_restaurant(rest_id)
-            rest_emoji = restaurant.get('emoji', '🍽️') if restaurant else '🍽️'
             bar = "🟩" * vote_count
             
             # Отмечаем лидера
             leader_mark = "🏆 " if vote_count > max_votes else ""
-            result_text += f"{leader_mark}{idx}. {rest_emoji} <b>{rest_name}</b>: {bar} {vote_count}\n"
-            
-            if vote_count > max_votes:
-                max_votes = vote_count
-                winner_id = rest_id
+            result_text += f"{leader_mark}{idx}. {tally['emoji']} <b>{tally['name']}</b>: {bar} {vote_count}\n"
+            max_votes = max(max_votes, vote_count)
     
-    result_text += f"\n{get_text('participants_count', lang)} {len(participants)}"
+    result_text += f"\n{get_text('participants_count', lang)} {scoreboard['participant_count']}"
     
     # Показываем категории меню ПОБЕДИТЕЛЯ голосования
     keyboard = []
-    if winner_id:
-        winner_restaurant = db.get_restaurant(winner_id)
-        menu_items = db.get_restaurant_menu(winner_id)
+    winner_restaurant = scoreboard['winner']
+    if winner_restaurant:
+        winner_id = winner_restaurant['id']
         
-        if winner_restaurant and menu_items:
+        if scoreboard['winner_categories']:
             rest_emoji = winner_restaurant.get('emoji', '🍽️')
             result_text += f"\n\n{rest_emoji} <b>{get_text('menu_restaurant', lang)} \"{winner_restaurant['name']}\":</b>\n"
             result_text += get_text('select_category', lang)
             
-            # Группируем блюда по категориям
-            categories = {}
-            for item in menu_items:
-                category = item['category']
-                if category not in categories:
-                    categories[category] = []
-                categories[category].append(item)
-            
             # Создаём кнопки для категорий
-            for category in sorted(categories.keys()):
+            for category, item_count in scoreboard['winner_categories']:
                 category_emoji = get_category_emoji(category)
                 category_name = get_category_name(category, lang)
                 keyboard.append([
                     InlineKeyboardButton(
-                        f"{category_emoji} {category_name} ({len(categories[category])})",
-                        callback_data=f"results_cat_{winner_id}_{category}"
+                        f"{category_emoji} {category_name} ({item_count})",
+                        callback_data=encode('results_cat', winner_id, category or DEFAULT_CATEGORY)
                     )
                 ])
             
             # Кнопка "Выбрать блюда"
             keyboard.append([
-                InlineKeyboardButton(get_text('btn_select_dishes', lang), callback_data=f"order_from_{winner_id}")
+                InlineKeyboardButton(get_text('btn_select_dishes', lang), callback_data=encode('order_from', winner_id))
             ])
     
     # Добавляем навигационные кнопки
     keyboard.append([
-        InlineKeyboardButton(get_text('btn_participants', lang), callback_data="show_participants"),
-        InlineKeyboardButton(get_text('back_to_voting', lang), callback_data="back_to_voting")
+        InlineKeyboardButton(get_text('btn_participants', lang), callback_data=encode('show_participants')),
+        InlineKeyboardButton(get_text('back_to_voting', lang), callback_data=encode('back_to_voting'))
     ])
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -499,26 +633,19 @@ async def show_results_category_callback(update: Update, context: ContextTypes.D
     await query.answer()
     
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    # Парсим callback_data: results_cat_{restaurant_id}_{category}
-    parts = query.data.split('_', 3)
-    if len(parts) < 4:
-        await query.answer(get_text('error_loading', lang), show_alert=True)
-        return
-    
-    restaurant_id = int(parts[2])
-    category = parts[3]
+    restaurant_id, category = context.args
     
-    restaurant = db.get_restaurant(restaurant_id)
-    menu_items = db.get_restaurant_menu(restaurant_id)
+    restaurant = await db.get_restaurant(restaurant_id)
+    menu_items = await db.get_restaurant_menu(restaurant_id)
     
     if not restaurant or not menu_items:
         await query.answer(get_text('no_menu', lang, name=restaurant['name'] if restaurant else ''), show_alert=True)
         return
     
     # Фильтруем блюда по категории
-    category_items = [item for item in menu_items if item['category'] == category]
+    category_items = [item for item in menu_items if (item['category'] or DEFAULT_CATEGORY) == category]
     
     if not category_items:
         await query.answer(get_text('error_loading', lang), show_alert=True)
@@ -542,13 +669,11 @@ async def show_results_category_callback(update: Update, context: ContextTypes.D
     await update.effective_chat.send_message(header_text, parse_mode='HTML')
     
     # Отправляем каждое блюдо как отдельную карточку с фото
-    for idx, item in enumerate(category_items, 1):
+    for item in category_items:
         await send_dish_card(
             update.effective_chat.id,
             item,
             restaurant_id,
-            idx,
-            len(category_items),
             category,
             lang,
             context
@@ -556,13 +681,13 @@ async def show_results_category_callback(update: Update, context: ContextTypes.D
     
     # Отправляем финальное сообщение с кнопками навигации
     final_keyboard = [
-        [InlineKeyboardButton(get_text('back_to_categories', lang), callback_data="show_results")],
-        [InlineKeyboardButton(get_text('btn_select_dishes', lang), callback_data=f"order_from_{restaurant_id}")],
+        [InlineKeyboardButton(get_text('back_to_categories', lang), callback_data=encode('show_results'))],
+        [InlineKeyboardButton(get_text('btn_select_dishes', lang), callback_data=encode('order_from', restaurant_id))],
         [
-            InlineKeyboardButton(get_text('btn_participants', lang), callback_data="show_participants"),
-            InlineKeyboardButton(get_text('btn_my_order', lang), callback_data="show_my_order")
+            InlineKeyboardButton(get_text('btn_participants', lang), callback_data=encode('show_participants')),
+            InlineKeyboardButton(get_text('btn_my_order', lang), callback_data=encode('show_my_order'))
         ],
-        [InlineKeyboardButton(get_text('back_to_main', lang), callback_data="back_to_main")]
+        [InlineKeyboardButton(get_text('back_to_main', lang), callback_data=encode('back_to_main'))]
     ]
     final_markup = InlineKeyboardMarkup(final_keyboard)
     
@@ -572,7 +697,7 @@ async def show_results_category_callback(update: Update, context: ContextTypes.D
     )
 
 
-async def send_dish_card(chat_id, item, restaurant_id, index, total, category, lang, context):
+async def send_dish_card(chat_id, item, restaurant_id, category, lang, context):
     """Отправить карточку блюда с фото"""
     
     # Формируем текст карточки
@@ -602,16 +727,10 @@ async def send_dish_card(chat_id, item, restaurant_id, index, total, category, l
     keyboard = [
         [InlineKeyboardButton(
             f"➕ {get_text('add_to_cart', lang)}",
-            callback_data=f"add_item_{restaurant_id}_{item['id']}_{category}"
+            callback_data=encode('add_item', item['id'])
         )]
     ]
     
-    # Добавляем навигацию если не последнее блюдо
-    if index < total:
-        keyboard.append([
-            InlineKeyboardButton(get_text('next_dish', lang), callback_data=f"next_dish_{index}")
-        ])
-    
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     # Отправляем фото если есть, иначе просто текст
@@ -666,9 +785,9 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /join - записаться на обед"""
     user_id = update.effective_user.id
     user_name = update.effective_user.first_name
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         await update.message.reply_text(get_text('voting_not_started', lang))
@@ -677,9 +796,9 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     poll_id = poll['id']
     
     # Проверяем, уже записан ли пользователь
-    if db.is_participant(poll_id, user_id):
+    if await db.is_participant(poll_id, user_id):
         keyboard = [[
-            InlineKeyboardButton("❌ Отменить участие", callback_data="leave_lunch")
+            InlineKeyboardButton("❌ Отменить участие", callback_data=encode('leave_lunch'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text(
@@ -689,9 +808,9 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     # Записываем на обед
-    db.add_participant(poll_id, user_id)
+    await db.add_participant(poll_id, user_id)
     
-    participants = db.get_participants(poll_id)
+    participants = await db.get_participants(poll_id)
     
     await update.message.reply_text(
         f"✅ {user_name}, вы записаны на обед!\n"
@@ -703,16 +822,16 @@ async def join_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def participants_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /participants - список участников"""
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         await update.message.reply_text(get_text('voting_not_started', lang))
         return
     
     poll_id = poll['id']
-    participants = db.get_participants(poll_id)
+    participants = await db.get_participants(poll_id)
     
     if not participants:
         await update.message.reply_text(f"👥 {get_text('no_participants', lang)}")
@@ -737,22 +856,22 @@ async def show_participants_callback(update: Update, context: ContextTypes.DEFAU
     query = update.callback_query
     await query.answer()
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         keyboard = [[
-            InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+            InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text("❌ Голосование не найдено.", reply_markup=reply_markup)
         return
     
     poll_id = poll['id']
-    participants = db.get_participants(poll_id)
+    participants = await db.get_participants(poll_id)
     
     if not participants:
         keyboard = [[
-            InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+            InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text("👥 Пока никто не записался.", reply_markup=reply_markup)
@@ -768,7 +887,7 @@ async def show_participants_callback(update: Update, context: ContextTypes.DEFAU
     
     # Добавляем кнопку возврата к голосованию
     keyboard = [[
-        InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+        InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
     ]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -781,23 +900,23 @@ async def leave_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         keyboard = [[
-            InlineKeyboardButton(get_text('back_to_voting', lang), callback_data="back_to_voting")
+            InlineKeyboardButton(get_text('back_to_voting', lang), callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(get_text('voting_not_found', lang), reply_markup=reply_markup)
         return
     
     poll_id = poll['id']
-    db.remove_participant(poll_id, user_id)
+    await db.remove_participant(poll_id, user_id)
     
     keyboard = [[
-        InlineKeyboardButton(get_text('back_to_voting', lang), callback_data="back_to_voting")
+        InlineKeyboardButton(get_text('back_to_voting', lang), callback_data=encode('back_to_voting'))
     ]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -809,9 +928,9 @@ async def leave_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /menu - показать меню ресторана"""
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    restaurants = db.get_all_restaurants()
+    restaurants = await db.get_all_restaurants()
     
     if not restaurants:
         await update.message.reply_text(get_text('no_restaurants_available', lang))
@@ -822,7 +941,7 @@ async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         keyboard.append([
             InlineKeyboardButton(
                 f"📋 {restaurant['name']}", 
-                callback_data=f"menu_{restaurant['id']}"
+                callback_data=encode('menu', restaurant['id'])
             )
         ])
     
@@ -840,18 +959,17 @@ async def show_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    restaurant_id = int(query.data.split('_')[1])
-    restaurant = db.get_restaurant(restaurant_id)
-    
-    if not restaurant:
-        await query.edit_message_text("❌ Ресторан не найден.")
-        return
-    
-    menu_items = db.get_restaurant_menu(restaurant_id)
+    restaurant_id, = context.args
+    screen = await get_menu_screen(render_menu_categories, restaurant_id)
     
-    if not menu_items:
+    if screen is None:
+        restaurant = await db.get_restaurant(restaurant_id)
+        if not restaurant:
+            await query.edit_message_text("❌ Ресторан не найден.")
+            return
+        
         keyboard = [[
-            InlineKeyboardButton("🏠 На главную", callback_data="back_to_main")
+            InlineKeyboardButton("🏠 На главную", callback_data=encode('back_to_main'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
@@ -862,34 +980,7 @@ async def show_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return
     
-    # Группируем по категориям
-    categories = {}
-    for item in menu_items:
-        category = item['category'] or 'Основное меню'
-        if category not in categories:
-            categories[category] = []
-        categories[category].append(item)
-    
-    # Создаем кнопки для выбора категории
-    keyboard = []
-    for category in categories.keys():
-        keyboard.append([
-            InlineKeyboardButton(f"📂 {category}", callback_data=f"category_{restaurant_id}_{category}")
-        ])
-    
-    keyboard.append([
-        InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    menu_header = f"📋 <b>Меню: {restaurant['name']}</b>\n\n"
-    if restaurant['address']:
-        menu_header += f"📍 {restaurant['address']}\n"
-    if restaurant['phone']:
-        menu_header += f"📞 {restaurant['phone']}\n"
-    menu_header += f"\n<i>Выберите категорию:</i>"
-    
+    menu_header, reply_markup = screen
     await query.edit_message_text(menu_header, parse_mode='HTML', reply_markup=reply_markup)
 
 
@@ -898,53 +989,23 @@ async def show_category_callback(update: Update, context: ContextTypes.DEFAULT_T
     query = update.callback_query
     await query.answer()
     
-    # Разбираем callback_data: category_restaurant_id_category_name
-    parts = query.data.split('_', 2)
-    restaurant_id = int(parts[1])
-    category = parts[2]
+    restaurant_id, category = context.args
     
-    restaurant = db.get_restaurant(restaurant_id)
-    if not restaurant:
-        await query.edit_message_text("❌ Ресторан не найден.")
-        return
+    screen = await get_menu_screen(render_menu_category, restaurant_id, category)
     
-    menu_items = db.get_restaurant_menu(restaurant_id)
-    
-    # Фильтруем по категории
-    category_items = [item for item in menu_items if (item['category'] or 'Основное меню') == category]
-    
-    if not category_items:
+    if screen is None:
+        if not await db.get_restaurant(restaurant_id):
+            await query.edit_message_text("❌ Ресторан не найден.")
+            return
+        
         keyboard = [[
-            InlineKeyboardButton("◀️ Назад к меню", callback_data=f"menu_{restaurant_id}")
+            InlineKeyboardButton("◀️ Назад к меню", callback_data=encode('menu', restaurant_id))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text("❌ В этой категории пока нет блюд.", reply_markup=reply_markup)
         return
     
-    menu_text = f"📋 <b>{restaurant['name']}</b>\n"
-    menu_text += f"📂 <b>{category}</b>\n\n"
-    menu_text += "<i>Нажмите на блюдо, чтобы добавить в заказ:</i>\n\n"
-    
-    # Создаем кнопки для каждого блюда
-    keyboard = []
-    for item in category_items:
-        price = f"{item['price']:.0f} ֏" if item['price'] else ""
-        button_text = f"{item['name']} - {price}"
-        # Ограничиваем длину текста кнопки
-        if len(button_text) > 60:
-            button_text = button_text[:57] + "..."
-        keyboard.append([
-            InlineKeyboardButton(button_text, callback_data=f"order_{item['id']}")
-        ])
-    
-    # Добавляем кнопки навигации
-    keyboard.append([
-        InlineKeyboardButton("🛒 Мой заказ", callback_data="my_orders"),
-        InlineKeyboardButton("◀️ Назад", callback_data=f"menu_{restaurant_id}")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    menu_text, reply_markup = screen
     await query.edit_message_text(menu_text, parse_mode='HTML', reply_markup=reply_markup)
 
 
@@ -953,11 +1014,11 @@ async def add_order_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    menu_item_id = int(query.data.split('_')[1])
+    menu_item_id, = context.args
     user_id = update.effective_user.id
     
     # Получаем активное голосование
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
         await query.answer("❌ Нет активного голосования", show_alert=True)
         return
@@ -965,17 +1026,13 @@ async def add_order_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     poll_id = poll['id']
     
     # Добавляем пользователя как участника
-    db.add_participant(poll_id, user_id)
+    await db.add_participant(poll_id, user_id)
     
-    # Добавляем заказ
-    db.add_order(poll_id, user_id, menu_item_id)
+    # Добавляем заказ (ещё одна порция, если блюдо уже в корзине)
+    await carts.increment(poll_id, user_id, menu_item_id)
     
     # Получаем информацию о блюде
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM menu_items WHERE id = ?', (menu_item_id,))
-    item = dict(cursor.fetchone())
-    conn.close()
+    item = await db.get_menu_item(menu_item_id)
     
     await query.answer(f"✅ {item['name']} добавлено в заказ!", show_alert=True)
 
@@ -987,17 +1044,18 @@ async def my_orders_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     user_id = update.effective_user.id
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
         await query.edit_message_text("❌ Нет активного голосования")
         return
     
     poll_id = poll['id']
-    orders = db.get_user_orders(poll_id, user_id)
+    await carts.flush(poll_id, user_id)
+    orders = await db.get_user_orders(poll_id, user_id)
     
     if not orders:
         keyboard = [[
-            InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+            InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
@@ -1027,14 +1085,14 @@ async def my_orders_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     for order in orders:
         button_text = f"❌ {order['name'][:30]}"
         keyboard.append([
-            InlineKeyboardButton(button_text, callback_data=f"remove_order_{order['menu_item_id']}")
+            InlineKeyboardButton(button_text, callback_data=encode('remove_order', order['menu_item_id']))
         ])
     
     keyboard.append([
-        InlineKeyboardButton("🗑 Очистить заказ", callback_data="clear_orders")
+        InlineKeyboardButton("🗑 Очистить заказ", callback_data=encode('clear_orders'))
     ])
     keyboard.append([
-        InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+        InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1046,12 +1104,12 @@ async def remove_order_callback(update: Update, context: ContextTypes.DEFAULT_TY
     """Удалить блюдо из заказа"""
     query = update.callback_query
     
-    menu_item_id = int(query.data.split('_')[2])
+    menu_item_id, = context.args
     user_id = update.effective_user.id
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if poll:
-        db.remove_order(poll['id'], user_id, menu_item_id)
+        await carts.remove(poll['id'], user_id, menu_item_id)
         await query.answer("✅ Удалено из заказа")
         # Обновляем отображение заказа
         await my_orders_callback(update, context)
@@ -1066,12 +1124,12 @@ async def clear_orders_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     user_id = update.effective_user.id
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if poll:
-        db.clear_user_orders(poll['id'], user_id)
+        await carts.clear(poll['id'], user_id)
         
         keyboard = [[
-            InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+            InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
@@ -1091,11 +1149,11 @@ async def show_menu_list_callback(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    restaurants = db.get_all_restaurants()
+    restaurants = await db.get_all_restaurants()
     
     if not restaurants:
         keyboard = [[
-            InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+            InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
         ]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text("❌ Нет доступных ресторанов.", reply_markup=reply_markup)
@@ -1106,13 +1164,13 @@ async def show_menu_list_callback(update: Update, context: ContextTypes.DEFAULT_
         keyboard.append([
             InlineKeyboardButton(
                 f"📋 {restaurant['name']}", 
-                callback_data=f"menu_{restaurant['id']}"
+                callback_data=encode('menu', restaurant['id'])
             )
         ])
     
     # Добавляем кнопку возврата
     keyboard.append([
-        InlineKeyboardButton("🏠 К голосованию", callback_data="back_to_voting")
+        InlineKeyboardButton("🏠 К голосованию", callback_data=encode('back_to_voting'))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1132,15 +1190,15 @@ async def back_to_voting_callback(update: Update, context: ContextTypes.DEFAULT_
     user_id = update.effective_user.id
     
     # Получаем или создаем активное голосование
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
-        poll_id = db.create_poll(user_id)
+        poll_id = await db.create_poll(user_id)
     else:
         poll_id = poll['id']
     
     # Получаем список ресторанов
-    restaurants = db.get_all_restaurants()
+    restaurants = await db.get_all_restaurants()
     
     if not restaurants:
         await query.edit_message_text(
@@ -1155,27 +1213,27 @@ async def back_to_voting_callback(update: Update, context: ContextTypes.DEFAULT_
         keyboard.append([
             InlineKeyboardButton(
                 f"🍽️ {restaurant['name']}", 
-                callback_data=f"vote_{restaurant['id']}"
+                callback_data=encode('vote', restaurant['id'])
             )
         ])
     
     # Добавляем кнопки управления
     keyboard.append([
-        InlineKeyboardButton("📊 Результаты", callback_data="show_results"),
-        InlineKeyboardButton("👥 Участники", callback_data="show_participants")
+        InlineKeyboardButton("📊 Результаты", callback_data=encode('show_results')),
+        InlineKeyboardButton("👥 Участники", callback_data=encode('show_participants'))
     ])
     keyboard.append([
-        InlineKeyboardButton("📋 Меню ресторанов", callback_data="show_menu_list"),
-        InlineKeyboardButton("🛒 Мой заказ", callback_data="my_orders")
+        InlineKeyboardButton("📋 Меню ресторанов", callback_data=encode('show_menu_list')),
+        InlineKeyboardButton("🛒 Мой заказ", callback_data=encode('my_orders'))
     ])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     # Получаем текущие голоса
-    user_vote = db.get_user_vote(poll_id, user_id)
+    user_vote = await db.get_user_vote(poll_id, user_id)
     vote_text = ""
     if user_vote:
-        restaurant = db.get_restaurant(user_vote)
+        restaurant = await db.get_restaurant(user_vote)
         if restaurant:
             vote_text = f"\n\n✅ Ваш выбор: {restaurant['name']}"
     
@@ -1190,7 +1248,7 @@ async def back_to_voting_callback(update: Update, context: ContextTypes.DEFAULT_
 async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /cancel - отменить участие"""
     user_id = update.effective_user.id
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         await update.message.reply_text("❌ Активного голосования нет.")
@@ -1198,11 +1256,11 @@ async def cancel_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     poll_id = poll['id']
     
-    if not db.is_participant(poll_id, user_id):
+    if not await db.is_participant(poll_id, user_id):
         await update.message.reply_text("❌ Вы не записаны на обед.")
         return
     
-    db.remove_participant(poll_id, user_id)
+    await db.remove_participant(poll_id, user_id)
     await update.message.reply_text("✅ Вы отменили участие в обеде.")
 
 
@@ -1214,70 +1272,22 @@ async def order_from_restaurant_callback(update: Update, context: ContextTypes.D
     await query.answer()
     
     user_id = update.effective_user.id
-    restaurant_id = int(query.data.split('_')[2])
+    restaurant_id, = context.args
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
         await query.edit_message_text("❌ Голосование завершено.")
         return
     
-    poll_id = poll['id']
-    restaurant = db.get_restaurant(restaurant_id)
-    menu_items = db.get_restaurant_menu(restaurant_id)
+    screen = await get_menu_screen(render_order_categories, restaurant_id)
     
-    if not menu_items:
-        await query.edit_message_text(f"❌ В ресторане {restaurant['name']} пока нет меню.")
+    if screen is None:
+        restaurant = await db.get_restaurant(restaurant_id)
+        name = restaurant['name'] if restaurant else ''
+        await query.edit_message_text(f"❌ В ресторане {name} пока нет меню.")
         return
     
-    rest_emoji = restaurant.get('emoji', '🍽️')
-    
-    # Группируем по категориям
-    categories = {}
-    for item in menu_items:
-        category = item['category'] or 'Основное меню'
-        if category not in categories:
-            categories[category] = []
-        categories[category].append(item)
-    
-    # Определяем порядок категорий
-    category_order = [
-        "Холодные закуски", "Горячие закуски", "Салаты", "Супы",
-        "Шашлыки", "Горячие блюда", "Гарниры", "Десерты", "Напитки"
-    ]
-    
-    sorted_categories = []
-    for cat in category_order:
-        if cat in categories:
-            sorted_categories.append(cat)
-    for cat in categories.keys():
-        if cat not in category_order:
-            sorted_categories.append(cat)
-    
-    # Формируем текст
-    text = f"╔═══════════════════════╗\n"
-    text += f"   🛒 <b>{restaurant['name'].upper()}</b> {rest_emoji}\n"
-    text += f"╚═══════════════════════╝\n\n"
-    text += "📋 <b>Выберите категорию:</b>"
-    
-    # Создаём кнопки для каждой категории
-    keyboard = []
-    for category in sorted_categories:
-        category_emoji = get_category_emoji(category)
-        item_count = len(categories[category])
-        keyboard.append([
-            InlineKeyboardButton(
-                f"{category_emoji} {category} ({item_count})",
-                callback_data=f"order_cat_{restaurant_id}_{category}"
-            )
-        ])
-    
-    # Добавляем кнопки управления
-    keyboard.append([
-        InlineKeyboardButton("🛒 Моя корзина", callback_data=f"show_cart_{restaurant_id}"),
-        InlineKeyboardButton("🏠 Назад", callback_data="show_results")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text, reply_markup = screen
     await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
 
 
@@ -1286,107 +1296,66 @@ async def show_category_dishes_callback(update: Update, context: ContextTypes.DE
     query = update.callback_query
     await query.answer()
     
-    # Парсим callback_data: order_cat_{restaurant_id}_{category}
-    parts = query.data.split('_', 3)
-    restaurant_id = int(parts[2])
-    category = parts[3]
+    restaurant_id, category = context.args
     
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
         await query.edit_message_text("❌ Голосование завершено.")
         return
     
-    poll_id = poll['id']
-    restaurant = db.get_restaurant(restaurant_id)
-    menu_items = db.get_restaurant_menu(restaurant_id)
-    
-    # Фильтруем блюда по категории
-    category_items = [item for item in menu_items if (item['category'] or 'Основное меню') == category]
+    screen = await get_menu_screen(render_order_category, restaurant_id, category, lang)
     
-    if not category_items:
+    if screen is None:
         await query.edit_message_text(f"❌ В категории {category} нет блюд.")
         return
     
-    rest_emoji = restaurant.get('emoji', '🍽️')
-    category_emoji = get_category_emoji(category)
-    
-    # Формируем текст с блюдами
-    text = f"╔═══════════════════════╗\n"
-    text += f"   {rest_emoji} <b>{restaurant['name'].upper()}</b>\n"
-    text += f"╚═══════════════════════╝\n\n"
-    text += f"┌─ {category_emoji} <b>{category}</b>\n"
-    text += f"│\n"
-    
-    for item in category_items:
-        price = f"{int(item['price'])}" if item['price'] else "—"
-        text += f"│  • {item['name']}\n"
-        text += f"│    💰 <b>{price} ֏</b>\n"
-    
-    text += f"└{'─' * 25}\n\n"
-    text += "<i>Нажмите на блюдо чтобы добавить в корзину</i>"
-    
-    # Создаём кнопки для каждого блюда
-    keyboard = []
-    for item in category_items:
-        price = f"{int(item['price'])}֏" if item['price'] else ""
-        keyboard.append([
-            InlineKeyboardButton(
-                f"➕ {item['name']} ({price})",
-                callback_data=f"add_item_{item['id']}_{restaurant_id}_{category}"
-            )
-        ])
-    
-    # Добавляем кнопки управления
-    keyboard.append([
-        InlineKeyboardButton("⬅️ Назад к категориям", callback_data=f"order_from_{restaurant_id}"),
-        InlineKeyboardButton("🛒 Корзина", callback_data=f"show_cart_{restaurant_id}")
-    ])
-    keyboard.append([
-        InlineKeyboardButton(get_text('btn_participants', lang), callback_data="show_participants"),
-        InlineKeyboardButton(get_text('btn_results', lang), callback_data="show_results")
-    ])
-    keyboard.append([
-        InlineKeyboardButton(get_text('back_to_main', lang), callback_data="back_to_main")
-    ])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    text, reply_markup = screen
     await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
 
 
 async def add_item_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Добавить блюдо в корзину"""
     query = update.callback_query
-    await query.answer("✅ Добавлено в корзину!")
     
     user_id = update.effective_user.id
     
-    # Парсим callback_data: add_item_{menu_item_id}_{restaurant_id}_{category}
-    parts = query.data.split('_', 4)
-    menu_item_id = int(parts[2])
+    menu_item_id, = context.args
     
-    # Если есть restaurant_id и category - запоминаем их
-    if len(parts) >= 5:
-        restaurant_id = int(parts[3])
-        category = parts[4]
-    else:
-        restaurant_id = None
-        category = None
-    
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
+        await query.answer()
         await query.edit_message_text("❌ Голосование завершено.")
         return
     
     poll_id = poll['id']
     
-    # Добавляем в корзину (quantity=1)
-    db.add_order(poll_id, user_id, menu_item_id, quantity=1)
+    # Повторное нажатие добавляет ещё порцию; в БД корзина пишется пачкой
+    quantity = await carts.increment(poll_id, user_id, menu_item_id)
     
     # Показываем уведомление
-    await query.answer("✅ Добавлено в корзину!", show_alert=False)
+    await query.answer(f"✅ Добавлено в корзину (x{quantity})", show_alert=False)
+
+
+async def decrement_item_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Убрать одну порцию блюда из корзины"""
+    query = update.callback_query
+    
+    user_id = update.effective_user.id
+    
+    menu_item_id, restaurant_id = context.args
+    
+    poll = await db.get_active_poll()
+    if not poll:
+        await query.answer()
+        await query.edit_message_text("❌ Голосование завершено.")
+        return
+    
+    quantity = await carts.decrement(poll['id'], user_id, menu_item_id)
+    await query.answer(f"➖ Осталось: {quantity}" if quantity else "🗑️ Убрано из корзины")
+    await render_cart(query, user_id, poll['id'], restaurant_id)
 
 
 async def show_cart_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1395,21 +1364,26 @@ async def show_cart_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     user_id = update.effective_user.id
-    restaurant_id = int(query.data.split('_')[2])
+    restaurant_id, = context.args
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
         await query.edit_message_text("❌ Голосование завершено.")
         return
     
-    poll_id = poll['id']
-    orders = db.get_user_orders(poll_id, user_id)
+    await render_cart(query, user_id, poll['id'], restaurant_id)
+
+
+async def render_cart(query, user_id: int, poll_id: int, restaurant_id: int):
+    """Экран корзины (несохранённые изменения сначала записываются в БД)"""
+    await carts.flush(poll_id, user_id)
+    orders = await db.get_user_orders(poll_id, user_id)
     
     if not orders:
         text = "🛒 <b>Ваша корзина пуста</b>\n\n"
         text += "Вернитесь назад и выберите блюда."
         keyboard = [[
-            InlineKeyboardButton("⬅️ Вернуться к меню", callback_data=f"order_from_{restaurant_id}")
+            InlineKeyboardButton("⬅️ Вернуться к меню", callback_data=encode('order_from', restaurant_id))
         ]]
     else:
         text = "🛒 <b>Ваша корзина:</b>\n\n"
@@ -1422,9 +1396,14 @@ async def show_cart_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
         text += f"\n💰 <b>Итого: {int(total)}֏</b>"
         
         keyboard = [
-            [InlineKeyboardButton("✅ Завершить заказ", callback_data="finish_order")],
-            [InlineKeyboardButton("🗑️ Очистить корзину", callback_data="clear_cart")],
-            [InlineKeyboardButton("⬅️ Добавить ещё", callback_data=f"order_from_{restaurant_id}")]
+            [InlineKeyboardButton(f"➖ {order['name'][:30]}",
+                                  callback_data=encode('cart_dec', order['menu_item_id'], restaurant_id))]
+            for order in orders
+        ]
+        keyboard += [
+            [InlineKeyboardButton("✅ Завершить заказ", callback_data=encode('finish_order'))],
+            [InlineKeyboardButton("🗑️ Очистить корзину", callback_data=encode('clear_cart'))],
+            [InlineKeyboardButton("⬅️ Добавить ещё", callback_data=encode('order_from', restaurant_id))]
         ]
     
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1439,13 +1418,14 @@ async def finish_order_callback(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = update.effective_user.id
     user = update.effective_user
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     if not poll:
         await query.edit_message_text("❌ Голосование завершено.")
         return
     
     poll_id = poll['id']
-    orders = db.get_user_orders(poll_id, user_id)
+    await carts.flush(poll_id, user_id)
+    orders = await db.get_user_orders(poll_id, user_id)
     
     if not orders:
         await query.edit_message_text("❌ Корзина пуста!")
@@ -1464,7 +1444,7 @@ async def finish_order_callback(update: Update, context: ContextTypes.DEFAULT_TY
     text += "как все участники сделают свой выбор.\n\n"
     text += "Используйте /myorder чтобы посмотреть свой заказ."
     
-    keyboard = [[InlineKeyboardButton("🏠 На главную", callback_data="back_to_voting")]]
+    keyboard = [[InlineKeyboardButton("🏠 На главную", callback_data=encode('back_to_voting'))]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
@@ -1476,16 +1456,16 @@ async def clear_cart_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer("🗑️ Корзина очищена")
     
     user_id = update.effective_user.id
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if poll:
         poll_id = poll['id']
-        db.clear_user_orders(poll_id, user_id)
+        await carts.clear(poll_id, user_id)
     
     await query.edit_message_text(
         "🗑️ Корзина очищена.\n\nИспользуйте /lunch для нового заказа.",
         reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("🏠 На главную", callback_data="back_to_voting")
+            InlineKeyboardButton("🏠 На главную", callback_data=encode('back_to_voting'))
         ]])
     )
 
@@ -1493,16 +1473,17 @@ async def clear_cart_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 async def my_order_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /myorder - показать свой заказ"""
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
-    poll = db.get_active_poll()
+    poll = await db.get_active_poll()
     
     if not poll:
         await update.message.reply_text(get_text('voting_not_started', lang))
         return
     
     poll_id = poll['id']
-    orders = db.get_user_orders(poll_id, user_id)
+    await carts.flush(poll_id, user_id)
+    orders = await db.get_user_orders(poll_id, user_id)
     
     if not orders:
         await update.message.reply_text(get_text('no_order_yet', lang))
@@ -1543,7 +1524,7 @@ async def start_lunch_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         user = update.effective_user
         
         # Добавляем пользователя
-        db.add_user(
+        await db.add_user(
             user_id=user.id,
             username=user.username or "",
             first_name=user.first_name or "",
@@ -1551,21 +1532,20 @@ async def start_lunch_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         
         # Создаём или получаем активное голосование
-        today = datetime.now().strftime('%Y-%m-%d')
-        poll = db.get_active_poll(today)
+        poll = await db.get_active_poll()
         
         if not poll:
-            poll_id = db.create_poll(user_id, today)
-            poll = db.get_poll_by_id(poll_id)
+            poll_id = await db.create_poll(user_id)
+            poll = await db.get_poll_by_id(poll_id)
         else:
             poll_id = poll['id']
         
         # Автоматически добавляем пользователя в участники
-        if not db.is_participant(poll_id, user_id):
-            db.add_participant(poll_id, user_id)
+        if not await db.is_participant(poll_id, user_id):
+            await db.add_participant(poll_id, user_id)
         
         # Получаем список активных ресторанов
-        restaurants = db.get_all_restaurants(active_only=True)
+        restaurants = await db.get_all_restaurants(active_only=True)
         
         if not restaurants:
             await query.edit_message_text(
@@ -1580,20 +1560,20 @@ async def start_lunch_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         keyboard = []
         for restaurant in restaurants:
             emoji = restaurant.get('emoji', '🍽️')
-            keyboard.append([InlineKeyboardButton(f"{emoji} {restaurant['name']}", callback_data=f"vote_{restaurant['id']}")])
+            keyboard.append([InlineKeyboardButton(f"{emoji} {restaurant['name']}", callback_data=encode('vote', restaurant['id']))])
         
         # Добавляем кнопки управления
-        keyboard.append([InlineKeyboardButton("👥 Участники", callback_data="show_participants"),
-                         InlineKeyboardButton("📊 Результаты", callback_data="show_results")])
-        keyboard.append([InlineKeyboardButton("📋 Меню ресторанов", callback_data="show_menu_list")])
+        keyboard.append([InlineKeyboardButton("👥 Участники", callback_data=encode('show_participants')),
+                         InlineKeyboardButton("📊 Результаты", callback_data=encode('show_results'))])
+        keyboard.append([InlineKeyboardButton("📋 Меню ресторанов", callback_data=encode('show_menu_list'))])
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         # Получаем текущие голоса
-        user_vote = db.get_user_vote(poll_id, user_id)
+        user_vote = await db.get_user_vote(poll_id, user_id)
         vote_text = ""
         if user_vote:
-            restaurant = db.get_restaurant(user_vote)
+            restaurant = await db.get_restaurant(user_vote)
             if restaurant:
                 rest_emoji = restaurant.get('emoji', '🍽️')
                 vote_text = f"\n\n✅ Ваш выбор: {rest_emoji} <b>{restaurant['name']}</b>"
@@ -1623,10 +1603,10 @@ async def show_my_order_callback(update: Update, context: ContextTypes.DEFAULT_T
     
     try:
         user_id = update.effective_user.id
-        poll = db.get_active_poll()
+        poll = await db.get_active_poll()
         
         if not poll:
-            keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]]
+            keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(
                 "❌ Сегодня голосование еще не начато.\n\nИспользуйте кнопку 'Начать голосование'",
@@ -1635,10 +1615,11 @@ async def show_my_order_callback(update: Update, context: ContextTypes.DEFAULT_T
             return
         
         poll_id = poll['id']
-        orders = db.get_user_orders(poll_id, user_id)
+        await carts.flush(poll_id, user_id)
+        orders = await db.get_user_orders(poll_id, user_id)
         
         if not orders:
-            keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]]
+            keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text(
                 "🛒 У вас пока нет заказа.\n\nСначала проголосуйте за ресторан и выберите блюда.",
@@ -1660,14 +1641,14 @@ async def show_my_order_callback(update: Update, context: ContextTypes.DEFAULT_T
         text += f"\n💰 <b>Итого: {int(total)}֏</b>"
         
         keyboard = [
-            [InlineKeyboardButton("🗑️ Очистить корзину", callback_data="clear_cart")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]
+            [InlineKeyboardButton("🗑️ Очистить корзину", callback_data=encode('clear_cart'))],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await query.edit_message_text(text, parse_mode='HTML', reply_markup=reply_markup)
     except Exception as e:
-        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]]
+        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(
             f"❌ Ошибка: {str(e)[:200]}",
@@ -1686,7 +1667,7 @@ async def admin_panel_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # Проверка прав администратора
         if user_id != int(config.ADMIN_ID):
-            keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]]
+            keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             await query.edit_message_text("❌ У вас нет прав администратора.", reply_markup=reply_markup)
             return
@@ -1711,15 +1692,15 @@ async def admin_panel_callback(update: Update, context: ContextTypes.DEFAULT_TYP
 """
         
         keyboard = [
-            [InlineKeyboardButton("📊 Статистика", callback_data="admin_stats")],
-            [InlineKeyboardButton("👥 Пользователи", callback_data="admin_users")],
-            [InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]
+            [InlineKeyboardButton("📊 Статистика", callback_data=encode('admin_stats'))],
+            [InlineKeyboardButton("👥 Пользователи", callback_data=encode('admin_users'))],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
         await query.edit_message_text(admin_text, parse_mode='HTML', reply_markup=reply_markup)
     except Exception as e:
-        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]]
+        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data=encode('back_to_main'))]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(f"❌ Ошибка: {str(e)[:200]}", reply_markup=reply_markup)
         raise
@@ -1733,15 +1714,15 @@ async def change_language_callback(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     
     user_id = update.effective_user.id
-    lang = db.get_user_language(user_id)
+    lang = await db.get_user_language(user_id)
     
     text = get_text('choose_language', lang)
     
     keyboard = [
-        [InlineKeyboardButton("🇦🇲 Հայերեն (Armenian)", callback_data="set_lang_hy")],
-        [InlineKeyboardButton("🇷🇺 Русский (Russian)", callback_data="set_lang_ru")],
-        [InlineKeyboardButton("🇬🇧 English", callback_data="set_lang_en")],
-        [InlineKeyboardButton(get_text('btn_back', lang), callback_data="back_to_main")]
+        [InlineKeyboardButton("🇦🇲 Հայերեն (Armenian)", callback_data=encode('set_lang', 'hy'))],
+        [InlineKeyboardButton("🇷🇺 Русский (Russian)", callback_data=encode('set_lang', 'ru'))],
+        [InlineKeyboardButton("🇬🇧 English", callback_data=encode('set_lang', 'en'))],
+        [InlineKeyboardButton(get_text('btn_back', lang), callback_data=encode('back_to_main'))]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -1753,11 +1734,10 @@ async def set_language_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     user = update.effective_user
     
-    # Извлекаем код языка из callback_data (set_lang_ru -> ru)
-    lang_code = query.data.split('_')[2]
+    lang_code, = context.args
     
     user_id = update.effective_user.id
-    db.set_user_language(user_id, lang_code)
+    await db.set_user_language(user_id, lang_code)
     
     await query.answer(get_text('language_changed', lang_code))
     
@@ -1779,17 +1759,17 @@ async def set_language_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Создаём интерактивное меню
     keyboard = [
-        [InlineKeyboardButton(get_text('btn_start_voting', lang_code), callback_data="start_lunch")],
-        [InlineKeyboardButton(get_text('btn_menu_list', lang_code), callback_data="show_menu_list")],
-        [InlineKeyboardButton(get_text('btn_results', lang_code), callback_data="show_results"),
-         InlineKeyboardButton(get_text('btn_participants', lang_code), callback_data="show_participants")],
-        [InlineKeyboardButton(get_text('btn_my_order', lang_code), callback_data="show_my_order")],
-        [InlineKeyboardButton(get_text('btn_language', lang_code), callback_data="change_language")],
+        [InlineKeyboardButton(get_text('btn_start_voting', lang_code), callback_data=encode('start_lunch'))],
+        [InlineKeyboardButton(get_text('btn_menu_list', lang_code), callback_data=encode('show_menu_list'))],
+        [InlineKeyboardButton(get_text('btn_results', lang_code), callback_data=encode('show_results')),
+         InlineKeyboardButton(get_text('btn_participants', lang_code), callback_data=encode('show_participants'))],
+        [InlineKeyboardButton(get_text('btn_my_order', lang_code), callback_data=encode('show_my_order'))],
+        [InlineKeyboardButton(get_text('btn_language', lang_code), callback_data=encode('change_language'))],
     ]
     
     # Добавляем админ панель если это админ
     if user.id == int(config.ADMIN_ID):
-        keyboard.append([InlineKeyboardButton(get_text('btn_admin_panel', lang_code), callback_data="admin_panel")])
+        keyboard.append([InlineKeyboardButton(get_text('btn_admin_panel', lang_code), callback_data=encode('admin_panel'))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
@@ -1802,7 +1782,7 @@ async def back_to_main_callback(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     user = update.effective_user
-    lang = db.get_user_language(user.id)
+    lang = await db.get_user_language(user.id)
     
     # Формируем приветственное сообщение
     welcome_text = f"""
@@ -1822,17 +1802,17 @@ async def back_to_main_callback(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Создаём интерактивное меню
     keyboard = [
-        [InlineKeyboardButton(get_text('btn_start_voting', lang), callback_data="start_lunch")],
-        [InlineKeyboardButton(get_text('btn_menu_list', lang), callback_data="show_menu_list")],
-        [InlineKeyboardButton(get_text('btn_results', lang), callback_data="show_results"),
-         InlineKeyboardButton(get_text('btn_participants', lang), callback_data="show_participants")],
-        [InlineKeyboardButton(get_text('btn_my_order', lang), callback_data="show_my_order")],
-        [InlineKeyboardButton(get_text('btn_language', lang), callback_data="change_language")],
+        [InlineKeyboardButton(get_text('btn_start_voting', lang), callback_data=encode('start_lunch'))],
+        [InlineKeyboardButton(get_text('btn_menu_list', lang), callback_data=encode('show_menu_list'))],
+        [InlineKeyboardButton(get_text('btn_results', lang), callback_data=encode('show_results')),
+         InlineKeyboardButton(get_text('btn_participants', lang), callback_data=encode('show_participants'))],
+        [InlineKeyboardButton(get_text('btn_my_order', lang), callback_data=encode('show_my_order'))],
+        [InlineKeyboardButton(get_text('btn_language', lang), callback_data=encode('change_language'))],
     ]
     
     # Добавляем админ панель если это админ
     if user.id == int(config.ADMIN_ID):
-        keyboard.append([InlineKeyboardButton(get_text('btn_admin_panel', lang), callback_data="admin_panel")])
+        keyboard.append([InlineKeyboardButton(get_text('btn_admin_panel', lang), callback_data=encode('admin_panel'))])
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
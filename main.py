@@ -1,7 +1,9 @@
 """
 Главный файл телеграм бота для организации обедов
 """
+import asyncio
 import logging
+import os
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -14,9 +16,13 @@ from telegram.ext import (
 )
 
 import config
-from database import Database
+import services
+from callback_router import CallbackRouter
+from metrics import InstrumentedRequest, instrument_handlers
 from scheduler import LunchScheduler
 from seed_data import seed_restaurants
+from translations import check_catalogue
+from webhook import run_webhook
 
 # Импортируем обработчики
 from handlers import (
@@ -48,6 +54,7 @@ from handlers import (
     order_from_restaurant_callback,
     show_category_dishes_callback,
     add_item_callback,
+    decrement_item_callback,
     show_cart_callback,
     finish_order_callback,
     clear_cart_callback,
@@ -75,9 +82,12 @@ from admin_handlers import (
     menu_item_price,
     menu_item_desc,
     menu_item_category,
+    admin_restaurants_callback,
+    admin_menus_callback,
     admin_stats_callback,
     admin_users_callback,
     cancel_admin,
+    db_stats_command,
     send_order_command,
     confirm_order_callback,
     reject_order_callback,
@@ -135,18 +145,35 @@ def main():
         logger.error("Токен бота не найден! Проверьте файл .env")
         return
     
-    # Инициализация базы данных
-    db = Database()
+    # Проверяем каталог переводов (пропущенные языки и ключи)
+    problems = check_catalogue(os.path.dirname(os.path.abspath(__file__)))
+    for problem in problems:
+        logger.warning(f"Переводы: {problem}")
+    
+    # Инициализация базы данных - один экземпляр на весь процесс
+    db = services.get_database()
     logger.info("База данных инициализирована")
     
     # Автоматическое добавление базовых данных если БД пустая
     try:
-        seed_restaurants()
+        seed_restaurants(db.sync)
     except Exception as e:
         logger.error(f"Ошибка при seed данных: {e}")
     
-    # Создаем приложение
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    # Создаем приложение; БД закрывается вместе с ним
+    builder = (
+        Application.builder()
+        .token(config.BOT_TOKEN)
+        # Запросы к Telegram API замеряются (см. metrics.py); размер пула как у PTB по умолчанию
+        .request(InstrumentedRequest(connection_pool_size=256))
+        .post_init(services.post_init)
+        .post_shutdown(services.post_shutdown)
+    )
+    if config.BOT_MODE == 'webhook':
+        # Обновления приходят на встроенный сервер: polling не нужен,
+        # очередь ограничена (при переполнении сервер отвечает 503)
+        builder = builder.updater(None).update_queue(asyncio.Queue(maxsize=config.WEBHOOK_QUEUE_SIZE))
+    application = builder.build()
     
     # ========== Обработчики команд для пользователей ==========
     
@@ -177,9 +204,6 @@ def main():
     application.add_handler(CommandHandler("add_user", add_user_command))
     application.add_handler(CommandHandler("remove_user", remove_user_command))
     application.add_handler(CommandHandler("list_users", list_users_command))
-    application.add_handler(CallbackQueryHandler(pending_users_callback, pattern=r'^pending_users$'))
-    application.add_handler(CallbackQueryHandler(approve_user_callback, pattern=r'^approve_user_'))
-    application.add_handler(CallbackQueryHandler(reject_user_callback, pattern=r'^reject_user_'))
     
     # ========== Обработчики команд для администраторов ==========
     
@@ -236,72 +260,73 @@ def main():
     
     # ========== Callback handlers ==========
     
+    # Все кнопки, кроме шагов диалогов: один обработчик, маршрут по коду
+    # действия (и по префиксу для кнопок старого формата), см. callback_router.py
+    callbacks = CallbackRouter()
+    
     # Голосование
-    application.add_handler(CallbackQueryHandler(vote_callback, pattern=r'^vote_\d+$'))
-    application.add_handler(CallbackQueryHandler(show_results_callback, pattern=r'^show_results$'))
-    application.add_handler(CallbackQueryHandler(show_results_category_callback, pattern=r'^results_cat_'))
+    callbacks.route('vote', vote_callback)
+    callbacks.route('show_results', show_results_callback)
+    callbacks.route('results_cat', show_results_category_callback)
     
     # Участники
-    application.add_handler(CallbackQueryHandler(show_participants_callback, pattern=r'^show_participants$'))
-    application.add_handler(CallbackQueryHandler(leave_callback, pattern=r'^leave_lunch$'))
+    callbacks.route('show_participants', show_participants_callback)
+    callbacks.route('leave_lunch', leave_callback)
     
     # Меню
-    application.add_handler(CallbackQueryHandler(show_menu_callback, pattern=r'^menu_\d+$'))
-    application.add_handler(CallbackQueryHandler(show_category_callback, pattern=r'^category_\d+_.+$'))
-    application.add_handler(CallbackQueryHandler(show_menu_list_callback, pattern=r'^show_menu_list$'))
-    application.add_handler(CallbackQueryHandler(back_to_main_callback, pattern=r'^back_to_main$'))
+    callbacks.route('menu', show_menu_callback)
+    callbacks.route('category', show_category_callback)
+    callbacks.route('show_menu_list', show_menu_list_callback)
+    callbacks.route('back_to_main', back_to_main_callback)
     
     # Выбор языка
-    application.add_handler(CallbackQueryHandler(change_language_callback, pattern=r'^change_language$'))
-    application.add_handler(CallbackQueryHandler(set_language_callback, pattern=r'^set_lang_\w+$'))
+    callbacks.route('change_language', change_language_callback)
+    callbacks.route('set_lang', set_language_callback)
     
     # Заказы
-    application.add_handler(CallbackQueryHandler(add_order_callback, pattern=r'^order_\d+$'))
-    application.add_handler(CallbackQueryHandler(my_orders_callback, pattern=r'^my_orders$'))
-    application.add_handler(CallbackQueryHandler(remove_order_callback, pattern=r'^remove_order_\d+$'))
-    application.add_handler(CallbackQueryHandler(clear_orders_callback, pattern=r'^clear_orders$'))
+    callbacks.route('order', add_order_callback)
+    callbacks.route('my_orders', my_orders_callback)
+    callbacks.route('remove_order', remove_order_callback)
+    callbacks.route('clear_orders', clear_orders_callback)
     
     # Навигация
-    application.add_handler(CallbackQueryHandler(back_to_voting_callback, pattern=r'^back_to_voting$'))
+    callbacks.route('back_to_voting', back_to_voting_callback)
     
     # Система заказа блюд
-    application.add_handler(CallbackQueryHandler(order_from_restaurant_callback, pattern=r'^order_from_\d+$'))
-    application.add_handler(CallbackQueryHandler(show_category_dishes_callback, pattern=r'^order_cat_'))
-    application.add_handler(CallbackQueryHandler(add_item_callback, pattern=r'^add_item_'))
-    application.add_handler(CallbackQueryHandler(show_cart_callback, pattern=r'^show_cart_\d+$'))
-    application.add_handler(CallbackQueryHandler(finish_order_callback, pattern=r'^finish_order$'))
-    application.add_handler(CallbackQueryHandler(clear_cart_callback, pattern=r'^clear_cart$'))
+    callbacks.route('order_from', order_from_restaurant_callback)
+    callbacks.route('order_cat', show_category_dishes_callback)
+    callbacks.route('add_item', add_item_callback)
+    callbacks.route('cart_dec', decrement_item_callback)
+    callbacks.route('show_cart', show_cart_callback)
+    callbacks.route('finish_order', finish_order_callback)
+    callbacks.route('clear_cart', clear_cart_callback)
     application.add_handler(CommandHandler("myorder", my_order_command))
     
     # Админ панель
-    application.add_handler(CallbackQueryHandler(admin_stats_callback, pattern=r'^admin_stats$'))
-    application.add_handler(CallbackQueryHandler(admin_users_callback, pattern=r'^admin_users$'))
+    callbacks.route('admin_restaurants', admin_restaurants_callback)
+    callbacks.route('admin_menus', admin_menus_callback)
+    callbacks.route('admin_stats', admin_stats_callback)
+    callbacks.route('admin_users', admin_users_callback)
+    callbacks.route('pending_users', pending_users_callback)
+    callbacks.route('approve_user', approve_user_callback)
+    callbacks.route('reject_user', reject_user_callback)
     application.add_handler(CommandHandler("send_order", send_order_command))
+    application.add_handler(CommandHandler("db_stats", db_stats_command))
     
     # Подтверждение/отклонение заказа менеджером
-    application.add_handler(CallbackQueryHandler(confirm_order_callback, pattern=r'^confirm_order_\d+$'))
-    application.add_handler(CallbackQueryHandler(reject_order_callback, pattern=r'^reject_order_\d+$'))
+    callbacks.route('confirm_order', confirm_order_callback)
+    callbacks.route('reject_order', reject_order_callback)
     
     # Главное меню (обработчики кнопок из /start)
-    logger.info("🔵 Регистрируем обработчики главного меню...")
-    application.add_handler(CallbackQueryHandler(start_lunch_callback, pattern=r'^start_lunch$'))
-    logger.info("✅ start_lunch_callback зарегистрирован")
-    application.add_handler(CallbackQueryHandler(show_my_order_callback, pattern=r'^show_my_order$'))
-    application.add_handler(CallbackQueryHandler(admin_panel_callback, pattern=r'^admin_panel$'))
-    logger.info("✅ Обработчики главного меню зарегистрированы")
-    
-    # Повторное добавление блюда
-    application.add_handler(CallbackQueryHandler(menu_restaurant_selected, pattern=r'^addmenu_\d+$'))
-    
-    # ========== Логирование всех callback'ов ==========
+    callbacks.route('start_lunch', start_lunch_callback)
+    callbacks.route('show_my_order', show_my_order_callback)
+    callbacks.route('admin_panel', admin_panel_callback)
     
-    async def log_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Логировать все callback query для отладки"""
-        if update.callback_query:
-            logger.info(f"📞 CALLBACK: {update.callback_query.data} от user {update.effective_user.id}")
+    # Повторное добавление блюда (кнопка после завершения диалога /add_menu)
+    application.add_handler(CallbackQueryHandler(menu_restaurant_selected, pattern=r'^addmenu_\d+$'))
     
-    # Добавляем в начало чтобы логировать ВСЕ callback'и
-    application.add_handler(CallbackQueryHandler(log_callback), group=-1)
+    # После всех обработчиков с pattern: сюда попадают остальные кнопки
+    application.add_handler(callbacks.handler())
     
     # ========== Обработчик ошибок ==========
     
@@ -330,6 +355,11 @@ def main():
     
     application.add_error_handler(error_handler)
     
+    # ========== Метрики ==========
+    
+    # Время, запросы к БД и к Telegram API каждого обработчика (GET /metrics)
+    instrument_handlers(application)
+    
     # ========== Планировщик уведомлений ==========
     
     scheduler = LunchScheduler(application.bot)
@@ -338,13 +368,16 @@ def main():
     
     # ========== Запуск бота ==========
     
-    logger.info("Бот запущен и готов к работе!")
+    logger.info(f"Бот запущен и готов к работе! Режим: {config.BOT_MODE}")
     
-    # Запускаем бота с защитой от конфликтов
-    application.run_polling(
-        allowed_updates=Update.ALL_TYPES,
-        drop_pending_updates=True  # Игнорировать старые обновления
-    )
+    if config.BOT_MODE == 'webhook':
+        run_webhook(application)
+    else:
+        application.run_polling(
+            allowed_updates=Update.ALL_TYPES,
+            # Накопившиеся за время простоя обновления по умолчанию обрабатываются
+            drop_pending_updates=config.DROP_PENDING_UPDATES
+        )
 
 
 if __name__ == '__main__':
@@ -0,0 +1,289 @@
+"""
+Метрики обработчиков: время, запросы к БД и к Telegram API
+
+Каждый обработчик, зарегистрированный в main(), оборачивается
+instrument_handlers: на время его выполнения в contextvar лежит замер
+(HandlerSample), в который AsyncDatabase.run и InstrumentedRequest
+добавляют свои вызовы. По завершении замер попадает в гистограммы
+с меткой handler - имя функции-обработчика.
+
+Метрики отдаются в текстовом формате Prometheus на GET /metrics
+отдельным сервером на METRICS_PORT (если задан) в обоих режимах.
+"""
+import contextvars
+import functools
+import logging
+import time
+from bisect import bisect_left
+from http import HTTPStatus
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+from webhook import HttpServer
+import config
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144)
+# Для накладных расходов порядка микросекунд
+MICRO_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Счётчик с метками"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, value: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + value
+
+    def get(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def render(self) -> list:
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {value}"
+            for key, value in sorted(self._values.items())
+        ]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: tuple = SECONDS_BUCKETS, labels: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        # метки -> [счётчики по корзинам (последняя - +Inf), сумма, число]
+        self._series = {}
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def get(self, *label_values) -> dict:
+        """{'count', 'sum'} для набора меток (для отчётов и проверок)"""
+        series = self._series.get(label_values)
+        return {'count': series[2], 'sum': series[1]} if series else {'count': 0, 'sum': 0.0}
+
+    def render(self) -> list:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса; все обновления идут из event loop"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = SECONDS_BUCKETS,
+                  labels: tuple = ()) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets, labels))
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    'bot_handler_seconds', 'Время обработки обновления', labels=('handler',))
+HANDLER_ERRORS = REGISTRY.counter(
+    'bot_handler_errors_total', 'Обработчик завершился исключением', labels=('handler',))
+HANDLER_DB_CALLS = REGISTRY.histogram(
+    'bot_handler_db_calls', 'Вызовов методов AsyncDatabase (мимо кэша) за одно обновление, не SQL-запросов', COUNT_BUCKETS, ('handler',))
+HANDLER_DB_SECONDS = REGISTRY.histogram(
+    'bot_handler_db_seconds', 'Время обращений к БД за одно обновление, с ожиданием пула', labels=('handler',))
+HANDLER_API_CALLS = REGISTRY.histogram(
+    'bot_handler_api_calls', 'Запросов к Telegram API за одно обновление', COUNT_BUCKETS, ('handler',))
+HANDLER_API_SECONDS = REGISTRY.histogram(
+    'bot_handler_api_seconds', 'Время запросов к Telegram API за одно обновление', labels=('handler',))
+HANDLER_API_BYTES = REGISTRY.histogram(
+    'bot_handler_api_bytes', 'Байт отправлено и получено от Telegram API за одно обновление',
+    BYTES_BUCKETS, ('handler',))
+DB_CALL_SECONDS = REGISTRY.histogram(
+    'bot_db_call_seconds', 'Время одного обращения к БД', labels=('method',))
+API_CALL_SECONDS = REGISTRY.histogram(
+    'bot_api_call_seconds', 'Время одного запроса к Telegram API', labels=('method',))
+CALLBACK_ROUTES = REGISTRY.counter(
+    'bot_callback_routes_total', 'Нажатия кнопок по маршрутам: формат compact, legacy, conversation или unknown',
+    labels=('action', 'format'))
+CALLBACK_DISPATCH_SECONDS = REGISTRY.histogram(
+    'bot_callback_dispatch_seconds', 'Разбор callback_data и выбор маршрута (без обработчика)',
+    MICRO_BUCKETS, ('format',))
+
+
+class HandlerSample:
+    """Замер одного вызова обработчика"""
+
+    __slots__ = ('handler', 'db_calls', 'db_seconds', 'api_calls', 'api_seconds', 'api_bytes')
+
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.api_calls = 0
+        self.api_seconds = 0.0
+        self.api_bytes = 0
+
+
+_current = contextvars.ContextVar('handler_sample', default=None)
+
+
+def record_db_call(method: str, seconds: float):
+    """Обращение к БД (вызывается из AsyncDatabase.run)"""
+    DB_CALL_SECONDS.observe(seconds, method)
+    sample = _current.get()
+    if sample is not None:
+        sample.db_calls += 1
+        sample.db_seconds += seconds
+
+
+def record_api_call(method: str, seconds: float, size: int):
+    """Запрос к Telegram API (вызывается из InstrumentedRequest)"""
+    API_CALL_SECONDS.observe(seconds, method)
+    sample = _current.get()
+    if sample is not None:
+        sample.api_calls += 1
+        sample.api_seconds += seconds
+        sample.api_bytes += size
+
+
+def instrument(name: str, callback):
+    """Обернуть callback обработчика замером"""
+    if getattr(callback, '_instrumented', False):
+        return callback
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        sample = HandlerSample(name)
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+            HANDLER_DB_CALLS.observe(sample.db_calls, name)
+            HANDLER_DB_SECONDS.observe(sample.db_seconds, name)
+            HANDLER_API_CALLS.observe(sample.api_calls, name)
+            HANDLER_API_SECONDS.observe(sample.api_seconds, name)
+            HANDLER_API_BYTES.observe(sample.api_bytes, name)
+            _current.reset(token)
+
+    wrapper._instrumented = True
+    return wrapper
+
+
+def _instrument_handler(handler):
+    if isinstance(handler, ConversationHandler):
+        # Обработчики шагов диалога вызываются самим ConversationHandler
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for inner in nested:
+            _instrument_handler(inner)
+        return
+    callback = getattr(handler, 'callback', None)
+    if callback is not None:
+        handler.callback = instrument(getattr(callback, '__name__', type(handler).__name__), callback)
+
+
+def instrument_handlers(application):
+    """Обернуть замером все зарегистрированные обработчики (вызывать после add_handler)"""
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
+            count += 1
+    logger.info(f"Метрики: обработчиков под замером - {count}")
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest, замеряющий каждый запрос к Telegram API"""
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        started = time.perf_counter()
+        size = 0
+        try:
+            code, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+            size = len(payload)
+            return code, payload
+        finally:
+            if request_data is not None and not request_data.contains_files:
+                size += len(request_data.json_payload)
+            record_api_call(url.rsplit('/', 1)[-1], time.perf_counter() - started, size)
+
+
+# ========== HTTP ==========
+
+async def _handle_metrics(body: bytes, headers: dict):
+    return HTTPStatus.OK, REGISTRY.render().encode(), 'text/plain; version=0.0.4'
+
+
+async def start_server(application):
+    """
+    Отдавать /metrics на METRICS_PORT
+
+    Не через webhook-сервер: его порт публичный, а /metrics не защищён
+    секретом webhook.
+    """
+    if config.METRICS_PORT:
+        server = HttpServer(config.METRICS_LISTEN, config.METRICS_PORT)
+        server.add_route('GET', '/metrics', _handle_metrics)
+        await server.start()
+        application.bot_data['metrics_server'] = server
+
+
+async def stop_server(application):
+    server = application.bot_data.pop('metrics_server', None)
+    if server is not None:
+        await server.stop()
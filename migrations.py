@@ -0,0 +1,286 @@
+"""
+Версионные миграции схемы БД
+
+Текущая версия схемы хранится в таблице schema_version. При старте
+выполняются только миграции с номером больше текущего, поэтому на
+уже обновлённой базе запуск стоит одной проверки версии.
+
+Новая миграция - новая функция и строка в MIGRATIONS (номера не меняются
+и не переиспользуются).
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Вторичные индексы под частые запросы: (имя, таблица, колонки)
+# lunch_participants(poll_id, ...) и user_orders(poll_id, ...) уже покрыты
+# индексами их UNIQUE-ограничений, отдельные индексы там не нужны
+INDEXES = (
+    # get_active_poll: WHERE date = ? AND status = 'active' ORDER BY created_at
+    ('idx_polls_date_status', 'polls', 'date, status, created_at'),
+    # get_restaurant_menu: WHERE restaurant_id = ? AND is_available = 1 ORDER BY category, name
+    ('idx_menu_items_restaurant', 'menu_items', 'restaurant_id, is_available, category, name'),
+    # get_poll_votes: LEFT JOIN votes ON restaurant_id = r.id AND poll_id = ?
+    ('idx_votes_poll_restaurant', 'votes', 'poll_id, restaurant_id'),
+)
+
+# Колонки, добавленные в таблицы после их первой версии. В базах, созданных
+# старым кодом (до schema_version), их может не быть
+LEGACY_COLUMNS = {
+    'users': (
+        ('language', "TEXT DEFAULT 'ru'"),
+        ('access_status', "TEXT DEFAULT 'pending'"),
+        ('requested_at', 'TIMESTAMP'),
+        ('approved_at', 'TIMESTAMP'),
+        ('department', 'TEXT'),
+    ),
+    'restaurants': (
+        ('emoji', "TEXT DEFAULT '🍽️'"),
+        ('photo_url', 'TEXT'),
+        ('manager_telegram_id', 'INTEGER'),
+        ('manager_phone', 'TEXT'),
+    ),
+    'menu_items': (
+        ('photo_url', 'TEXT'),
+        ('badges', 'TEXT'),
+    ),
+}
+
+
+def _initial_schema(cursor, backend):
+    """Таблицы бота (и недостающие колонки в базах, созданных до миграций)"""
+    # Таблица пользователей
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            is_admin INTEGER DEFAULT 0,
+            language TEXT DEFAULT 'ru',
+            access_status TEXT DEFAULT 'pending',
+            requested_at TIMESTAMP,
+            approved_at TIMESTAMP,
+            department TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица ресторанов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS restaurants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            address TEXT,
+            phone TEXT,
+            emoji TEXT DEFAULT '🍽️',
+            photo_url TEXT,
+            is_active INTEGER DEFAULT 1,
+            manager_telegram_id INTEGER,
+            manager_phone TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Таблица меню
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS menu_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            restaurant_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            category TEXT,
+            is_available INTEGER DEFAULT 1,
+            photo_url TEXT,
+            badges TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
+        )
+    ''')
+
+    # Таблица голосований
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS polls (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_by INTEGER NOT NULL,
+            date DATE NOT NULL,
+            status TEXT DEFAULT 'active',
+            winner_restaurant_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            closed_at TIMESTAMP,
+            FOREIGN KEY (created_by) REFERENCES users (user_id),
+            FOREIGN KEY (winner_restaurant_id) REFERENCES restaurants (id)
+        )
+    ''')
+
+    # Таблица голосов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            poll_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            restaurant_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (poll_id) REFERENCES polls (id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id),
+            UNIQUE(poll_id, user_id)
+        )
+    ''')
+
+    # Таблица участников обеда
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lunch_participants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            poll_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (poll_id) REFERENCES polls (id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            UNIQUE(poll_id, user_id)
+        )
+    ''')
+
+    # Таблица заказов блюд
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            poll_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            menu_item_id INTEGER NOT NULL,
+            quantity INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (poll_id) REFERENCES polls (id),
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (menu_item_id) REFERENCES menu_items (id),
+            UNIQUE(poll_id, user_id, menu_item_id)
+        )
+    ''')
+
+    # Базы, созданные до версионных миграций: добавляем недостающие колонки
+    for table, columns in LEGACY_COLUMNS.items():
+        existing = backend.table_columns(cursor, table)
+        for column, definition in columns:
+            if column not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    # Админам - статус "approved"
+    cursor.execute("UPDATE users SET access_status = 'approved' WHERE is_admin = 1")
+
+
+def _indexes(cursor, backend):
+    """Индексы под частые запросы"""
+    for name, table, columns in INDEXES:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+def _job_runs(cursor, backend):
+    """Журнал запусков заданий планировщика: одно задание - один запуск в день"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_runs (
+            job_id TEXT NOT NULL,
+            run_date TEXT NOT NULL,
+            status TEXT DEFAULT 'running',
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP,
+            error TEXT,
+            PRIMARY KEY (job_id, run_date)
+        )
+    ''')
+
+
+def _menu_categories(cursor, backend):
+    """Реестр категорий меню: короткий id категории для callback_data"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS menu_categories (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO menu_categories (name)
+        SELECT DISTINCT category FROM menu_items WHERE category IS NOT NULL
+    ''')
+
+
+def _job_deliveries(cursor, backend):
+    """Доставка рассылок заданий по получателям и отметка "жив" у запуска"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_deliveries (
+            job_id TEXT NOT NULL,
+            run_date TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, run_date, chat_id)
+        )
+    ''')
+    if 'heartbeat_at' not in backend.table_columns(cursor, 'job_runs'):
+        cursor.execute('ALTER TABLE job_runs ADD COLUMN heartbeat_at TIMESTAMP')
+
+
+# (версия, описание, функция) - строго по возрастанию версии
+MIGRATIONS = (
+    (1, 'Начальная схема', _initial_schema),
+    (2, 'Индексы для частых запросов', _indexes),
+    (3, 'Журнал запусков заданий планировщика', _job_runs),
+    (4, 'Реестр категорий меню', _menu_categories),
+    (5, 'Доставка рассылок по получателям', _job_deliveries),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(cursor, backend) -> int:
+    """Текущая версия схемы (0 - база пустая или создана до миграций)"""
+    if not backend.table_exists(cursor, 'schema_version'):
+        return 0
+    cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+    row = cursor.fetchone()
+    return (row['version'] or 0) if row else 0
+
+
+def run_migrations(conn, backend) -> tuple:
+    """
+    Применить недостающие миграции
+
+    Каждая миграция выполняется и фиксируется в schema_version отдельной
+    транзакцией. Миграции идемпотентны, поэтому прерванную можно повторить.
+
+    Returns:
+        (версия до, версия после)
+    """
+    cursor = conn.cursor()
+    current = get_schema_version(cursor, backend)
+    if current >= LATEST_VERSION:
+        conn.rollback()
+        return current, current
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    version = current
+    for version, description, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        logger.info(f"Миграция схемы БД {version}: {description}")
+        try:
+            migrate(cursor, backend)
+            cursor.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Миграция {version} не применена")
+            raise
+    return current, version
@@ -0,0 +1,143 @@
+"""
+Документ заказа для менеджера ресторана
+
+Заказ собирается как поток секций (шапка, строки сводки, итог, блок
+каждого участника) и упаковывается в сообщения не длиннее лимита
+Telegram (4096 символов). Секция не разрывается между сообщениями, если
+помещается в одно; слишком длинная делится по строкам - HTML-теги
+открываются и закрываются в пределах строки, поэтому разметка не ломается.
+
+Для больших заказов тот же поток секций выгружается в текстовый файл
+и отправляется через send_document (ORDER_DOCUMENT).
+"""
+import html
+import io
+import logging
+import re
+from itertools import chain
+from typing import Iterable, Iterator
+from telegram import InputFile
+import config
+
+logger = logging.getLogger(__name__)
+
+# Лимит длины текста сообщения Telegram
+MESSAGE_LIMIT = 4096
+
+_TAG_RE = re.compile(r'<[^>]+>')
+
+
+def iter_order_sections(restaurant: dict, poll: dict, aggregate: dict) -> Iterator[str]:
+    """Секции текста заказа (HTML) - aggregate из Database.get_order_aggregate"""
+    rest_emoji = restaurant.get('emoji', '🍽️')
+    yield (
+        f"📦 <b>ЗАКАЗ для {rest_emoji} {restaurant['name']}</b>\n\n"
+        f"📅 Дата: {poll['date']}\n"
+        f"👥 Участников: {aggregate['participant_count']}\n\n"
+    )
+
+    yield "<b>━━━ СВОДКА ЗАКАЗА ━━━</b>\n\n"
+    for dish in aggregate['dishes']:
+        yield f"<b>{dish['name']}</b> x{dish['quantity']} = {int(dish['total'])}֏\n"
+    yield f"\n💰 <b>ИТОГО: {int(aggregate['total'])}֏</b>\n\n"
+
+    yield "<b>━━━ ПО УЧАСТНИКАМ ━━━</b>\n\n"
+    for user in aggregate['users']:
+        lines = [f"👤 <b>{user['first_name']}:</b>\n"]
+        for line in user['lines']:
+            lines.append(f"  • {line['dish_name']} x{line['quantity']} — {int(line['total'])}֏\n")
+        lines.append(f"  💵 Сумма: {int(user['total'])}֏\n\n")
+        yield ''.join(lines)
+
+
+def format_order_text(restaurant: dict, poll: dict, aggregate: dict) -> str:
+    """Текст заказа целиком (для небольших заказов и проверок)"""
+    return ''.join(iter_order_sections(restaurant, poll, aggregate))
+
+
+def _split_lines(section: str, limit: int) -> Iterator[str]:
+    """Разбить слишком длинную секцию по строкам (строку длиннее limit - по символам)"""
+    part = ''
+    for line in section.splitlines(keepends=True):
+        while len(line) > limit:
+            if part:
+                yield part
+                part = ''
+            yield line[:limit]
+            line = line[limit:]
+        if len(part) + len(line) > limit:
+            yield part
+            part = ''
+        part += line
+    if part:
+        yield part
+
+
+def pack_messages(sections: Iterable[str], limit: int = MESSAGE_LIMIT) -> Iterator[str]:
+    """Упаковать поток секций в сообщения длиной не больше limit"""
+    message = ''
+    for section in sections:
+        pieces = [section] if len(section) <= limit else _split_lines(section, limit)
+        for piece in pieces:
+            if len(message) + len(piece) > limit:
+                yield message
+                message = ''
+            message += piece
+    if message.strip():
+        yield message
+
+
+def to_plain_text(sections: Iterable[str]) -> Iterator[str]:
+    """Те же секции без HTML-разметки - для файла"""
+    for section in sections:
+        yield html.unescape(_TAG_RE.sub('', section))
+
+
+def order_document(restaurant: dict, poll: dict, aggregate: dict) -> InputFile:
+    """Заказ текстовым файлом для send_document"""
+    buffer = io.BytesIO()
+    for section in to_plain_text(iter_order_sections(restaurant, poll, aggregate)):
+        buffer.write(section.encode('utf-8'))
+    buffer.seek(0)
+    return InputFile(buffer, filename=f"order_{poll['date']}_{restaurant['id']}.txt")
+
+
+async def send_order(bot, chat_id: int, restaurant: dict, poll: dict, aggregate: dict,
+                     intro: str = None, reply_markup=None, attach: str = config.ORDER_DOCUMENT) -> int:
+    """
+    Отправить заказ в чат сообщениями не длиннее лимита
+
+    intro - текст перед заказом (в том же первом сообщении);
+    reply_markup - кнопки под последним сообщением;
+    attach - 'always', 'auto' (файл, если заказ не поместился в одно
+    сообщение) или 'never'.
+
+    Returns:
+        число отправленных сообщений (без файла)
+    """
+    sections = iter_order_sections(restaurant, poll, aggregate)
+    if intro:
+        sections = chain([intro], sections)
+
+    # Сообщения отправляются по мере упаковки; кнопки нужны под последним,
+    # поэтому одно сообщение придерживается до следующего
+    sent = 0
+    pending = None
+    for message in pack_messages(sections):
+        if pending is not None:
+            await bot.send_message(chat_id=chat_id, text=pending, parse_mode='HTML')
+            sent += 1
+        pending = message
+    if pending is not None:
+        await bot.send_message(chat_id=chat_id, text=pending, parse_mode='HTML', reply_markup=reply_markup)
+        sent += 1
+
+    if attach == 'always' or (attach == 'auto' and sent > 1):
+        await bot.send_document(
+            chat_id=chat_id,
+            document=order_document(restaurant, poll, aggregate),
+            caption=f"📎 Заказ целиком: {restaurant['name']}, {poll['date']}"
+        )
+    if sent > 1:
+        logger.info(f"Заказ для {restaurant['name']} отправлен в {chat_id}: сообщений {sent}")
+    return sent
@@ -0,0 +1,189 @@
+"""
+Профилировщик SQL-запросов Database
+
+Каждый запрос, выполненный через соединение из Database.get_connection(),
+замеряется и учитывается по нормализованному тексту (литералы и списки
+параметров заменены на ?). Запросы дольше SLOW_QUERY_MS пишутся в лог
+с параметрами, а при SLOW_QUERY_EXPLAIN - и с планом выполнения.
+
+Топ запросов по суммарному времени - Database.get_query_stats() и
+команда администратора /db_stats.
+"""
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+import config
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql: str) -> str:
+    """Текст запроса без литералов и лишних пробелов - ключ статистики"""
+    text = _STRING_RE.sub('?', sql)
+    text = _NUMBER_RE.sub('?', text)
+    text = _IN_LIST_RE.sub('(?...)', text)
+    return _SPACE_RE.sub(' ', text).strip()
+
+
+def explain(backend, conn, sql: str, params=()) -> list:
+    """
+    План выполнения запроса или пустой список
+
+    Кроме чтений - UPDATE и DELETE: EXPLAIN без ANALYZE запрос не выполняет.
+    INSERT OR ... не разбираем - в PostgreSQL он переводится только без EXPLAIN.
+    """
+    if not sql.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+        return []
+    try:
+        return backend.explain(conn.cursor(), sql, params)
+    except Exception as e:
+        logger.warning(f"EXPLAIN не выполнен: {e}")
+        return []
+
+
+class QueryStats:
+    """Статистика одного нормализованного запроса"""
+
+    __slots__ = ('sql', 'count', 'total', 'max', 'slow', 'example')
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.slow = 0
+        # (sql, параметры) самого долгого выполнения - для EXPLAIN
+        self.example = None
+
+    def as_dict(self) -> dict:
+        return {
+            'sql': self.sql,
+            'count': self.count,
+            'total': self.total,
+            'avg': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'slow': self.slow,
+            'example': self.example,
+        }
+
+
+class QueryProfiler:
+    """
+    Счётчики запросов по нормализованному тексту
+
+    Запросы выполняются в потоках пула AsyncDatabase, поэтому
+    статистика защищена блокировкой.
+    """
+
+    def __init__(self, backend, slow_threshold: float = config.SLOW_QUERY_MS / 1000,
+                 explain_slow: bool = config.SLOW_QUERY_EXPLAIN):
+        self.backend = backend
+        self.slow_threshold = slow_threshold
+        self.explain_slow = explain_slow
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.started = time.time()
+
+    def record(self, sql: str, params, seconds: float, conn=None, batch: int = None):
+        """
+        Учесть выполнение запроса
+
+        batch - число наборов параметров executemany; тогда params - первый
+        из них (по нему строится план)
+        """
+        key = normalize(sql)
+        slow = seconds >= self.slow_threshold
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(key)
+            stats.count += 1
+            stats.total += seconds
+            if seconds > stats.max or stats.example is None:
+                stats.max = seconds
+                stats.example = (sql, params)
+            if slow:
+                stats.slow += 1
+        if slow:
+            sets = f" (первый из {batch} наборов)" if batch is not None else ""
+            logger.warning(f"Медленный запрос {seconds * 1000:.1f} мс: {key} параметры={params!r}{sets}")
+            if self.explain_slow and conn is not None:
+                plan = explain(self.backend, conn, sql, params)
+                if plan:
+                    logger.warning("План запроса:\n" + '\n'.join(plan))
+
+    def top(self, limit: int = 10, order_by: str = 'total') -> list:
+        """Самые дорогие запросы: order_by - 'total', 'count', 'avg' или 'max'"""
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._stats.values()]
+        rows.sort(key=lambda row: row[order_by], reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self.started = time.time()
+
+
+class ProfilingCursor:
+    """Курсор, замеряющий execute/executemany"""
+
+    def __init__(self, cursor, profiler: QueryProfiler, conn):
+        self._cursor = cursor
+        self._profiler = profiler
+        self._conn = conn
+
+    def execute(self, sql: str, params=()):
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(sql, params)
+        finally:
+            self._profiler.record(sql, params, time.perf_counter() - started, self._conn)
+        return self
+
+    def executemany(self, sql: str, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_params)
+        finally:
+            self._profiler.record(sql, seq_of_params[0] if seq_of_params else (),
+                                  time.perf_counter() - started, self._conn, len(seq_of_params))
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ProfilingConnection:
+    """Соединение из пула, курсоры которого замеряются"""
+
+    def __init__(self, conn, profiler: QueryProfiler):
+        self._conn = conn
+        self._profiler = profiler
+
+    def cursor(self):
+        return ProfilingCursor(self._conn.cursor(), self._profiler, self._conn)
+
+    def execute(self, sql: str, params=()):
+        return self.cursor().execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._conn.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Отправка записанных обновлений Telegram на webhook бота
+
+Файл - JSON-массив Update или по одному Update в строке (JSON Lines),
+например сохранённые из getUpdates. Каждое обновление отправляется POST-
+запросом, как это делает Telegram, с заголовком секретного токена.
+
+Запуск против бота в режиме webhook (BOT_MODE=webhook, WEBHOOK_URL не задан):
+    python replay_updates.py updates.jsonl --url http://localhost:8080/<WEBHOOK_PATH>
+
+Самопроверка сервера без бота и без Telegram: поднимает WebhookServer
+на свободном порту с собственной очередью и отправляет обновления в него:
+    python replay_updates.py updates.jsonl --self-test
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.error
+import urllib.request
+
+import config
+
+
+def load_updates(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def post_update(url: str, update: dict, secret_token: str = None) -> int:
+    request = urllib.request.Request(url, data=json.dumps(update).encode(), method='POST')
+    request.add_header('Content-Type', 'application/json')
+    if secret_token:
+        request.add_header('X-Telegram-Bot-Api-Secret-Token', secret_token)
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def replay(url: str, updates: list, secret_token: str = None, delay: float = 0.0) -> dict:
+    statuses = {}
+    for update in updates:
+        status = post_update(url, update, secret_token)
+        statuses[status] = statuses.get(status, 0) + 1
+        print(f"update_id={update.get('update_id')}: {status}")
+        if delay:
+            time.sleep(delay)
+    return statuses
+
+
+async def self_test(updates: list, secret_token: str, queue_size: int):
+    from telegram import Bot
+    from webhook import WebhookServer
+
+    queue = asyncio.Queue(maxsize=queue_size)
+    # Бот нужен только для Update.de_json - к Telegram он не обращается
+    bot = Bot(config.BOT_TOKEN or '0:self-test')
+    server = WebhookServer(queue, bot, listen='127.0.0.1', port=0, path='self-test', secret_token=secret_token)
+    await server.start()
+    try:
+        url = f"http://127.0.0.1:{server.port}{server.path}"
+        statuses = await asyncio.to_thread(replay, url, updates, secret_token)
+        if secret_token:
+            # Запрос без токена должен быть отклонён
+            rejected = await asyncio.to_thread(post_update, url, updates[0] if updates else {}, None)
+            print(f"без секретного токена: {rejected}")
+    finally:
+        await server.stop()
+
+    print()
+    print(f"Ответы: {statuses}")
+    print(f"В очереди: {queue.qsize()}, статистика сервера: {server.stats}")
+    while not queue.empty():
+        update = queue.get_nowait()
+        kind = 'callback_query' if update.callback_query else 'message' if update.message else 'другое'
+        print(f"  update_id={update.update_id} ({kind})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file', help='JSON-массив или JSON Lines с обновлениями')
+    parser.add_argument('--url', help='адрес webhook бота')
+    parser.add_argument('--secret-token', default=config.WEBHOOK_SECRET_TOKEN)
+    parser.add_argument('--delay', type=float, default=0.0, help='пауза между запросами, сек')
+    parser.add_argument('--self-test', action='store_true', help='проверить сервер без бота')
+    parser.add_argument('--queue-size', type=int, default=config.WEBHOOK_QUEUE_SIZE)
+    args = parser.parse_args()
+
+    updates = load_updates(args.file)
+    if args.self_test:
+        asyncio.run(self_test(updates, args.secret_token, args.queue_size))
+    elif args.url:
+        print(f"Ответы: {replay(args.url, updates, args.secret_token, args.delay)}")
+    else:
+        parser.error('укажите --url или --self-test')
+
+
+if __name__ == '__main__':
+    main()
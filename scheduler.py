@@ -1,22 +1,46 @@
 """
 Планировщик уведомлений
 """
+import asyncio
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
-from database import Database
+from broadcast import Broadcaster
+from callback_codec import encode
+from caches import local_today
+from services import db
 import config
 import logging
 
 logger = logging.getLogger(__name__)
 
-db = Database()
+# За сколько секунд до обеда напоминать о голосовании
+REMINDER_LEAD = 30 * 60
+
+# Как часто выполняющийся запуск задания отмечается в БД и через сколько
+# секунд без отметки он считается брошенным (процесс остановился)
+HEARTBEAT_INTERVAL = 15
+ABANDONED_AFTER = 4 * HEARTBEAT_INTERVAL
+
+
+def _as_utc(value) -> datetime:
+    """Время из job_runs (строка SQLite или datetime PostgreSQL) - aware UTC"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc)
 
 
 class LunchScheduler:
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.broadcaster = Broadcaster(bot)
         self.scheduler = AsyncIOScheduler(timezone=config.TIMEZONE)
+        # Уведомление о обеде, подготовленное за PREFINALIZE_SECONDS до отправки
+        self._prepared = None
+        # id задания -> (функция, час, минута, сколько секунд задание можно догонять)
+        self._jobs = {}
     
     def start(self):
         """Запустить планировщик"""
@@ -27,164 +51,304 @@ class LunchScheduler:
             logger.error(f"Неверный формат времени: {config.LUNCH_TIME}")
             hour, minute = 12, 0
         
-        # Добавляем задачу на отправку уведомлений
-        self.scheduler.add_job(
-            self.send_lunch_notification,
-            trigger=CronTrigger(hour=hour, minute=minute, timezone=config.TIMEZONE),
-            id='lunch_notification',
-            replace_existing=True
-        )
-        
-        # Добавляем задачу на подведение итогов (за 30 минут до обеда)
+        # Напоминание о голосовании - за 30 минут до обеда
         reminder_minute = (minute - 30) % 60
         reminder_hour = hour if minute >= 30 else hour - 1
         
-        self.scheduler.add_job(
-            self.send_voting_reminder,
-            trigger=CronTrigger(hour=reminder_hour, minute=reminder_minute, timezone=config.TIMEZONE),
-            id='voting_reminder',
-            replace_existing=True
+        # (id, функция, час, минута, сколько секунд задание можно догонять)
+        # Напоминание после начала обеда уже не нужно
+        jobs = (
+            ('lunch_notification', self.send_lunch_notification, hour, minute, config.SCHEDULER_MISFIRE_GRACE),
+            ('voting_reminder', self.send_voting_reminder, reminder_hour, reminder_minute,
+             min(config.SCHEDULER_MISFIRE_GRACE, REMINDER_LEAD)),
         )
         
+        now = datetime.now(self.scheduler.timezone)
+        for job_id, func, job_hour, job_minute, grace in jobs:
+            self._jobs[job_id] = (func, job_hour, job_minute, grace)
+            self.scheduler.add_job(
+                self._run_once,
+                trigger=CronTrigger(hour=job_hour, minute=job_minute, timezone=config.TIMEZONE),
+                args=(job_id,),
+                id=job_id,
+                replace_existing=True,
+                misfire_grace_time=grace,
+                coalesce=True
+            )
+            
+            # Бот был остановлен в назначенное время - запускаем пропущенное
+            # задание сразу; _run_once не даст выполнить его дважды
+            scheduled = now.replace(hour=job_hour, minute=job_minute, second=0, microsecond=0)
+            if 0 <= (now - scheduled).total_seconds() <= grace:
+                logger.info(f"Задание {job_id} ({job_hour:02d}:{job_minute:02d}) могло быть пропущено - проверяем")
+                self.scheduler.add_job(
+                    self._run_once,
+                    trigger=DateTrigger(run_date=now, timezone=config.TIMEZONE),
+                    args=(job_id,),
+                    id=f'{job_id}_catch_up',
+                    replace_existing=True,
+                    misfire_grace_time=grace
+                )
+        
+        if config.PREFINALIZE_SECONDS > 0:
+            prefinalize = datetime(2000, 1, 1, hour, minute) - timedelta(seconds=config.PREFINALIZE_SECONDS)
+            self.scheduler.add_job(
+                self.prefinalize_lunch,
+                trigger=CronTrigger(hour=prefinalize.hour, minute=prefinalize.minute, second=prefinalize.second,
+                                    timezone=config.TIMEZONE),
+                id='lunch_prefinalize',
+                replace_existing=True,
+                misfire_grace_time=config.PREFINALIZE_SECONDS
+            )
+        
         self.scheduler.start()
         logger.info(f"Планировщик запущен. Уведомления в {hour:02d}:{minute:02d}")
     
-    async def send_lunch_notification(self):
-        """Отправить уведомление о времени обеда"""
-        try:
-            # Получаем активное голосование
-            poll = db.get_active_poll()
-            
-            if not poll:
-                # Если голосования нет, отправляем всем напоминание
-                users = db.get_all_users()
-                
-                message = (
-                    "🔔 <b>Время обеда!</b>\n\n"
-                    "Сегодня еще не начато голосование за ресторан.\n"
-                    "Используйте /lunch чтобы начать голосование."
-                )
-                
-                for user in users:
-                    try:
-                        await self.bot.send_message(
-                            chat_id=user['user_id'],
-                            text=message,
-                            parse_mode='HTML'
-                        )
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить уведомление пользователю {user['user_id']}: {e}")
-                
-                return
-            
-            # Получаем результаты голосования
-            poll_id = poll['id']
-            votes = db.get_poll_votes(poll_id)
-            participants = db.get_participants(poll_id)
-            
-            if not votes or all(v[2] == 0 for v in votes):
-                message = (
-                    "🔔 <b>Время обеда!</b>\n\n"
-                    "К сожалению, никто не проголосовал за ресторан 😢\n"
-                    "Используйте /lunch чтобы проголосовать."
-                )
-            else:
-                # Определяем победителя
-                winner = votes[0]
-                winner_id, winner_name, winner_votes = winner
-                
-                # Закрываем голосование
-                db.close_poll(poll_id, winner_id)
-                
-                message = (
-                    "🔔 <b>Время обеда!</b>\n\n"
-                    f"🏆 Победитель голосования: <b>{winner_name}</b>\n"
-                    f"📊 Голосов: {winner_votes}\n"
-                    f"👥 Участников: {len(participants)}\n\n"
-                )
-                
-                if participants:
-                    message += "<b>Идут на обед:</b>\n"
-                    for participant in participants[:10]:  # Показываем первых 10
-                        name = participant['first_name']
-                        message += f"• {name}\n"
-                    
-                    if len(participants) > 10:
-                        message += f"... и еще {len(participants) - 10} человек\n"
-                
-                message += "\nПриятного аппетита! 🍽️"
-            
-            # Отправляем уведомление всем участникам
-            if participants:
-                keyboard = [[
-                    InlineKeyboardButton("📋 Меню ресторана", callback_data=f"menu_{winner_id}")
-                ]] if votes and votes[0][2] > 0 else []
-                reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
-                
-                for participant in participants:
-                    try:
-                        await self.bot.send_message(
-                            chat_id=participant['user_id'],
-                            text=message,
-                            parse_mode='HTML',
-                            reply_markup=reply_markup
-                        )
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить уведомление пользователю {participant['user_id']}: {e}")
+    async def _run_once(self, job_id: str):
+        """
+        Выполнить задание один раз в день
+        
+        Запуск отмечается в БД (job_runs) до выполнения и, пока идёт,
+        раз в HEARTBEAT_INTERVAL сек: после перезапуска или при нескольких
+        экземплярах бота успешная рассылка не повторяется. Запуск, упавший
+        с ошибкой или дошедший не до всех, повторяется через
+        SCHEDULER_RETRY_DELAY сек, а оставшийся без отметок в 'running'
+        (процесс остановился посреди рассылки) - когда будет считаться
+        брошенным; и то и другое - пока не вышло время догонять задание.
+        Доставка пишется по получателям (job_deliveries), поэтому повтор
+        отправляет только тем, кому сообщение не ушло: каждый получатель
+        получает рассылку не больше одного раза.
+        """
+        func = self._jobs[job_id][0]
+        run_date = local_today()
+        if not await db.claim_job_run(job_id, run_date, ABANDONED_AFTER):
+            run = await db.get_job_run(job_id, run_date)
+            if run and run['status'] == 'running':
+                last_seen = _as_utc(run['heartbeat_at'] or run['started_at'])
+                self._retry_later(job_id, last_seen + timedelta(seconds=ABANDONED_AFTER + 1),
+                                  f"выполняется (последняя отметка в {last_seen:%H:%M:%S} UTC)")
             else:
-                # Если нет участников, отправляем всем пользователям
-                users = db.get_all_users()
-                for user in users:
-                    try:
-                        await self.bot.send_message(
-                            chat_id=user['user_id'],
-                            text=message,
-                            parse_mode='HTML'
-                        )
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить уведомление пользователю {user['user_id']}: {e}")
+                logger.info(f"Задание {job_id} за {run_date} уже выполнено - пропускаем")
+            return
         
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, run_date))
+        try:
+            report = await func(job_id, run_date)
+            undelivered = report.count('failed') if report else 0
+            error = f"не доставлено {undelivered} из {len(report.deliveries)}" if undelivered else None
         except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления о обеде: {e}")
+            error = str(e)
+        finally:
+            heartbeat.cancel()
+        
+        if error is None:
+            await db.finish_job_run(job_id, run_date)
+            return
+        logger.error(f"Задание {job_id} за {run_date} завершилось ошибкой: {error}")
+        # Повтор планируем до записи в БД: если не запишется и она, запуск
+        # останется в 'running' и повтор дождётся, пока он станет брошенным
+        self._retry_later(job_id, datetime.now(timezone.utc) + timedelta(seconds=config.SCHEDULER_RETRY_DELAY),
+                          "ошибка")
+        await db.finish_job_run(job_id, run_date, 'failed', error)
     
-    async def send_voting_reminder(self):
-        """Отправить напоминание о голосовании"""
-        try:
-            poll = db.get_active_poll()
-            
-            if not poll:
-                return  # Если голосования нет, не напоминаем
-            
-            poll_id = poll['id']
-            votes = db.get_poll_votes(poll_id)
-            users = db.get_all_users()
-            
-            # Получаем список тех, кто еще не проголосовал
-            voted_users = set()
-            for _, _, _ in votes:
-                # Получаем пользователей, которые проголосовали
-                pass  # Здесь можно добавить логику
+    async def _heartbeat(self, job_id: str, run_date: str):
+        """Отмечать в БД, что запуск задания ещё выполняется"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await db.touch_job_run(job_id, run_date)
+            except Exception as e:
+                logger.warning(f"Не удалось отметить запуск задания {job_id}: {e}")
+    
+    def _retry_later(self, job_id: str, run_at: datetime, reason: str):
+        """Запустить задание снова в run_at, если это ещё в пределах времени догонять его"""
+        func, hour, minute, grace = self._jobs[job_id]
+        now = datetime.now(self.scheduler.timezone)
+        deadline = now.replace(hour=hour, minute=minute, second=0, microsecond=0) + timedelta(seconds=grace)
+        if run_at > deadline:
+            logger.error(f"Задание {job_id}: {reason}; повторять поздно - срок вышел в {deadline:%H:%M:%S}")
+            return
+        logger.info(f"Задание {job_id}: {reason} - повторим в "
+                    f"{run_at.astimezone(self.scheduler.timezone):%H:%M:%S}")
+        self.scheduler.add_job(
+            self._run_once,
+            trigger=DateTrigger(run_date=run_at),
+            args=(job_id,),
+            id=f'{job_id}_retry',
+            replace_existing=True,
+            misfire_grace_time=grace
+        )
+    
+    async def _broadcast_once(self, job_id: str, run_date: str, recipients, message: str, **send_kwargs):
+        """
+        Рассылка задания за день, которую можно повторять
+        
+        Получатели, которым сообщение уже отправлено, могло дойти ('sending',
+        'uncertain') или не может быть доставлено ('blocked', 'rejected'),
+        пропускаются; отправляется тем, у кого нет записи или 'failed'.
+        """
+        statuses = await db.get_job_deliveries(job_id, run_date)
+        pending = [chat_id for chat_id in recipients if statuses.get(chat_id, 'failed') == 'failed']
+        if len(pending) < len(recipients):
+            logger.info(f"Рассылка '{job_id}': {len(recipients) - len(pending)} получателей "
+                        f"уже обработаны прошлым запуском - пропускаем")
+        
+        async def record(chat_id, status):
+            await db.set_job_delivery(job_id, run_date, chat_id, status)
+        
+        return await self.broadcaster.broadcast(pending, message, name=job_id, on_status=record, **send_kwargs)
+    
+    async def prepare_lunch_notification(self) -> dict:
+        """
+        Подготовить уведомление о обеде: победитель, получатели, текст
+        
+        Ничего не меняет в БД - можно вызывать заранее (prefinalize) и
+        повторно. Результат зависит от голосов и списка участников, поэтому
+        в снимок попадают версия голосования и участники для проверки.
+        """
+        prepared = {
+            'date': local_today(), 'poll_id': None, 'version': None, 'participants': (),
+            'winner_id': None, 'message': None, 'reply_markup': None, 'recipients': [],
+        }
+        
+        # Получаем активное голосование
+        poll = await db.get_active_poll()
+        
+        if not poll:
+            # Если голосования нет, отправляем всем напоминание
+            users = await db.get_all_users()
+            prepared['message'] = (
+                "🔔 <b>Время обеда!</b>\n\n"
+                "Сегодня еще не начато голосование за ресторан.\n"
+                "Используйте /lunch чтобы начать голосование."
+            )
+            prepared['recipients'] = [user['user_id'] for user in users]
+            return prepared
+        
+        # Получаем результаты голосования
+        poll_id = poll['id']
+        prepared['poll_id'] = poll_id
+        prepared['version'] = await db.get_poll_version(poll_id)
+        votes = await db.get_poll_votes(poll_id)
+        participants = await db.get_participants(poll_id)
+        prepared['participants'] = tuple(participant['user_id'] for participant in participants)
+        
+        if not votes or all(v[2] == 0 for v in votes):
+            message = (
+                "🔔 <b>Время обеда!</b>\n\n"
+                "К сожалению, никто не проголосовал за ресторан 😢\n"
+                "Используйте /lunch чтобы проголосовать."
+            )
+        else:
+            # Определяем победителя
+            winner_id, winner_name, winner_votes = votes[0]
+            prepared['winner_id'] = winner_id
             
             message = (
-                "⏰ <b>Напоминание!</b>\n\n"
-                "Через 30 минут обед! 🍽️\n"
-                "Не забудьте проголосовать за ресторан: /lunch\n"
-                "И записаться на обед: /join"
+                "🔔 <b>Время обеда!</b>\n\n"
+                f"🏆 Победитель голосования: <b>{winner_name}</b>\n"
+                f"📊 Голосов: {winner_votes}\n"
+                f"👥 Участников: {len(participants)}\n\n"
             )
             
-            # Отправляем напоминание всем пользователям
-            for user in users:
-                try:
-                    await self.bot.send_message(
-                        chat_id=user['user_id'],
-                        text=message,
-                        parse_mode='HTML'
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось отправить напоминание пользователю {user['user_id']}: {e}")
+            if participants:
+                message += "<b>Идут на обед:</b>\n"
+                for participant in participants[:10]:  # Показываем первых 10
+                    name = participant['first_name']
+                    message += f"• {name}\n"
+                
+                if len(participants) > 10:
+                    message += f"... и еще {len(participants) - 10} человек\n"
+            
+            message += "\nПриятного аппетита! 🍽️"
+        prepared['message'] = message
         
+        if participants:
+            # Уведомление получают участники обеда
+            if prepared['winner_id'] is not None:
+                prepared['reply_markup'] = InlineKeyboardMarkup([[
+                    InlineKeyboardButton("📋 Меню ресторана", callback_data=encode('menu', prepared['winner_id']))
+                ]])
+            prepared['recipients'] = list(prepared['participants'])
+        else:
+            # Если нет участников, отправляем всем пользователям
+            users = await db.get_all_users()
+            prepared['recipients'] = [user['user_id'] for user in users]
+        return prepared
+    
+    async def prefinalize_lunch(self):
+        """Заранее подготовить уведомление, чтобы в LUNCH_TIME только отправить его"""
+        try:
+            self._prepared = await self.prepare_lunch_notification()
+            logger.info(
+                f"Уведомление о обеде подготовлено заранее: голосование {self._prepared['poll_id']}, "
+                f"получателей {len(self._prepared['recipients'])}"
+            )
         except Exception as e:
-            logger.error(f"Ошибка при отправке напоминания: {e}")
+            self._prepared = None
+            logger.error(f"Не удалось подготовить уведомление о обеде: {e}")
+    
+    async def _take_prepared(self) -> dict:
+        """Подготовленное уведомление, если с тех пор ничего не изменилось"""
+        prepared, self._prepared = self._prepared, None
+        if not prepared or prepared['date'] != local_today():
+            return None
+        poll = await db.get_active_poll()
+        poll_id = poll['id'] if poll else None
+        if poll_id != prepared['poll_id']:
+            return None
+        if poll_id is None:
+            return prepared
+        # Версия голосов хранится в памяти, участники - один короткий запрос
+        if await db.get_poll_version(poll_id) != prepared['version']:
+            return None
+        participants = await db.get_participants(poll_id)
+        if tuple(participant['user_id'] for participant in participants) != prepared['participants']:
+            return None
+        return prepared
+    
+    async def send_lunch_notification(self, job_id: str, run_date: str):
+        """Отправить уведомление о времени обеда; ошибки обрабатывает _run_once"""
+        prepared = await self._take_prepared()
+        if prepared is None:
+            # Не подготовлено заранее или голоса/участники изменились
+            prepared = await self.prepare_lunch_notification()
+        
+        report = await self._broadcast_once(
+            job_id, run_date, prepared['recipients'], prepared['message'],
+            parse_mode='HTML', reply_markup=prepared['reply_markup']
+        )
+        logger.info(report.summary())
+        
+        if prepared['winner_id'] is not None and not report.count('failed'):
+            # Закрываем голосование, только когда рассылка дошла до всех:
+            # повтор найдёт его активным и объявит того же победителя
+            await db.close_poll(prepared['poll_id'], prepared['winner_id'])
+        return report
+    
+    async def send_voting_reminder(self, job_id: str, run_date: str):
+        """Отправить напоминание о голосовании; ошибки обрабатывает _run_once"""
+        poll = await db.get_active_poll()
+        
+        if not poll:
+            return None  # Если голосования нет, не напоминаем
+        
+        # Напоминаем только тем, кто ещё не проголосовал
+        recipients = await db.get_users_without_vote(poll['id'])
+        if not recipients:
+            logger.info("Напоминание не нужно: все уже проголосовали")
+            return None
+        
+        message = (
+            "⏰ <b>Напоминание!</b>\n\n"
+            "Через 30 минут обед! 🍽️\n"
+            "Не забудьте проголосовать за ресторан: /lunch\n"
+            "И записаться на обед: /join"
+        )
+        
+        report = await self._broadcast_once(job_id, run_date, recipients, message, parse_mode='HTML')
+        logger.info(report.summary())
+        return report
     
     def stop(self):
         """Остановить планировщик"""
@@ -93,9 +93,10 @@ def seed_ani_menu(db, restaurant_id):
     logger.info(f"   📋 Добавлено {added} блюд в меню")
 
 
-def seed_restaurants():
+def seed_restaurants(db: Database = None):
     """Добавить базовые рестораны если БД пустая"""
-    db = Database()
+    if db is None:
+        db = Database()
     
     # Проверяем есть ли уже рестораны
     existing = db.get_all_restaurants(active_only=False)
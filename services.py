@@ -0,0 +1,77 @@
+"""
+Общие сервисы процесса
+
+Один экземпляр базы данных на весь процесс. Модули-обработчики делают
+`from services import db` - это ленивая ссылка: сама БД создаётся в
+main.main() (или при первом обращении) и закрывается вместе с Application.
+"""
+import logging
+import threading
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_database = None
+_lock = threading.Lock()
+
+
+def get_database():
+    """Общий экземпляр AsyncDatabase (создаётся при первом обращении)"""
+    global _database
+    if _database is None:
+        with _lock:
+            if _database is None:
+                from async_db import AsyncDatabase
+                from database import Database
+                _database = AsyncDatabase(Database())
+    return _database
+
+
+def set_database(database):
+    """Подменить экземпляр БД (другой бэкенд, нагрузочные тесты)"""
+    global _database
+    with _lock:
+        _database = database
+
+
+def close_database():
+    """Закрыть общий экземпляр БД, если он был создан"""
+    global _database
+    with _lock:
+        database, _database = _database, None
+    if database is not None:
+        database.close()
+        logger.info("База данных закрыта")
+
+
+# ========== Жизненный цикл Application ==========
+
+async def post_init(application):
+    """Вызывается Application после initialize(): делаем БД доступной обработчикам"""
+    database = get_database()
+    application.bot_data['db'] = database
+    # Рестораны и голоса текущего голосования - в кэш до первых апдейтов
+    await database.warm_up()
+    # Изменения корзин, не записанные до остановки, - в БД
+    from cart import carts
+    await carts.start()
+    await metrics.start_server(application)
+
+
+async def post_shutdown(application):
+    """Вызывается Application после shutdown()"""
+    await metrics.stop_server(application)
+    from cart import carts
+    await carts.close()
+    application.bot_data.pop('db', None)
+    close_database()
+
+
+class _DatabaseRef:
+    """Ленивая ссылка на общую БД: атрибуты берутся у текущего экземпляра"""
+
+    def __getattr__(self, name):
+        return getattr(get_database(), name)
+
+
+db = _DatabaseRef()
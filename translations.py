@@ -2,6 +2,11 @@
 Система локализации (i18n) для бота
 Поддерживаемые языки: армянский (hy), русский (ru), английский (en)
 """
+import glob
+import os
+import re
+import string
+import sys
 
 TRANSLATIONS = {
     # ========== Общие ==========
@@ -356,11 +361,6 @@ TRANSLATIONS = {
         "en": "📸 [Photo unavailable]",
         "hy": "📸 [Լուսանկարը հասանելի չէ]"
     },
-    "next_dish": {
-        "ru": "⏭️ Следующее блюдо",
-        "en": "⏭️ Next dish",
-        "hy": "⏭️ Հաջորդ ուտեստը"
-    },
     
     # ========== Категории меню ==========
     "category_cold_appetizers": {
@@ -411,6 +411,59 @@ TRANSLATIONS = {
 }
 
 
+# ========== Скомпилированный каталог ==========
+# TRANSLATIONS удобно править, но на каждый get_text это два поиска по словарям
+# и запасной вариант. При импорте он разворачивается в плоские таблицы по
+# языкам (запасной русский уже подставлен), а шаблоны заранее разбираются:
+# строки без полей {...} вообще не форматируются
+
+LANGUAGES = ('hy', 'ru', 'en')
+DEFAULT_LANGUAGE = 'ru'
+
+# Категории меню (как они записаны в БД) -> ключ перевода
+CATEGORY_KEYS = {
+    "Холодные закуски": "category_cold_appetizers",
+    "Горячие закуски": "category_hot_appetizers",
+    "Салаты": "category_salads",
+    "Супы": "category_soups",
+    "Шашлыки": "category_kebabs",
+    "Горячие блюда": "category_hot_dishes",
+    "Гарниры": "category_side_dishes",
+    "Десерты": "category_desserts",
+    "Напитки": "category_drinks",
+}
+
+
+def _template_fields(text: str):
+    """Имена полей шаблона или None, если форматировать нечего"""
+    if '{' not in text and '}' not in text:
+        return None
+    return frozenset(field for _, field, _, _ in string.Formatter().parse(text) if field is not None)
+
+
+def _compile():
+    texts = {}
+    fields = {}
+    for lang in LANGUAGES:
+        table = texts[lang] = {}
+        lang_fields = fields[lang] = {}
+        for key, variants in TRANSLATIONS.items():
+            key = sys.intern(key)
+            text = variants.get(lang, variants.get(DEFAULT_LANGUAGE, key))
+            table[key] = text
+            template = _template_fields(text)
+            if template is not None:
+                lang_fields[key] = template
+    category_names = {
+        lang: {category: texts[lang][key] for category, key in CATEGORY_KEYS.items()}
+        for lang in LANGUAGES
+    }
+    return texts, fields, category_names
+
+
+_TEXTS, _FIELDS, _CATEGORY_NAMES = _compile()
+
+
 def get_text(key: str, lang: str = 'ru', **kwargs) -> str:
     """
     Получить переведенный текст
@@ -423,17 +476,16 @@ def get_text(key: str, lang: str = 'ru', **kwargs) -> str:
     Returns:
         Переведенный текст
     """
-    if key not in TRANSLATIONS:
+    table = _TEXTS.get(lang) or _TEXTS[DEFAULT_LANGUAGE]
+    translation = table.get(key)
+    if translation is None:
         return f"[Missing: {key}]"
     
-    translation = TRANSLATIONS[key].get(lang, TRANSLATIONS[key].get('ru', key))
-    
-    # Форматируем если есть параметры
+    # Форматируем только шаблоны и только если переданы все их поля
     if kwargs:
-        try:
-            translation = translation.format(**kwargs)
-        except KeyError:
-            pass
+        fields = (_FIELDS.get(lang) or _FIELDS[DEFAULT_LANGUAGE]).get(key)
+        if fields is not None and fields <= kwargs.keys():
+            translation = translation.format_map(kwargs)
     
     return translation
 
@@ -442,20 +494,42 @@ def get_category_name(category: str, lang: str = 'ru') -> str:
     """
     Получить переведенное название категории
     """
-    category_map = {
-        "Холодные закуски": "category_cold_appetizers",
-        "Горячие закуски": "category_hot_appetizers",
-        "Салаты": "category_salads",
-        "Супы": "category_soups",
-        "Шашлыки": "category_kebabs",
-        "Горячие блюда": "category_hot_dishes",
-        "Гарниры": "category_side_dishes",
-        "Десерты": "category_desserts",
-        "Напитки": "category_drinks",
-    }
-    
-    key = category_map.get(category)
-    if key:
-        return get_text(key, lang)
-    return category
+    names = _CATEGORY_NAMES.get(lang) or _CATEGORY_NAMES[DEFAULT_LANGUAGE]
+    return names.get(category, category)
 
+
+def check_catalogue(source_dir: str = None) -> list:
+    """
+    Проверить каталог переводов, вернуть список проблем (пустой - всё в порядке)
+    
+    Ищет ключи без перевода на какой-то из LANGUAGES, лишние языки, шаблоны
+    с разными полями в разных языках и (если указан source_dir) ключи,
+    которые используются в get_text(...) в *.py, но отсутствуют в каталоге.
+    """
+    problems = []
+    for key, variants in TRANSLATIONS.items():
+        missing = [lang for lang in LANGUAGES if lang not in variants]
+        if missing:
+            problems.append(f"{key}: нет перевода на {', '.join(missing)}")
+        extra = [lang for lang in variants if lang not in LANGUAGES]
+        if extra:
+            problems.append(f"{key}: неизвестные языки {', '.join(extra)}")
+        reference = _template_fields(variants.get(DEFAULT_LANGUAGE, '')) or frozenset()
+        for lang, text in variants.items():
+            lang_fields = _template_fields(text) or frozenset()
+            if lang_fields != reference:
+                problems.append(
+                    f"{key}: поля шаблона [{lang}] {sorted(lang_fields)} "
+                    f"не совпадают с [{DEFAULT_LANGUAGE}] {sorted(reference)}"
+                )
+    for key in CATEGORY_KEYS.values():
+        if key not in TRANSLATIONS:
+            problems.append(f"{key}: нет ключа для категории меню")
+    
+    if source_dir:
+        used_re = re.compile(r"get_text\(\s*['\"](\w+)['\"]")
+        for path in sorted(glob.glob(os.path.join(source_dir, '*.py'))):
+            with open(path, encoding='utf-8') as f:
+                for key in sorted(set(used_re.findall(f.read())) - TRANSLATIONS.keys()):
+                    problems.append(f"{key}: используется в {os.path.basename(path)}, но нет в каталоге")
+    return problems
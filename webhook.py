@@ -0,0 +1,268 @@
+"""
+Режим webhook: встроенный асинхронный HTTP-сервер
+
+Telegram присылает каждое обновление POST-запросом на секретный путь.
+Сервер проверяет путь и заголовок X-Telegram-Bot-Api-Secret-Token, кладёт
+обновление в ограниченную очередь Application и сразу отвечает 200.
+Если очередь переполнена, отвечает 503 - Telegram повторит доставку позже.
+
+Сервер не зависит от Telegram: его можно проверить локально, отправляя
+записанные Update в JSON (см. replay_updates.py).
+"""
+import asyncio
+import json
+import logging
+import signal
+from http import HTTPStatus
+from telegram import Update
+import config
+
+logger = logging.getLogger(__name__)
+
+# Обновление Telegram не бывает больше нескольких десятков КБ
+MAX_BODY_SIZE = 1024 * 1024
+# Сколько ждать следующего запроса на открытом соединении (keep-alive)
+IDLE_TIMEOUT = 60
+# Сколько при остановке ждать запросов, которые уже обрабатываются
+STOP_TIMEOUT = 5
+SECRET_HEADER = 'x-telegram-bot-api-secret-token'
+
+
+class HttpServer:
+    """
+    Минимальный HTTP/1.1 сервер на asyncio.start_server
+
+    Пути добавляются через add_route. Используется webhook-сервером и
+    отдельно - для /metrics на METRICS_PORT.
+    """
+
+    def __init__(self, listen: str, port: int):
+        self.listen = listen
+        self.port = port
+        self._server = None
+        self._routes = {}
+        # Задачи открытых соединений; _idle - те, что ждут следующего запроса
+        self._connections = set()
+        self._idle = set()
+        self._closing = False
+
+    def add_route(self, method: str, path: str, handler):
+        """handler(body: bytes, headers: dict) -> (HTTPStatus, bytes, content_type)"""
+        self._routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        self._closing = False
+        self._server = await asyncio.start_server(self._serve_connection, self.listen, self.port)
+        sockets = self._server.sockets or ()
+        if sockets:
+            # Порт 0 - выбран системой (удобно для проверок)
+            self.port = sockets[0].getsockname()[1]
+        logger.info(f"HTTP-сервер слушает {self.listen}:{self.port}")
+
+    async def stop(self):
+        if self._server:
+            self._closing = True
+            self._server.close()
+            # Простаивающие keep-alive соединения закрываем сразу: иначе
+            # wait_closed() (Python 3.12+) ждал бы их до IDLE_TIMEOUT
+            for task in list(self._idle):
+                task.cancel()
+            if self._connections:
+                _, pending = await asyncio.wait(list(self._connections), timeout=STOP_TIMEOUT)
+                for task in pending:
+                    task.cancel()
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("HTTP-сервер остановлен")
+
+    # ========== HTTP ==========
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while not self._closing:
+                self._idle.add(task)
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                finally:
+                    self._idle.discard(task)
+                if not request_line:
+                    break
+                keep_alive = await self._serve_request(request_line, reader, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Соединение закрыто остановкой сервера
+            pass
+        except Exception:
+            logger.exception("Ошибка в HTTP-сервере")
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _serve_request(self, request_line: bytes, reader, writer) -> bool:
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            await self._respond(writer, HTTPStatus.BAD_REQUEST, keep_alive=False)
+            return False
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = (headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                      and not self._closing)
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            await self._respond(writer, HTTPStatus.BAD_REQUEST, keep_alive=False)
+            return False
+        if length > MAX_BODY_SIZE:
+            await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, keep_alive=False)
+            return False
+        body = await reader.readexactly(length) if length else b''
+
+        path = target.split('?', 1)[0]
+        handler = self._routes.get((method.upper(), path))
+        if handler is None:
+            status = HTTPStatus.METHOD_NOT_ALLOWED if any(p == path for _, p in self._routes) else HTTPStatus.NOT_FOUND
+            await self._respond(writer, status, keep_alive=keep_alive)
+            return keep_alive
+
+        status, payload, content_type = await handler(body, headers)
+        await self._respond(writer, status, payload, content_type, keep_alive)
+        return keep_alive
+
+    @staticmethod
+    async def _respond(writer, status: HTTPStatus, payload: bytes = b'', content_type: str = 'text/plain',
+                       keep_alive: bool = True):
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+
+class WebhookServer(HttpServer):
+    """
+    HTTP-сервер для webhook Telegram
+
+    Обновления декодируются в telegram.Update и кладутся в update_queue
+    (Application.update_queue). Дополнительные пути (GET /healthz и т.п.)
+    добавляются через add_route.
+    """
+
+    def __init__(self, update_queue: asyncio.Queue, bot, listen: str = config.WEBHOOK_LISTEN,
+                 port: int = config.WEBHOOK_PORT, path: str = config.WEBHOOK_PATH,
+                 secret_token: str = config.WEBHOOK_SECRET_TOKEN):
+        super().__init__(listen, port)
+        self.update_queue = update_queue
+        self.bot = bot
+        self.path = '/' + path.strip('/')
+        self.secret_token = secret_token
+        self.add_route('POST', self.path, self._handle_update)
+        self.add_route('GET', '/healthz', self._handle_health)
+        self.stats = {'accepted': 0, 'rejected': 0, 'queue_full': 0, 'bad_requests': 0}
+
+    # ========== Обработчики путей ==========
+
+    async def _handle_update(self, body: bytes, headers: dict):
+        if self.secret_token and headers.get(SECRET_HEADER) != self.secret_token:
+            self.stats['rejected'] += 1
+            logger.warning("Webhook: запрос с неверным секретным токеном отклонён")
+            return HTTPStatus.FORBIDDEN, b'', 'text/plain'
+
+        try:
+            update = Update.de_json(json.loads(body), self.bot)
+        except Exception as e:
+            self.stats['bad_requests'] += 1
+            logger.warning(f"Webhook: не удалось разобрать обновление: {e}")
+            return HTTPStatus.BAD_REQUEST, b'', 'text/plain'
+
+        try:
+            self.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.stats['queue_full'] += 1
+            logger.warning("Webhook: очередь обновлений переполнена, Telegram повторит доставку")
+            return HTTPStatus.SERVICE_UNAVAILABLE, b'', 'text/plain'
+
+        self.stats['accepted'] += 1
+        return HTTPStatus.OK, b'', 'text/plain'
+
+    async def _handle_health(self, body: bytes, headers: dict):
+        payload = json.dumps({'status': 'ok', 'queue': self.update_queue.qsize(), **self.stats})
+        return HTTPStatus.OK, payload.encode(), 'application/json'
+
+
+# ========== Запуск бота в режиме webhook ==========
+
+async def _serve(application, stop: asyncio.Event):
+    server = WebhookServer(application.update_queue, application.bot)
+    application.bot_data['webhook_server'] = server
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    try:
+        # Сервер поднимаем до регистрации webhook: накопившиеся обновления
+        # Telegram начнёт присылать сразу после set_webhook
+        await server.start()
+        if config.WEBHOOK_URL:
+            url = config.WEBHOOK_URL.rstrip('/') + server.path
+            await application.bot.set_webhook(
+                url=url,
+                secret_token=config.WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=config.DROP_PENDING_UPDATES,
+            )
+            logger.info(
+                f"Webhook зарегистрирован в Telegram "
+                f"({'старые обновления пропущены' if config.DROP_PENDING_UPDATES else 'старые обновления будут обработаны'})"
+            )
+        else:
+            logger.warning("WEBHOOK_URL не задан: webhook в Telegram не регистрируется, обновления только локальные")
+        await application.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        # stop() обработает то, что уже лежит в очереди
+        if application.running:
+            await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def run_webhook(application):
+    """Запустить бота в режиме webhook (блокирует до SIGINT/SIGTERM), аналог run_polling"""
+    loop = asyncio.get_event_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Windows: остаётся KeyboardInterrupt
+            pass
+    try:
+        loop.run_until_complete(_serve(application, stop))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.close()